@@ -1,7 +1,7 @@
 import base64
 import logging
 from datetime import date
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 from bson import ObjectId
 from bson import errors as bson_errors
@@ -11,7 +11,8 @@ from geopy.distance import geodesic
 from app.core.config import ML_CONFIDENT_THRESHOLD, ML_UNCERTAIN_THRESHOLD
 from app.db.mongo import db
 from app.services.attendance_daily import save_daily_summary
-from app.services.ml_client import ml_client
+from app.services.face_gallery import MAX_GALLERY_STUDENTS, recognize_subject
+from app.services.face_index import recognize_roster
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/attendance", tags=["Attendance"])
@@ -68,6 +69,47 @@ def _parse_object_id_list(
     return parsed_ids, unique_ids
 
 
+def _classify_faces(
+    detected_faces: List[Dict],
+) -> List[Tuple[Optional[str], float, str]]:
+    """
+    ``(student_id, distance, status)`` of each recognized face.
+
+    The ML service assigns each student to at most one face, so a face it
+    marked "present" keeps its student. A face it left unassigned is
+    "uncertain" when its closest runner-up is within the uncertain threshold
+    and not already claimed by another face, and "unknown" otherwise.
+    """
+    claimed = {
+        face["student_id"]
+        for face in detected_faces
+        if face.get("student_id") and face.get("status") == "present"
+    }
+    matches = []
+    for face in detected_faces:
+        if face.get("student_id") and face.get("status") == "present":
+            matches.append((face["student_id"], face["distance"], "present"))
+            continue
+
+        runner_up = next(
+            (
+                other
+                for other in face.get("runner_ups", [])
+                if other["student_id"] not in claimed
+                and other["min_distance"] < ML_UNCERTAIN_THRESHOLD
+            ),
+            None,
+        )
+        if runner_up is None:
+            matches.append((None, face["distance"], "unknown"))
+        else:
+            claimed.add(runner_up["student_id"])
+            matches.append(
+                (runner_up["student_id"], runner_up["min_distance"], "uncertain")
+            )
+    return matches
+
+
 @router.post("/mark")
 async def mark_attendance(payload: Dict):
     """
@@ -141,15 +183,28 @@ async def mark_attendance(payload: Dict):
         _, image_b64 = image_b64.split(",", 1)
 
     try:
-        _ = base64.b64decode(image_b64)
+        image_bytes = base64.b64decode(image_b64)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid base64 image")
 
-    # Call ML service to detect faces
+    # Detect and match in one ML roundtrip against the subject's gallery;
+    # rosters too large for a gallery are searched in the student index
     try:
-        ml_response = await ml_client.detect_faces(
-            image_base64=image_b64, min_face_area_ratio=0.04, num_jitters=3, model="hog"
-        )
+        if len(student_user_ids) > MAX_GALLERY_STUDENTS:
+            ml_response = await recognize_roster(
+                student_user_ids=student_user_ids,
+                image_bytes=image_bytes,
+                min_face_area_ratio=0.04,
+                confident_threshold=ML_CONFIDENT_THRESHOLD,
+            )
+        else:
+            ml_response = await recognize_subject(
+                subject_id=str(subject["_id"]),
+                student_user_ids=student_user_ids,
+                image_bytes=image_bytes,
+                min_face_area_ratio=0.04,
+                confident_threshold=ML_CONFIDENT_THRESHOLD,
+            )
 
         if not ml_response.get("success"):
             raise HTTPException(
@@ -160,80 +215,37 @@ async def mark_attendance(payload: Dict):
         detected_faces = ml_response.get("faces", [])
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to detect faces: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Failed to recognize faces: {str(e)}"
+        )
 
     if not detected_faces:
         return {"faces": [], "count": 0}
 
-    # Load students of this subject with embeddings
+    matches = _classify_faces(detected_faces)
+
+    # Load matched students (embeddings stay in the ML service gallery)
+    matched_ids = {student_id for student_id, _, _ in matches if student_id}
     students_cursor = db.students.find(
-        {
-            "userId": {"$in": student_user_ids},
-            "verified": True,
-            "face_embeddings": {"$exists": True, "$ne": []},
-        }
+        {"userId": {"$in": [ObjectId(sid) for sid in matched_ids]}},
+        {"face_embeddings": 0},
     )
-
-    students = await students_cursor.to_list(length=500)
-
-    # Prepare candidate embeddings for batch matching
-    candidate_embeddings = []
-    for student in students:
-        candidate_embeddings.append(
-            {
-                "student_id": str(student["userId"]),
-                "embeddings": student["face_embeddings"],
-            }
-        )
-
-    # Call ML service to match faces
-    try:
-        match_response = await ml_client.batch_match(
-            detected_faces=[
-                {"embedding": face["embedding"]} for face in detected_faces
-            ],
-            candidate_embeddings=candidate_embeddings,
-            confident_threshold=ML_CONFIDENT_THRESHOLD,
-            uncertain_threshold=ML_UNCERTAIN_THRESHOLD,
-        )
-
-        if not match_response.get("success"):
-            raise HTTPException(
-                status_code=500,
-                detail=(
-                    f"ML service error: {match_response.get('error', 'Unknown error')}"
-                ),  # noqa: E501
-            )
-
-        matches = match_response.get("matches", [])
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to match faces: {str(e)}")
+    students = {
+        str(s["userId"]): s for s in await students_cursor.to_list(length=None)
+    }
+    # Each student is matched to at most one face, so one lookup serves all
+    users_cursor = db.users.find(
+        {"_id": {"$in": [s["userId"] for s in students.values()]}},
+        {"name": 1, "roll": 1},
+    )
+    users = {u["_id"]: u for u in await users_cursor.to_list(length=None)}
 
     # Build results
     results = []
     logger.info("Faces detected: %d", len(detected_faces))
 
-    for i, (face, match) in enumerate(zip(detected_faces, matches)):
-        student_id = match.get("student_id")
-        distance = match.get("distance")
-        status = match.get("status")  # "present" or "unknown"
-
-        # Find student details
-        best_match = None
-        if student_id:
-            best_match = next(
-                (s for s in students if str(s["userId"]) == student_id), None
-            )
-
-        # Determine status based on config thresholds
-        if distance < ML_CONFIDENT_THRESHOLD:
-            status = "present"
-        elif distance < ML_UNCERTAIN_THRESHOLD:
-            status = "uncertain"
-        else:
-            status = "unknown"
-            best_match = None
+    for face, (student_id, distance, status) in zip(detected_faces, matches):
+        best_match = students.get(student_id) if student_id else None
 
         logger.debug(
             "Match: %s distance=%.4f",
@@ -241,12 +253,7 @@ async def mark_attendance(payload: Dict):
             distance,
         )
 
-        # Get user details
-        user = None
-        if best_match:
-            user = await db.users.find_one(
-                {"_id": best_match["userId"]}, {"name": 1, "roll": 1}
-            )
+        user = users.get(best_match["userId"]) if best_match else None
 
         # Build result
         location = face.get("location", {})
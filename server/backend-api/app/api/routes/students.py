@@ -6,8 +6,8 @@ from ...core.security import get_current_user
 from app.services.students import get_student_profile
 
 from cloudinary.uploader import upload
-import base64
 from app.services.ml_client import ml_client
+from app.services import face_exemplars, face_gallery, face_index
 
 from app.services import schedule_service
 from datetime import datetime
@@ -123,13 +123,10 @@ async def upload_image_url(
     # 1. Read image bytes
     image_bytes = await file.read()
 
-    # 2. Convert to base64 for ML service
-    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-    # 3. Generate face embeddings via ML service
+    # 2. Generate face embeddings via ML service (raw bytes, no base64)
     try:
-        ml_response = await ml_client.encode_face(
-            image_base64=image_base64,
+        ml_response = await ml_client.encode_face_bytes(
+            image_bytes=image_bytes,
             validate_single=True,
             min_face_area_ratio=0.05,
             num_jitters=5,
@@ -142,13 +139,16 @@ async def upload_image_url(
             )
 
         embedding = ml_response.get("embedding")
+        embedding_version = ml_response.get(
+            "embedding_version", face_gallery.RAW_EMBEDDING_VERSION
+        )
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ML service error: {str(e)}")
 
-    # 4. Upload image to Cloudinary
+    # 3. Upload image to Cloudinary
     upload_result = upload(
         image_bytes,
         folder="student_faces",
@@ -159,13 +159,22 @@ async def upload_image_url(
 
     image_url = upload_result.get("secure_url")
 
-    # 5. Store image_url + embeddings
-    await db.students.update_one(
-        {"userId": student_user_id},
-        {
-            "$set": {"image_url": image_url, "verified": True},
-            "$push": {"face_embeddings": embedding},
-        },
+    # 4. Store image_url and merge the embedding into the student's bounded
+    # exemplar set. A student's stored embeddings share one version:
+    # enrolling under a new embedding space starts a fresh set.
+    exemplars = await face_exemplars.enrol_face_embedding(
+        student_user_id,
+        embedding,
+        embedding_version,
+        extra_fields={"image_url": image_url, "verified": True},
+    )
+
+    # 5. Swap the student's exemplars into the ML service's galleries and index
+    await face_gallery.push_student_embeddings(
+        student_user_id, exemplars, embedding_version, replace=True
+    )
+    await face_index.replace_student_embeddings(
+        str(student_user_id), exemplars, embedding_version
     )
 
     return {
@@ -349,5 +358,6 @@ async def remove_subject(
     await db.subjects.update_one(
         {"_id": subject_oid}, {"$pull": {"students": {"student_id": user_oid}}}
     )
+    await face_gallery.remove_student_from_gallery(subject_oid, user_oid)
 
     return {"message": "Subject removed successfully"}
@@ -1,5 +1,6 @@
 # backend/app/api/routes/settings.py
 import logging
+import numpy as np
 
 from app.db.mongo import db
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
@@ -15,6 +16,8 @@ from app.services import schedule_service
 from bson import ObjectId, errors as bson_errors
 from app.schemas.schedule import Schedule
 from app.services.attendance_alerts import send_low_attendance_for_teacher
+from app.services import face_gallery
+from app.utils.embedding_storage import unpack_embeddings
 
 logger = logging.getLogger(__name__)
 
@@ -416,7 +419,10 @@ async def get_subject_students(
                 "roll": student_doc.get("roll"),
                 "year": student_doc.get("year"),
                 "branch": student_doc.get("branch"),
-                "embeddings": student_doc.get("face_embeddings", []),
+                "embeddings": [
+                    np.asarray(e, dtype=float).tolist()
+                    for e in unpack_embeddings(student_doc.get("face_embeddings", []))
+                ],
                 "avatar": student_doc.get("image_url"),
                 "verified": s.get("verified", False),
                 "attendance": s.get("attendance", {"present": 0, "absent": 0}),
@@ -447,6 +453,8 @@ async def verify_student(
             status_code=404, detail="Student not enrolled in this subject"
         )
 
+    await face_gallery.sync_student_in_gallery(subj_id, stud_id)
+
     return {"message": "Student verified successfully"}
 
 
@@ -472,6 +480,8 @@ async def remove_student(
 
     await db.students.update_one({"userId": stud_id}, {"$pull": {"subjects": subj_id}})
 
+    await face_gallery.remove_student_from_gallery(subj_id, stud_id)
+
     return {"message": "Student removed from subject"}
 
 
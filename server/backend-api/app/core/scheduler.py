@@ -2,6 +2,8 @@ import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from app.services.attendance_alerts import process_monthly_low_attendance_alerts
+from app.services.face_exemplars import run_face_embedding_compaction
+from app.services.face_index import refresh_student_index
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +19,23 @@ def start_scheduler():
         name="Monthly Low Attendance Alerts",
     )
 
+    # Before the index refresh, so it re-clusters the compacted embeddings
+    scheduler.add_job(
+        run_face_embedding_compaction,
+        trigger=CronTrigger(hour=1, minute=30),
+        id="face_embedding_compaction",
+        replace_existing=True,
+        name="Face Embedding Compaction",
+    )
+
+    scheduler.add_job(
+        refresh_student_index,
+        trigger=CronTrigger(hour=2, minute=0),
+        id="student_face_index_refresh",
+        replace_existing=True,
+        name="Student Face Index Refresh",
+    )
+
     scheduler.start()
     logger.info("APScheduler started.")
 
@@ -0,0 +1,89 @@
+"""
+One-shot data migrations.
+
+Run from backend-api/ with ``python -m app.db.migrations <name>``. Each migration is
+idempotent, so re-running after an interruption only converts what is left.
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import Dict
+
+from pymongo import UpdateOne
+
+from app.db.mongo import db
+from app.utils.embedding_storage import (
+    EMBEDDING_STORAGE_DTYPE,
+    STORAGE_DTYPES,
+    is_packed,
+    pack_embedding,
+)
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 200
+
+
+async def migrate_face_embeddings(
+    dtype: str = EMBEDDING_STORAGE_DTYPE, batch_size: int = MIGRATION_BATCH_SIZE
+) -> Dict[str, int]:
+    """
+    Rewrite legacy ``face_embeddings`` arrays of doubles as packed BinData.
+
+    A document is only rewritten if its embeddings are unchanged since they
+    were read, so an enrolment racing the migration is not lost; it is
+    picked up on the next run instead.
+    """
+    cursor = db.students.find(
+        {"face_embeddings": {"$elemMatch": {"$type": "array"}}},
+        {"face_embeddings": 1},
+    ).batch_size(batch_size)
+
+    scanned = converted = 0
+    operations = []
+    async for student in cursor:
+        scanned += 1
+        embeddings = student["face_embeddings"]
+        packed = [e if is_packed(e) else pack_embedding(e, dtype) for e in embeddings]
+        operations.append(
+            UpdateOne(
+                {"_id": student["_id"], "face_embeddings": embeddings},
+                {"$set": {"face_embeddings": packed}},
+            )
+        )
+        if len(operations) >= batch_size:
+            result = await db.students.bulk_write(operations, ordered=False)
+            converted += result.modified_count
+            operations = []
+
+    if operations:
+        result = await db.students.bulk_write(operations, ordered=False)
+        converted += result.modified_count
+
+    logger.info("Packed face embeddings of %d/%d students", converted, scanned)
+    return {"scanned": scanned, "converted": converted}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one-shot data migrations")
+    parser.add_argument("migration", choices=["face-embeddings", "face-exemplars"])
+    parser.add_argument(
+        "--dtype", choices=sorted(STORAGE_DTYPES), default=EMBEDDING_STORAGE_DTYPE
+    )
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.migration == "face-exemplars":
+        # Also run nightly by the scheduler; this backfills at once
+        from app.services.face_exemplars import compact_face_embeddings
+
+        result = asyncio.run(compact_face_embeddings(args.batch_size))
+    else:
+        result = asyncio.run(migrate_face_embeddings(args.dtype, args.batch_size))
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,7 @@ class DetectFacesRequest(BaseModel):
 
     image_base64: str
     min_face_area_ratio: float = 0.04
-    num_jitters: int = 3
+    num_jitters: int = 1
     model: str = "hog"
 
 
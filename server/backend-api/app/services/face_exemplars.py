@@ -0,0 +1,175 @@
+"""
+Bounded face embeddings per student: enrolment and compaction.
+
+Enrolment merges a new embedding into the student's stored set instead of
+appending it (see ``app.utils.embedding_exemplars``). The ML galleries and
+student index get the student's whole new set as a replacement. Students
+stored under an older ``embedding_policy`` (or none, i.e. every upload ever
+pushed) are compacted by a nightly job, which also refreshes the ML service
+copies of those it shrank.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.db.mongo import db
+from app.services import face_gallery, face_index
+from app.utils.embedding_exemplars import (
+    EMBEDDING_POLICY_VERSION,
+    aggregate_embeddings,
+)
+from app.utils.embedding_storage import pack_embedding, unpack_embeddings
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_BATCH_SIZE = 200
+# Optimistic retries of an enrolment racing another one for the same student
+ENROL_ATTEMPTS = 3
+# Written by earlier versions but never read: dropped when a student is rewritten
+UNSET_FIELDS = {"face_centroid": ""}
+
+
+def exemplar_fields(embeddings: List[Any]) -> Dict[str, Any]:
+    """``$set`` fields storing the exemplars of ``embeddings``."""
+    exemplars = aggregate_embeddings(embeddings)
+    return {
+        "face_embeddings": [pack_embedding(e) for e in exemplars],
+        "embedding_policy": EMBEDDING_POLICY_VERSION,
+    }
+
+
+def _unchanged_since_read(stored: Optional[list]) -> Any:
+    # Matches the document only if no other write changed its embeddings: a
+    # count would not notice a racing merge that kept the set at its size
+    if stored is None:
+        return {"$exists": False}
+    return stored
+
+
+async def enrol_face_embedding(
+    student_user_id: ObjectId,
+    embedding: Any,
+    embedding_version: str,
+    extra_fields: Optional[Dict[str, Any]] = None,
+) -> List[np.ndarray]:
+    """
+    Merge a newly encoded embedding into the student's exemplars.
+
+    Embeddings stored under another embedding version are replaced: a
+    student's set always shares one version. Returns the exemplars stored.
+    """
+    fields = {}
+    for attempt in range(ENROL_ATTEMPTS):
+        student = await db.students.find_one(
+            {"userId": student_user_id},
+            {"face_embeddings": 1, "embedding_version": 1},
+        )
+        stored = (student or {}).get("face_embeddings")
+        stored_version = (student or {}).get(
+            "embedding_version", face_gallery.RAW_EMBEDDING_VERSION
+        )
+        existing = (
+            unpack_embeddings(stored) if stored_version == embedding_version else []
+        )
+
+        fields = exemplar_fields([*existing, embedding])
+        update = {
+            "$set": {
+                **(extra_fields or {}),
+                **fields,
+                "embedding_version": embedding_version,
+            },
+            "$unset": UNSET_FIELDS,
+        }
+        query = {"userId": student_user_id}
+        if attempt < ENROL_ATTEMPTS - 1:
+            query["face_embeddings"] = _unchanged_since_read(stored)
+        result = await db.students.update_one(query, update)
+        if result.matched_count or student is None:
+            break
+
+    return unpack_embeddings(fields["face_embeddings"])
+
+
+async def _refresh_ml_copies(student_user_id: ObjectId, student: Dict[str, Any]):
+    embeddings = unpack_embeddings(student["face_embeddings"])
+    version = student.get("embedding_version")
+    await face_gallery.push_student_embeddings(
+        student_user_id, embeddings, version, replace=True
+    )
+    await face_index.replace_student_embeddings(
+        str(student_user_id), embeddings, version
+    )
+
+
+async def compact_face_embeddings(
+    batch_size: int = COMPACTION_BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Rewrite students stored under an older embedding policy as exemplars.
+
+    A document is only rewritten if its embeddings are unchanged since they
+    were read; a racing enrolment compacts it anyway.
+    """
+    cursor = db.students.find(
+        {
+            "embedding_policy": {"$ne": EMBEDDING_POLICY_VERSION},
+            "face_embeddings": {"$exists": True, "$ne": []},
+        },
+        {"userId": 1, "face_embeddings": 1, "embedding_version": 1},
+    ).batch_size(batch_size)
+
+    scanned = compacted = removed = 0
+    operations = []
+    shrunk = []
+
+    async def flush():
+        nonlocal compacted, operations, shrunk
+        result = await db.students.bulk_write(operations, ordered=False)
+        compacted += result.modified_count
+        for student_user_id, student in shrunk:
+            await _refresh_ml_copies(student_user_id, student)
+        operations, shrunk = [], []
+
+    async for student in cursor:
+        scanned += 1
+        embeddings = student["face_embeddings"]
+        fields = exemplar_fields(unpack_embeddings(embeddings))
+        operations.append(
+            UpdateOne(
+                {
+                    "_id": student["_id"],
+                    "face_embeddings": _unchanged_since_read(embeddings),
+                },
+                {"$set": fields, "$unset": UNSET_FIELDS},
+            )
+        )
+        dropped = len(embeddings) - len(fields["face_embeddings"])
+        if dropped:
+            removed += dropped
+            shrunk.append((student["userId"], {**student, **fields}))
+        if len(operations) >= batch_size:
+            await flush()
+
+    if operations:
+        await flush()
+
+    logger.info(
+        "Compacted face embeddings of %d/%d students (%d embeddings merged)",
+        compacted,
+        scanned,
+        removed,
+    )
+    return {"scanned": scanned, "compacted": compacted, "removed": removed}
+
+
+async def run_face_embedding_compaction():
+    """Scheduler entry point."""
+    try:
+        await compact_face_embeddings()
+    except Exception as e:
+        logger.warning("Could not compact face embeddings: %s", e)
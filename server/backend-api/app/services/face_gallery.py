@@ -0,0 +1,180 @@
+"""
+Per-subject face galleries held by the ML service.
+
+The ML service keeps each subject's enrolled embeddings in memory (keyed by
+subject id) so attendance marking only sends the classroom image. Galleries
+are registered lazily on the first match after an ML service restart and
+kept current with small deltas when a student enrols a new face or their
+subject membership changes.
+
+Embeddings are stored with the ``embedding_version`` the ML service encoded
+them under and sent back with it, so the service can project or reject
+vectors from another embedding space. Records enrolled before versioning
+carry no version; the service recognises their raw pixel vectors by length.
+"""
+
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+
+from app.db.mongo import db
+from app.services.ml_client import ml_client
+from app.utils.embedding_storage import unpack_embeddings
+
+logger = logging.getLogger(__name__)
+
+GALLERY_NOT_FOUND = "GALLERY_NOT_FOUND"
+MAX_GALLERY_STUDENTS = 500
+RAW_EMBEDDING_VERSION = "pixel96-v1"
+
+
+def student_candidate(student: Dict[str, Any]) -> Dict[str, Any]:
+    """ML candidate of a student document, with its embedding version if known."""
+    candidate = {
+        "student_id": str(student["userId"]),
+        "embeddings": unpack_embeddings(student["face_embeddings"]),
+    }
+    if student.get("embedding_version"):
+        candidate["embedding_version"] = student["embedding_version"]
+    return candidate
+
+
+async def load_subject_candidates(student_user_ids: List[ObjectId]) -> List[Dict]:
+    """Candidate embeddings of the verified students of a subject."""
+    students_cursor = db.students.find(
+        {
+            "userId": {"$in": student_user_ids},
+            "verified": True,
+            "face_embeddings": {"$exists": True, "$ne": []},
+        },
+        {"userId": 1, "face_embeddings": 1, "embedding_version": 1},
+    )
+    students = await students_cursor.to_list(length=MAX_GALLERY_STUDENTS)
+
+    return [student_candidate(student) for student in students]
+
+
+async def register_subject_gallery(
+    subject_id: str, student_user_ids: List[ObjectId]
+) -> Dict[str, Any]:
+    """Load the subject's embeddings from Mongo and (re)register its gallery."""
+    candidates = await load_subject_candidates(student_user_ids)
+    response = await ml_client.register_gallery(subject_id, candidates)
+    if response.get("success"):
+        skipped = response.get("skipped") or []
+        logger.info(
+            "Registered face gallery for subject %s (%d students, %d skipped)",
+            subject_id,
+            len(candidates) - len(skipped),
+            len(skipped),
+        )
+        if skipped:
+            logger.warning(
+                "Students left out of the gallery of subject %s until re-enrolled: %s",
+                subject_id,
+                ", ".join(skipped),
+            )
+    return response
+
+
+async def _with_subject_gallery(
+    subject_id: str,
+    student_user_ids: List[ObjectId],
+    call: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """Run an ML call against the subject's gallery, registering it on demand."""
+    response = await call()
+    if response.get("error_code") != GALLERY_NOT_FOUND:
+        return response
+
+    registered = await register_subject_gallery(subject_id, student_user_ids)
+    if not registered.get("success"):
+        return registered
+
+    return await call()
+
+
+async def recognize_subject(
+    subject_id: str,
+    student_user_ids: List[ObjectId],
+    image_bytes: bytes,
+    min_face_area_ratio: float,
+    confident_threshold: float,
+) -> Dict[str, Any]:
+    """Detect and match the faces in a classroom image in one ML roundtrip."""
+    return await _with_subject_gallery(
+        subject_id,
+        student_user_ids,
+        lambda: ml_client.recognize_bytes(
+            image_bytes=image_bytes,
+            gallery_id=subject_id,
+            min_face_area_ratio=min_face_area_ratio,
+            confident_threshold=confident_threshold,
+        ),
+    )
+
+
+async def push_student_embeddings(
+    student_user_id: ObjectId,
+    embeddings: List[Any],
+    embedding_version: Optional[str] = None,
+    replace: bool = False,
+):
+    """
+    Add (or with ``replace``, swap in) a student's embeddings in every
+    gallery the student belongs to.
+
+    Galleries the ML service does not hold are skipped; they pick the
+    embeddings up from Mongo when they are next registered.
+    """
+    subjects_cursor = db.subjects.find(
+        {"students": {"$elemMatch": {"student_id": student_user_id, "verified": True}}},
+        {"_id": 1},
+    )
+    async for subject in subjects_cursor:
+        try:
+            await ml_client.add_gallery_embeddings(
+                str(subject["_id"]),
+                str(student_user_id),
+                embeddings,
+                replace=replace,
+                embedding_version=embedding_version,
+            )
+        except Exception as e:
+            logger.warning(
+                "Could not update face gallery for subject %s: %s", subject["_id"], e
+            )
+
+
+async def sync_student_in_gallery(subject_id: ObjectId, student_user_id: ObjectId):
+    """Replace one student's embeddings in a subject gallery (e.g. on verify)."""
+    student = await db.students.find_one(
+        {"userId": student_user_id, "verified": True},
+        {"face_embeddings": 1, "embedding_version": 1},
+    )
+    student = student or {}
+    try:
+        await ml_client.add_gallery_embeddings(
+            str(subject_id),
+            str(student_user_id),
+            unpack_embeddings(student.get("face_embeddings", [])),
+            replace=True,
+            embedding_version=student.get("embedding_version"),
+        )
+    except Exception as e:
+        logger.warning(
+            "Could not update face gallery for subject %s: %s", subject_id, e
+        )
+
+
+async def remove_student_from_gallery(
+    subject_id: ObjectId, student_user_id: ObjectId
+):
+    """Drop a student who left a subject from that subject's gallery."""
+    try:
+        await ml_client.remove_gallery_student(str(subject_id), str(student_user_id))
+    except Exception as e:
+        logger.warning(
+            "Could not update face gallery for subject %s: %s", subject_id, e
+        )
@@ -0,0 +1,226 @@
+"""
+Institution-wide ANN index of every enrolled student, held by the ML service.
+
+Subject galleries cover attendance in a class; this index is for open-set
+identification against all students (e.g. gate cameras), and for marking
+attendance in subjects too large for a gallery. It is built from the
+students collection in pages and trained once, rebuilt lazily after an ML
+service restart, kept current with small inserts as students enrol, and
+re-clustered nightly by the scheduler so its lists follow enrolment growth.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app.db.mongo import db
+from app.services.face_gallery import student_candidate
+from app.services.ml_client import ml_client
+
+logger = logging.getLogger(__name__)
+
+STUDENT_INDEX_ID = "students"
+INDEX_NOT_FOUND = "INDEX_NOT_FOUND"
+SYNC_PAGE_SIZE = 500
+# Students searched per face; only those on the roster are kept
+ROSTER_SEARCH_K = 20
+# Next best roster students returned per face, as the gallery path does
+ROSTER_RUNNER_UPS = 2
+
+
+def _log_skipped(response: Dict[str, Any]) -> int:
+    # Students whose stored embeddings are in another embedding version
+    skipped = response.get("skipped") or []
+    if skipped:
+        logger.warning(
+            "%d students left out of the face index until re-enrolled: %s",
+            len(skipped),
+            ", ".join(skipped),
+        )
+    return len(skipped)
+
+
+async def rebuild_student_index() -> Dict[str, Any]:
+    """Build the index from every verified student with embeddings."""
+    response = await ml_client.build_index(STUDENT_INDEX_ID, train=False)
+    if not response.get("success"):
+        return response
+
+    students_cursor = db.students.find(
+        {"verified": True, "face_embeddings": {"$exists": True, "$ne": []}},
+        {"userId": 1, "face_embeddings": 1, "embedding_version": 1},
+    ).batch_size(SYNC_PAGE_SIZE)
+
+    failed = skipped = 0
+
+    async def add_page(page: List[Dict[str, Any]]):
+        nonlocal failed, skipped
+        added = await ml_client.add_index_embeddings(STUDENT_INDEX_ID, page)
+        if not added.get("success"):
+            failed += len(page)
+            logger.error(
+                "Could not add %d students to the face index: %s",
+                len(page),
+                added.get("error"),
+            )
+            return
+        skipped += _log_skipped(added)
+
+    page: List[Dict[str, Any]] = []
+    async for student in students_cursor:
+        page.append(student_candidate(student))
+        if len(page) >= SYNC_PAGE_SIZE:
+            await add_page(page)
+            page = []
+    if page:
+        await add_page(page)
+
+    # Trained either way, so the students that were added can be searched
+    response = await ml_client.train_index(STUDENT_INDEX_ID)
+    if not response.get("success"):
+        return response
+    logger.info(
+        "Built student face index (%d students, %d lists, %d skipped)",
+        response["index"]["num_students"],
+        response["index"]["nlist"],
+        skipped,
+    )
+    if failed:
+        return {
+            **response,
+            "success": False,
+            "error": f"{failed} students could not be added to the face index",
+        }
+    return response
+
+
+async def refresh_student_index():
+    """
+    Scheduler entry point: re-cluster the live index in place (inserts keep
+    its contents current), or build it if the ML service does not hold it.
+    """
+    try:
+        response = await ml_client.train_index(STUDENT_INDEX_ID)
+        if response.get("error_code") == INDEX_NOT_FOUND:
+            await rebuild_student_index()
+    except Exception as e:
+        logger.warning("Could not refresh student face index: %s", e)
+
+
+async def identify_faces(
+    embeddings: List[Any], k: int = 5, threshold: float = 0.50
+) -> Dict[str, Any]:
+    """Top-k students for each face embedding, building the index on demand."""
+    response = await ml_client.search_index(
+        STUDENT_INDEX_ID, embeddings, k=k, threshold=threshold
+    )
+    if response.get("error_code") != INDEX_NOT_FOUND:
+        return response
+
+    built = await rebuild_student_index()
+    if not built.get("success"):
+        return built
+
+    return await ml_client.search_index(
+        STUDENT_INDEX_ID, embeddings, k=k, threshold=threshold
+    )
+
+
+async def recognize_roster(
+    student_user_ids: List[ObjectId],
+    image_bytes: bytes,
+    min_face_area_ratio: float,
+    confident_threshold: float,
+) -> Dict[str, Any]:
+    """
+    Detect the faces in an image and identify them among a roster through
+    the student index, in the shape of the ML ``recognize`` response.
+
+    As with a gallery, each student is assigned to at most one face (most
+    similar pairs first) and faces left without a roster student are
+    "unknown". Each face lists its next best roster students as
+    ``runner_ups``.
+    """
+    detected = await ml_client.detect_faces_bytes(
+        image_bytes, min_face_area_ratio=min_face_area_ratio
+    )
+    faces = detected.get("faces", [])
+    if not detected.get("success") or not faces:
+        return detected
+
+    searched = await identify_faces(
+        [face["embedding"] for face in faces],
+        k=ROSTER_SEARCH_K,
+        threshold=confident_threshold,
+    )
+    if not searched.get("success"):
+        return searched
+
+    roster = {str(user_id) for user_id in student_user_ids}
+    # face_index -> roster matches, most similar first
+    roster_matches: Dict[int, List[Dict[str, Any]]] = {
+        result["face_index"]: sorted(
+            (m for m in result["matches"] if m["student_id"] in roster),
+            key=lambda m: m["similarity"],
+            reverse=True,
+        )
+        for result in searched["results"]
+    }
+    pairs = sorted(
+        (
+            (match["similarity"], face_index, match["student_id"])
+            for face_index, matches in roster_matches.items()
+            for match in matches
+            if match["similarity"] >= confident_threshold
+        ),
+        reverse=True,
+    )
+    assigned: Dict[int, Tuple[str, float]] = {}
+    taken = set()
+    for similarity, face_index, student_id in pairs:
+        if face_index not in assigned and student_id not in taken:
+            assigned[face_index] = (student_id, similarity)
+            taken.add(student_id)
+
+    recognized = []
+    for face_index, face in enumerate(faces):
+        matches = roster_matches.get(face_index, [])
+        # An unassigned face reports its closest roster student, if any
+        closest = matches[0]["similarity"] if matches else -1.0
+        student_id, similarity = assigned.get(face_index, (None, closest))
+        others = [match for match in matches if match["student_id"] != student_id]
+        recognized.append(
+            {
+                "face_index": face_index,
+                "location": face["location"],
+                "face_area_ratio": face["face_area_ratio"],
+                "student_id": student_id,
+                "distance": 1 - similarity,
+                "status": "present" if student_id else "unknown",
+                "runner_ups": [
+                    {
+                        "student_id": match["student_id"],
+                        "min_distance": 1 - match["similarity"],
+                    }
+                    for match in others[:ROSTER_RUNNER_UPS]
+                ],
+            }
+        )
+    return {"success": True, "faces": recognized, "count": len(recognized)}
+
+
+async def replace_student_embeddings(
+    student_id: str, embeddings: List[Any], embedding_version: Optional[str] = None
+):
+    """Swap in a student's current embeddings (e.g. after compaction)."""
+    candidate = {"student_id": student_id, "embeddings": embeddings}
+    if embedding_version:
+        candidate["embedding_version"] = embedding_version
+    try:
+        response = await ml_client.add_index_embeddings(
+            STUDENT_INDEX_ID, [candidate], replace=True
+        )
+        _log_skipped(response)
+    except Exception as e:
+        logger.warning("Could not update student face index: %s", e)
@@ -1,7 +1,14 @@
+import asyncio
 import httpx
 import os
 from typing import Optional, List, Dict, Any
 
+from app.utils.embedding_codec import decode_embedding, encode_embedding
+
+# ML service load shedding: 429 (queue full) / 503 (deadline) with Retry-After
+OVERLOAD_STATUS_CODES = (429, 503)
+MAX_RETRY_AFTER_SECONDS = 5.0
+
 
 class MLClient:
     """HTTP client for communicating with ML Service"""
@@ -11,11 +18,18 @@ class MLClient:
         self.api_key = os.getenv("ML_API_KEY", "your-secret-api-key-here")
         self.timeout = float(os.getenv("ML_SERVICE_TIMEOUT", "30"))
         self.max_retries = int(os.getenv("ML_SERVICE_MAX_RETRIES", "3"))
+        # Wire format for embeddings: "f16" / "f32" base64 blobs or "json" lists
+        self.embedding_encoding = os.getenv("ML_EMBEDDING_ENCODING", "f16")
 
         # Create httpx client with connection pooling
         self.client = httpx.AsyncClient(
             base_url=self.base_url,
-            headers={"X-API-KEY": self.api_key},
+            headers={
+                "X-API-KEY": self.api_key,
+                "X-Embedding-Encoding": self.embedding_encoding,
+                # Lets the ML service shed requests that would time out anyway
+                "X-Request-Timeout": str(self.timeout),
+            },
             timeout=self.timeout,
             limits=httpx.Limits(max_keepalive_connections=5, max_connections=10),
         )
@@ -24,19 +38,50 @@ class MLClient:
         """Close the HTTP client"""
         await self.client.aclose()
 
+    def _encode(self, embedding: Any) -> Any:
+        return encode_embedding(embedding, self.embedding_encoding)
+
+    def _encode_candidates(
+        self, candidate_embeddings: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        return [
+            {
+                **c,
+                "embeddings": [self._encode(e) for e in c["embeddings"]],
+            }
+            for c in candidate_embeddings
+        ]
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float:
+        """Seconds to back off from an overloaded ML service, capped"""
+        try:
+            seconds = float(response.headers.get("Retry-After", "1"))
+        except ValueError:
+            seconds = 1.0
+        return min(max(seconds, 0.0), MAX_RETRY_AFTER_SECONDS)
+
     async def _make_request(
         self,
         method: str,
         endpoint: str,
         json_data: Optional[Dict] = None,
         retries: int = 0,
+        content: Optional[bytes] = None,
+        params: Optional[Dict] = None,
+        headers: Optional[Dict] = None,
     ) -> Dict[str, Any]:
         """
         Make HTTP request to ML service with retry logic
         """
         try:
             response = await self.client.request(
-                method=method, url=endpoint, json=json_data
+                method=method,
+                url=endpoint,
+                json=json_data,
+                content=content,
+                params=params,
+                headers=headers,
             )
             response.raise_for_status()
             return response.json()
@@ -44,11 +89,19 @@ class MLClient:
         except httpx.TimeoutException:
             if retries < self.max_retries:
                 return await self._make_request(
-                    method, endpoint, json_data, retries + 1
+                    method, endpoint, json_data, retries + 1, content, params, headers
                 )
             raise Exception(f"ML Service timeout after {self.max_retries} retries")
 
         except httpx.HTTPStatusError as e:
+            if (
+                e.response.status_code in OVERLOAD_STATUS_CODES
+                and retries < self.max_retries
+            ):
+                await asyncio.sleep(self._retry_after(e.response))
+                return await self._make_request(
+                    method, endpoint, json_data, retries + 1, content, params, headers
+                )
             raise Exception(
                 f"ML Service error: {e.response.status_code} - {e.response.text}"
             )
@@ -56,7 +109,7 @@ class MLClient:
         except Exception as e:
             if retries < self.max_retries:
                 return await self._make_request(
-                    method, endpoint, json_data, retries + 1
+                    method, endpoint, json_data, retries + 1, content, params, headers
                 )
             raise Exception(f"ML Service communication error: {str(e)}")
 
@@ -73,7 +126,7 @@ class MLClient:
         Returns:
             {
                 "success": bool,
-                "embedding": List[float],
+                "embedding": List[float],  # decoded from the wire format
                 "face_location": {...},
                 "metadata": {...},
                 "error": str (optional)
@@ -86,13 +139,46 @@ class MLClient:
             "num_jitters": num_jitters,
         }
 
-        return await self._make_request("POST", "/api/ml/encode-face", request_data)
+        response = await self._make_request(
+            "POST", "/api/ml/encode-face", request_data
+        )
+        if response.get("embedding") is not None:
+            response["embedding"] = decode_embedding(response["embedding"])
+        return response
+
+    async def encode_face_bytes(
+        self,
+        image_bytes: bytes,
+        validate_single: bool = True,
+        min_face_area_ratio: float = 0.05,
+        num_jitters: int = 5,
+    ) -> Dict[str, Any]:
+        """
+        Encode a single face, sending the image as a raw octet-stream body
+        instead of base64 JSON. Returns the same shape as `encode_face`.
+        """
+        params = {
+            "validate_single": str(validate_single).lower(),
+            "min_face_area_ratio": min_face_area_ratio,
+            "num_jitters": num_jitters,
+        }
+
+        response = await self._make_request(
+            "POST",
+            "/api/ml/encode-face/raw",
+            content=image_bytes,
+            params=params,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        if response.get("embedding") is not None:
+            response["embedding"] = decode_embedding(response["embedding"])
+        return response
 
     async def detect_faces(
         self,
         image_base64: str,
         min_face_area_ratio: float = 0.04,
-        num_jitters: int = 3,
+        num_jitters: int = 1,
         model: str = "hog",
     ) -> Dict[str, Any]:
         """
@@ -102,7 +188,7 @@ class MLClient:
             {
                 "success": bool,
                 "faces": [{
-                    "embedding": List[float],
+                    "embedding": str,  # wire-encoded; pass as-is to batch_match
                     "location": {...},
                     "face_area_ratio": float
                 }],
@@ -119,6 +205,31 @@ class MLClient:
 
         return await self._make_request("POST", "/api/ml/detect-faces", request_data)
 
+    async def detect_faces_bytes(
+        self,
+        image_bytes: bytes,
+        min_face_area_ratio: float = 0.04,
+        num_jitters: int = 1,
+        model: str = "hog",
+    ) -> Dict[str, Any]:
+        """
+        Detect multiple faces, sending the image as a raw octet-stream body
+        instead of base64 JSON. Returns the same shape as `detect_faces`.
+        """
+        params = {
+            "min_face_area_ratio": min_face_area_ratio,
+            "num_jitters": num_jitters,
+            "model": model,
+        }
+
+        return await self._make_request(
+            "POST",
+            "/api/ml/detect-faces/raw",
+            content=image_bytes,
+            params=params,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+
     async def match_faces(
         self,
         query_embedding: List[float],
@@ -150,8 +261,8 @@ class MLClient:
             }
         """
         request_data = {
-            "query_embedding": query_embedding,
-            "candidate_embeddings": candidate_embeddings,
+            "query_embedding": self._encode(query_embedding),
+            "candidate_embeddings": self._encode_candidates(candidate_embeddings),
             "threshold": threshold,
             "return_all_distances": return_all_distances,
         }
@@ -161,12 +272,14 @@ class MLClient:
     async def batch_match(
         self,
         detected_faces: List[Dict[str, Any]],
-        candidate_embeddings: List[Dict[str, Any]],
+        candidate_embeddings: Optional[List[Dict[str, Any]]] = None,
         confident_threshold: float = 0.50,
         uncertain_threshold: float = 0.60,
+        gallery_id: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
-        Match multiple detected faces against candidate embeddings
+        Match multiple detected faces against candidate embeddings, or against
+        a gallery previously registered with `register_gallery`
 
         detected_faces format: [
             {"embedding": [float, ...]},
@@ -182,25 +295,256 @@ class MLClient:
         ]
 
         Returns:
+            Each student is matched to at most one face.
+
             {
                 "success": bool,
                 "matches": [{
                     "face_index": int,
                     "student_id": str or None,
                     "distance": float,
-                    "status": str  # "present" or "unknown"
-                }]
+                    "status": str,  # "present" or "unknown"
+                    "runner_ups": [{"student_id": str, "min_distance": float}]
+                }],
+                "gallery_version": int (when matched against a gallery),
+                "error_code": "GALLERY_NOT_FOUND" (if gallery_id is unknown)
             }
         """
         request_data = {
-            "detected_faces": detected_faces,
-            "candidate_embeddings": candidate_embeddings,
+            "detected_faces": [
+                {**face, "embedding": self._encode(face["embedding"])}
+                for face in detected_faces
+            ],
+            "candidate_embeddings": self._encode_candidates(
+                candidate_embeddings or []
+            ),
             "confident_threshold": confident_threshold,
             "uncertain_threshold": uncertain_threshold,
         }
+        if gallery_id is not None:
+            request_data["gallery_id"] = gallery_id
 
         return await self._make_request("POST", "/api/ml/batch-match", request_data)
 
+    async def recognize_bytes(
+        self,
+        image_bytes: bytes,
+        gallery_id: str,
+        min_face_area_ratio: float = 0.04,
+        confident_threshold: float = 0.50,
+        return_embeddings: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Detect and match every face in an image against a registered gallery
+        in one roundtrip. Embeddings are only returned if requested.
+
+        Returns:
+            {
+                "success": bool,
+                "faces": [{
+                    "face_index": int,
+                    "location": {...},
+                    "face_area_ratio": float,
+                    "student_id": str or None,
+                    "distance": float,
+                    "status": str,  # "present" or "unknown"
+                    "runner_ups": [{"student_id": str, "min_distance": float}]
+                }],
+                "count": int,
+                "gallery_version": int,
+                "metadata": {...},
+                "error_code": "GALLERY_NOT_FOUND" (if gallery_id is unknown)
+            }
+        """
+        params = {
+            "gallery_id": gallery_id,
+            "min_face_area_ratio": min_face_area_ratio,
+            "confident_threshold": confident_threshold,
+            "return_embeddings": str(return_embeddings).lower(),
+        }
+
+        return await self._make_request(
+            "POST",
+            "/api/ml/recognize/raw",
+            content=image_bytes,
+            params=params,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+
+    async def register_gallery(
+        self, gallery_id: str, candidate_embeddings: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Create or replace a named embedding gallery held by the ML service
+
+        Returns:
+            {
+                "success": bool,
+                "gallery": {
+                    "gallery_id": str,
+                    "version": int,
+                    "num_students": int,
+                    "num_embeddings": int
+                }
+            }
+        """
+        return await self._make_request(
+            "PUT",
+            f"/api/ml/galleries/{gallery_id}",
+            {"candidate_embeddings": self._encode_candidates(candidate_embeddings)},
+        )
+
+    async def add_gallery_embeddings(
+        self,
+        gallery_id: str,
+        student_id: str,
+        embeddings: List[List[float]],
+        replace: bool = False,
+        embedding_version: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Add (or replace) one student's embeddings in a registered gallery
+
+        Returns the same shape as `register_gallery`, or
+        `{"success": False, "error_code": "GALLERY_NOT_FOUND"}`
+        """
+        request_data = {
+            "student_id": student_id,
+            "embeddings": [self._encode(e) for e in embeddings],
+            "replace": replace,
+        }
+        if embedding_version:
+            request_data["embedding_version"] = embedding_version
+
+        return await self._make_request(
+            "POST", f"/api/ml/galleries/{gallery_id}/embeddings", request_data
+        )
+
+    async def remove_gallery_student(
+        self, gallery_id: str, student_id: str
+    ) -> Dict[str, Any]:
+        """Remove one student from a registered gallery"""
+        return await self._make_request(
+            "DELETE", f"/api/ml/galleries/{gallery_id}/students/{student_id}"
+        )
+
+    async def evict_gallery(self, gallery_id: str) -> Dict[str, Any]:
+        """Drop a registered gallery from the ML service"""
+        return await self._make_request("DELETE", f"/api/ml/galleries/{gallery_id}")
+
+    async def build_index(
+        self,
+        index_id: str,
+        candidate_embeddings: Optional[List[Dict[str, Any]]] = None,
+        train: bool = True,
+        nlist: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Create or replace an ANN index for open-set identification
+
+        Returns:
+            {
+                "success": bool,
+                "index": {
+                    "index_id": str,
+                    "version": int,
+                    "num_students": int,
+                    "num_embeddings": int,
+                    "nlist": int,
+                    "trained": bool,
+                    "trained_size": int
+                }
+            }
+        """
+        request_data = {
+            "candidate_embeddings": self._encode_candidates(candidate_embeddings or []),
+            "train": train,
+            "nlist": nlist,
+        }
+
+        return await self._make_request(
+            "PUT", f"/api/ml/indexes/{index_id}", request_data
+        )
+
+    async def add_index_embeddings(
+        self,
+        index_id: str,
+        candidate_embeddings: List[Dict[str, Any]],
+        replace: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Insert students into an ANN index
+
+        Returns the same shape as `build_index`, or
+        `{"success": False, "error_code": "INDEX_NOT_FOUND"}`
+        """
+        request_data = {
+            "candidate_embeddings": self._encode_candidates(candidate_embeddings),
+            "replace": replace,
+        }
+
+        return await self._make_request(
+            "POST", f"/api/ml/indexes/{index_id}/embeddings", request_data
+        )
+
+    async def train_index(
+        self, index_id: str, nlist: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Re-cluster an ANN index after a bulk load"""
+        return await self._make_request(
+            "POST", f"/api/ml/indexes/{index_id}/train", {"nlist": nlist}
+        )
+
+    async def search_index(
+        self,
+        index_id: str,
+        embeddings: List[Any],
+        k: int = 5,
+        threshold: float = 0.50,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Top-k enrolled students for each query embedding
+
+        Returns:
+            {
+                "success": bool,
+                "results": [
+                    {
+                        "face_index": int,
+                        "student_id": str | None,
+                        "distance": float | None,
+                        "status": "present" | "unknown",
+                        "matches": [
+                            {"student_id": str, "similarity": float, "distance": float}
+                        ]
+                    }
+                ],
+                "count": int,
+                "index_version": int
+            }
+        """
+        request_data = {
+            "embeddings": [self._encode(e) for e in embeddings],
+            "k": k,
+            "threshold": threshold,
+            "nprobe": nprobe,
+            "rerank": rerank,
+        }
+
+        return await self._make_request(
+            "POST", f"/api/ml/indexes/{index_id}/search", request_data
+        )
+
+    async def remove_index_student(
+        self, index_id: str, student_id: str
+    ) -> Dict[str, Any]:
+        """Remove one student from an ANN index"""
+        return await self._make_request(
+            "DELETE", f"/api/ml/indexes/{index_id}/students/{student_id}"
+        )
+
     async def health_check(self) -> Dict[str, Any]:
         """
         Check ML service health
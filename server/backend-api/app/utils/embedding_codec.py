@@ -0,0 +1,36 @@
+"""
+Compact wire encoding for face embeddings exchanged with the ML service.
+
+Mirrors the ML service codec: an embedding is either a list of floats or a
+tagged base64 string of little-endian floats (``"f16:..."`` / ``"f32:..."``).
+"""
+
+import base64
+from typing import Any, List, Union
+
+import numpy as np
+
+ENCODING_JSON = "json"
+ENCODING_DTYPES = {"f32": np.dtype("<f4"), "f16": np.dtype("<f2")}
+
+
+def encode_embedding(value: Any, encoding: str) -> Union[List[float], str]:
+    """Encode a vector for the wire. Already-encoded strings pass through."""
+    if isinstance(value, str):
+        return value
+    dtype = ENCODING_DTYPES.get(encoding)
+    if dtype is None:
+        return np.asarray(value, dtype=float).tolist()
+    raw = np.asarray(value, dtype=dtype).tobytes()
+    return f"{encoding}:{base64.b64encode(raw).decode('ascii')}"
+
+
+def decode_embedding(value: Any) -> List[float]:
+    """Decode a wire embedding into a list of floats."""
+    if not isinstance(value, str):
+        return list(value)
+    tag, _, data = value.partition(":")
+    dtype = ENCODING_DTYPES.get(tag)
+    if dtype is None:
+        raise ValueError(f"Unknown embedding encoding '{tag}'")
+    return np.frombuffer(base64.b64decode(data), dtype=dtype).astype(float).tolist()
@@ -0,0 +1,70 @@
+"""
+Bounded per-student face embeddings.
+
+Every re-upload used to add one more, often near-identical, embedding, so a
+student's gallery rows (and their matching cost) grew without bound. A
+student now keeps at most ``FACE_MAX_EXEMPLARS`` diverse exemplars:
+
+- embeddings at least ``FACE_DUPLICATE_SIMILARITY`` similar are merged into
+  one exemplar (their normalised mean), newest first;
+- beyond the limit, exemplars are kept by farthest-point selection starting
+  from the one merging the most uploads, so the set spans the student's
+  looks (glasses, lighting) rather than repeating the common one.
+
+Documents record ``EMBEDDING_POLICY_VERSION`` so the compaction job only
+rewrites students stored under an older policy.
+"""
+
+import os
+from typing import Sequence
+
+import numpy as np
+
+EMBEDDING_POLICY_VERSION = "exemplars-v1"
+MAX_EXEMPLARS = int(os.getenv("FACE_MAX_EXEMPLARS", "5"))
+DUPLICATE_SIMILARITY = float(os.getenv("FACE_DUPLICATE_SIMILARITY", "0.97"))
+
+
+def _normalize(rows: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    return np.divide(rows, norms, out=np.zeros_like(rows), where=norms > 0)
+
+
+def aggregate_embeddings(
+    embeddings: Sequence,
+    max_exemplars: int = MAX_EXEMPLARS,
+    duplicate_similarity: float = DUPLICATE_SIMILARITY,
+) -> np.ndarray:
+    """
+    ``(k, D)`` unit exemplars, ``k <= max_exemplars``, newest first, of
+    embeddings given oldest first.
+    """
+    rows = _normalize(np.array(embeddings, dtype=np.float32, ndmin=2))
+    similarities = rows @ rows.T
+
+    # Newest first: a re-upload refreshes the exemplar it duplicates
+    members = np.zeros((len(rows), len(rows)), dtype=bool)
+    representatives = []
+    for i in reversed(range(len(rows))):
+        if representatives:
+            closest = similarities[i, representatives].argmax()
+            if similarities[i, representatives[closest]] >= duplicate_similarity:
+                members[closest, i] = True
+                continue
+        members[len(representatives), i] = True
+        representatives.append(i)
+    members = members[: len(representatives)]
+    exemplars = _normalize(members.astype(np.float32) @ rows)
+
+    max_exemplars = max(1, max_exemplars)
+    if len(exemplars) > max_exemplars:
+        exemplar_similarities = exemplars @ exemplars.T
+        selected = [int(members.sum(axis=1).argmax())]
+        closest = exemplar_similarities[selected[0]].copy()
+        for _ in range(max_exemplars - 1):
+            closest[selected] = np.inf
+            selected.append(int(closest.argmin()))
+            closest = np.maximum(closest, exemplar_similarities[selected[-1]])
+        exemplars = exemplars[sorted(selected)]
+
+    return exemplars
@@ -0,0 +1,66 @@
+"""
+Compact Mongo storage for face embeddings.
+
+An embedding is stored as a ``BinData`` value: an 8-byte header (magic,
+layout version, dtype code, dimension) followed by little-endian float16 or
+float32 values. A 9216-dim embedding takes 18 KB as float16 instead of the
+~83 KB of a BSON array of doubles. Decoding is a zero-copy
+``np.frombuffer`` view over the bytes the driver returned.
+
+Documents written before this format hold plain float arrays; every reader
+accepts both, and ``app.db.migrations`` converts them in place.
+"""
+
+import os
+import struct
+from typing import Any, Iterable, List, Sequence, Union
+
+import numpy as np
+from bson.binary import USER_DEFINED_SUBTYPE, Binary
+
+MAGIC = b"FE"
+LAYOUT_VERSION = 1
+# magic, layout version, dtype code, dimension
+_HEADER = struct.Struct("<2sBBI")
+HEADER_SIZE = _HEADER.size
+
+STORAGE_DTYPES = {"f16": (1, np.dtype("<f2")), "f32": (2, np.dtype("<f4"))}
+_DTYPES_BY_CODE = {code: dtype for code, dtype in STORAGE_DTYPES.values()}
+
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "f16")
+
+
+def pack_embedding(value: Any, dtype: str = EMBEDDING_STORAGE_DTYPE) -> Binary:
+    """Encode one embedding (list or array of floats) as a BinData value."""
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unknown embedding storage dtype '{dtype}'")
+    code, np_dtype = STORAGE_DTYPES[dtype]
+    values = np.asarray(value, dtype=np_dtype).ravel()
+    header = _HEADER.pack(MAGIC, LAYOUT_VERSION, code, len(values))
+    return Binary(header + values.tobytes(), USER_DEFINED_SUBTYPE)
+
+
+def unpack_embedding(value: Any) -> Union[np.ndarray, Sequence[float]]:
+    """
+    Decode a stored embedding.
+
+    Packed values come back as a read-only 1-D view over their bytes; legacy
+    float arrays are returned as they are.
+    """
+    if not is_packed(value):
+        return value
+
+    magic, layout, code, dim = _HEADER.unpack_from(value)
+    if magic != MAGIC or layout != LAYOUT_VERSION or code not in _DTYPES_BY_CODE:
+        raise ValueError("Not a packed face embedding")
+    return np.frombuffer(
+        value, dtype=_DTYPES_BY_CODE[code], count=dim, offset=HEADER_SIZE
+    )
+
+
+def unpack_embeddings(values: Iterable[Any]) -> List[Union[np.ndarray, Sequence]]:
+    return [unpack_embedding(value) for value in values or []]
+
+
+def is_packed(value: Any) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview))
@@ -75,6 +75,8 @@ async def db(db_client):
         "app.services.attendance_daily.db",
         "app.services.qr_service.db",
         "app.services.attendance_alerts.db",
+        "app.services.face_gallery.db",
+        "app.services.face_index.db",
         "app.services.students.db",
         "app.services.subject_service.db",
         "app.db.subjects_repo.db",
@@ -0,0 +1,28 @@
+def test_classify_faces_keeps_the_ml_assignment():
+    """Two faces compete for one student: only the ML's pick is present."""
+    from app.api.routes.attendance import _classify_faces
+
+    faces = [
+        {
+            "student_id": None,
+            "distance": 2.0,
+            "status": "unknown",
+            "runner_ups": [{"student_id": "s1", "min_distance": 0.1}],
+        },
+        {"student_id": "s1", "distance": 0.05, "status": "present"},
+        {
+            "student_id": None,
+            "distance": 2.0,
+            "status": "unknown",
+            "runner_ups": [
+                {"student_id": "s1", "min_distance": 0.3},
+                {"student_id": "s2", "min_distance": 0.55},
+            ],
+        },
+    ]
+
+    assert _classify_faces(faces) == [
+        (None, 2.0, "unknown"),
+        ("s1", 0.05, "present"),
+        ("s2", 0.55, "uncertain"),
+    ]
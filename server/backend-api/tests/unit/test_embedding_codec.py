@@ -0,0 +1,51 @@
+import numpy as np
+
+from app.utils.embedding_codec import decode_embedding, encode_embedding
+
+
+def test_f32_round_trip_is_exact():
+    values = [0.125, -0.5, 0.75, 1.0]
+    encoded = encode_embedding(values, "f32")
+    assert encoded.startswith("f32:")
+    assert decode_embedding(encoded) == values
+
+
+def test_f16_round_trip_is_close_and_smaller():
+    values = [i / 9216 for i in range(9216)]
+    encoded = encode_embedding(values, "f16")
+    decoded = decode_embedding(encoded)
+    assert len(decoded) == len(values)
+    assert max(abs(a - b) for a, b in zip(decoded, values)) < 1e-3
+    assert len(encoded) * 5 < len(str(values))
+
+
+def test_json_encoding_and_passthrough():
+    assert encode_embedding((1.0, 2.0), "json") == [1.0, 2.0]
+    assert encode_embedding("f16:AAA=", "f32") == "f16:AAA="
+    assert decode_embedding([1.0, 2.0]) == [1.0, 2.0]
+
+
+def test_packed_storage_round_trip_is_zero_copy():
+    from app.utils.embedding_storage import pack_embedding, unpack_embedding
+
+    values = [i / 9216 for i in range(9216)]
+    packed = pack_embedding(values, "f16")
+    decoded = unpack_embedding(bytes(packed))
+
+    assert len(packed) < len(values) * 2 + 16
+    assert decoded.dtype == np.float16 and not decoded.flags.owndata
+    np.testing.assert_allclose(decoded, values, atol=1e-3)
+    np.testing.assert_array_equal(
+        unpack_embedding(pack_embedding(values[:4], "f32")), np.float32(values[:4])
+    )
+
+
+def test_legacy_embeddings_pass_through_and_encode_for_the_wire():
+    from app.utils.embedding_storage import pack_embedding, unpack_embeddings
+
+    legacy = [0.125, -0.5]
+    decoded = unpack_embeddings([legacy, pack_embedding(legacy, "f32")])
+
+    assert decoded[0] is legacy
+    assert encode_embedding(decoded[1], "json") == legacy
+    assert decode_embedding(encode_embedding(decoded[1], "f32")) == legacy
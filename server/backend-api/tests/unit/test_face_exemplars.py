@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+
+from app.utils.embedding_exemplars import aggregate_embeddings
+
+
+class _AsyncCursor:
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def batch_size(self, _size):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _looks(rng, count, dim=32):
+    return rng.normal(size=(count, dim)).astype(np.float32)
+
+
+def test_near_duplicates_merge_and_exemplars_stay_bounded():
+    rng = np.random.default_rng(0)
+    looks = _looks(rng, 8)
+    uploads = [look + rng.normal(scale=0.01, size=look.shape) for look in looks]
+    # Ten re-uploads of the first look
+    uploads += [looks[0] + rng.normal(scale=0.01, size=32) for _ in range(10)]
+
+    exemplars = aggregate_embeddings(
+        uploads, max_exemplars=4, duplicate_similarity=0.97
+    )
+
+    assert exemplars.shape == (4, 32)
+    np.testing.assert_allclose(np.linalg.norm(exemplars, axis=1), 1, rtol=1e-5)
+    unit_first = looks[0] / np.linalg.norm(looks[0])
+    # The often re-uploaded look is kept, and only once
+    assert np.sum(exemplars @ unit_first > 0.97) == 1
+
+    distinct = aggregate_embeddings(looks[:3], max_exemplars=5)
+    assert len(distinct) == 3
+
+
+@pytest.mark.asyncio
+async def test_enrol_merges_into_stored_exemplars():
+    from app.services.face_exemplars import enrol_face_embedding
+    from app.utils.embedding_storage import pack_embedding
+
+    user_id = ObjectId()
+    stored = [pack_embedding([1.0, 0.0])]
+    with patch("app.services.face_exemplars.db") as mock_db:
+        mock_db.students.find_one = AsyncMock(
+            return_value={"face_embeddings": stored, "embedding_version": "v"}
+        )
+        mock_db.students.update_one = AsyncMock(
+            return_value=MagicMock(matched_count=1)
+        )
+
+        exemplars = await enrol_face_embedding(
+            user_id, [1.0, 0.001], "v", extra_fields={"verified": True}
+        )
+
+    assert len(exemplars) == 1
+    query, update = mock_db.students.update_one.await_args.args
+    assert query == {"userId": user_id, "face_embeddings": stored}
+    assert update["$set"]["verified"] is True
+    assert update["$set"]["embedding_policy"] == "exemplars-v1"
+    assert len(update["$set"]["face_embeddings"]) == 1
+    assert update["$unset"] == {"face_centroid": ""}
+
+
+@pytest.mark.asyncio
+async def test_enrol_at_the_cap_retries_when_a_racing_enrolment_wins():
+    """A full set keeps its size, so only the stored array shows the race."""
+    from app.services.face_exemplars import enrol_face_embedding
+    from app.utils.embedding_exemplars import MAX_EXEMPLARS
+    from app.utils.embedding_storage import pack_embedding
+
+    user_id = ObjectId()
+    looks = np.eye(MAX_EXEMPLARS + 2, dtype=np.float32)
+    full = [pack_embedding(look) for look in looks[:MAX_EXEMPLARS]]
+    # A racing upload replaced one exemplar: same size, different set
+    raced = full[:-1] + [pack_embedding(looks[MAX_EXEMPLARS])]
+    with patch("app.services.face_exemplars.db") as mock_db:
+        mock_db.students.find_one = AsyncMock(
+            side_effect=[
+                {"face_embeddings": full, "embedding_version": "v"},
+                {"face_embeddings": raced, "embedding_version": "v"},
+            ]
+        )
+        mock_db.students.update_one = AsyncMock(
+            side_effect=[MagicMock(matched_count=0), MagicMock(matched_count=1)]
+        )
+
+        exemplars = await enrol_face_embedding(user_id, looks[-1], "v")
+
+    assert len(exemplars) == MAX_EXEMPLARS
+    first, second = mock_db.students.update_one.await_args_list
+    assert first.args[0]["face_embeddings"] == full
+    assert second.args[0]["face_embeddings"] == raced
+    assert len(second.args[1]["$set"]["face_embeddings"]) == MAX_EXEMPLARS
+
+
+@pytest.mark.asyncio
+async def test_compaction_rewrites_old_policy_students_and_refreshes_ml():
+    from app.services.face_exemplars import compact_face_embeddings
+
+    user_id = ObjectId()
+    duplicates = [[1.0, 0.0], [1.0, 0.01], [0.999, 0.0]]
+    students = [
+        {"_id": ObjectId(), "userId": user_id, "face_embeddings": duplicates},
+        {"_id": ObjectId(), "userId": ObjectId(), "face_embeddings": [[0.0, 1.0]]},
+    ]
+
+    with patch("app.services.face_exemplars.db") as mock_db, patch(
+        "app.services.face_exemplars.face_gallery"
+    ) as mock_gallery, patch(
+        "app.services.face_exemplars.face_index"
+    ) as mock_index:
+        mock_db.students.find.return_value = _AsyncCursor(students)
+        mock_db.students.bulk_write = AsyncMock(
+            return_value=MagicMock(modified_count=2)
+        )
+        mock_gallery.push_student_embeddings = AsyncMock()
+        mock_index.replace_student_embeddings = AsyncMock()
+
+        result = await compact_face_embeddings(batch_size=10)
+
+    assert result == {"scanned": 2, "compacted": 2, "removed": 2}
+    operations = mock_db.students.bulk_write.await_args.args[0]
+    assert operations[0]._filter["face_embeddings"] == duplicates
+    assert len(operations[0]._doc["$set"]["face_embeddings"]) == 1
+    # Only the student whose set shrank is re-sent to the ML service
+    mock_gallery.push_student_embeddings.assert_awaited_once()
+    assert mock_gallery.push_student_embeddings.await_args.args[0] == user_id
+    mock_index.replace_student_embeddings.assert_awaited_once()
@@ -0,0 +1,79 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+
+
+@pytest.mark.asyncio
+async def test_recognize_subject_uses_registered_gallery():
+    """A known gallery is matched without touching Mongo."""
+    from app.services.face_gallery import recognize_subject
+
+    response = {"success": True, "faces": [], "gallery_version": 3}
+
+    with patch("app.services.face_gallery.ml_client") as mock_client, patch(
+        "app.services.face_gallery.db"
+    ) as mock_db:
+        mock_client.recognize_bytes = AsyncMock(return_value=response)
+        mock_client.register_gallery = AsyncMock()
+
+        result = await recognize_subject("subject1", [ObjectId()], b"jpeg", 0.04, 0.5)
+
+    assert result == response
+    mock_client.register_gallery.assert_not_called()
+    mock_db.students.find.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_recognize_subject_registers_missing_gallery():
+    """An unknown gallery is loaded from Mongo, registered and retried."""
+    from app.services.face_gallery import recognize_subject
+
+    user_id = ObjectId()
+    students = [{"userId": user_id, "face_embeddings": [[0.1, 0.2]]}]
+    mock_cursor = MagicMock()
+    mock_cursor.to_list = AsyncMock(return_value=students)
+
+    with patch("app.services.face_gallery.ml_client") as mock_client, patch(
+        "app.services.face_gallery.db"
+    ) as mock_db:
+        mock_db.students.find.return_value = mock_cursor
+        mock_client.recognize_bytes = AsyncMock(
+            side_effect=[
+                {"success": False, "error_code": "GALLERY_NOT_FOUND"},
+                {"success": True, "faces": []},
+            ]
+        )
+        mock_client.register_gallery = AsyncMock(return_value={"success": True})
+
+        result = await recognize_subject("subject1", [user_id], b"jpeg", 0.04, 0.5)
+
+    assert result["success"] is True
+    assert mock_client.recognize_bytes.await_count == 2
+    mock_client.register_gallery.assert_awaited_once_with(
+        "subject1",
+        [{"student_id": str(user_id), "embeddings": [[0.1, 0.2]]}],
+    )
+
+
+@pytest.mark.asyncio
+async def test_load_subject_candidates_sends_stored_embedding_version():
+    from app.services.face_gallery import load_subject_candidates
+
+    legacy, projected = ObjectId(), ObjectId()
+    students = [
+        {"userId": legacy, "face_embeddings": [[0.1, 0.2]]},
+        {
+            "userId": projected,
+            "face_embeddings": [[0.3, 0.4]],
+            "embedding_version": "pca256-v1",
+        },
+    ]
+    mock_cursor = MagicMock()
+    mock_cursor.to_list = AsyncMock(return_value=students)
+
+    with patch("app.services.face_gallery.db") as mock_db:
+        mock_db.students.find.return_value = mock_cursor
+        candidates = await load_subject_candidates([legacy, projected])
+
+    assert "embedding_version" not in candidates[0]
+    assert candidates[1]["embedding_version"] == "pca256-v1"
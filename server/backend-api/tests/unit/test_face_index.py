@@ -0,0 +1,178 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from bson import ObjectId
+
+
+class _AsyncCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def batch_size(self, _size):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+@pytest.mark.asyncio
+async def test_rebuild_student_index_pages_students_then_trains():
+    from app.services import face_index
+
+    students = [
+        {"userId": ObjectId(), "face_embeddings": [[0.1 * i, 0.2]]} for i in range(5)
+    ]
+
+    with patch("app.services.face_index.ml_client") as mock_client, patch(
+        "app.services.face_index.db"
+    ) as mock_db, patch.object(face_index, "SYNC_PAGE_SIZE", 2):
+        mock_db.students.find.return_value = _AsyncCursor(students)
+        mock_client.build_index = AsyncMock(return_value={"success": True})
+        mock_client.add_index_embeddings = AsyncMock(return_value={"success": True})
+        mock_client.train_index = AsyncMock(
+            return_value={"success": True, "index": {"num_students": 5, "nlist": 2}}
+        )
+
+        result = await face_index.rebuild_student_index()
+
+    assert result["success"] is True
+    mock_client.build_index.assert_awaited_once_with("students", train=False)
+    pages = [c.args[1] for c in mock_client.add_index_embeddings.await_args_list]
+    assert [len(p) for p in pages] == [2, 2, 1]
+    assert pages[0][0]["student_id"] == str(students[0]["userId"])
+    mock_client.train_index.assert_awaited_once_with("students")
+
+
+@pytest.mark.asyncio
+async def test_rebuild_student_index_fails_when_a_page_fails(caplog):
+    from app.services import face_index
+
+    students = [
+        {"userId": ObjectId(), "face_embeddings": [[0.1 * i, 0.2]]} for i in range(3)
+    ]
+
+    with patch("app.services.face_index.ml_client") as mock_client, patch(
+        "app.services.face_index.db"
+    ) as mock_db, patch.object(face_index, "SYNC_PAGE_SIZE", 2):
+        mock_db.students.find.return_value = _AsyncCursor(students)
+        mock_client.build_index = AsyncMock(return_value={"success": True})
+        mock_client.add_index_embeddings = AsyncMock(
+            side_effect=[
+                {"success": False, "error": "boom"},
+                {"success": True, "skipped": [str(students[2]["userId"])]},
+            ]
+        )
+        mock_client.train_index = AsyncMock(
+            return_value={"success": True, "index": {"num_students": 1, "nlist": 1}}
+        )
+
+        result = await face_index.rebuild_student_index()
+
+    assert result["success"] is False
+    assert "2 students" in result["error"]
+    # Students on another embedding version are reported, not silently lost
+    assert str(students[2]["userId"]) in caplog.text
+    # The students that were added are still searchable
+    mock_client.train_index.assert_awaited_once_with("students")
+
+
+@pytest.mark.asyncio
+async def test_identify_faces_builds_missing_index_and_retries():
+    from app.services import face_index
+
+    with patch("app.services.face_index.ml_client") as mock_client, patch.object(
+        face_index, "rebuild_student_index", AsyncMock(return_value={"success": True})
+    ) as mock_rebuild:
+        mock_client.search_index = AsyncMock(
+            side_effect=[
+                {"success": False, "error_code": "INDEX_NOT_FOUND"},
+                {"success": True, "results": []},
+            ]
+        )
+
+        result = await face_index.identify_faces([[1.0, 0.0]])
+
+    assert result["success"] is True
+    mock_rebuild.assert_awaited_once()
+    assert mock_client.search_index.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_recognize_roster_assigns_roster_students_once():
+    from app.services import face_index
+
+    roster = [ObjectId(), ObjectId()]
+    a, b = str(roster[0]), str(roster[1])
+    faces = [
+        {"embedding": "f32:AA==", "location": {"top": i}, "face_area_ratio": 0.1}
+        for i in range(3)
+    ]
+
+    def hits(*pairs):
+        return [{"student_id": sid, "similarity": sim} for sid, sim in pairs]
+
+    results = [
+        {"face_index": 0, "matches": hits(("outsider", 0.99), (a, 0.8))},
+        {"face_index": 1, "matches": hits((a, 0.9), (b, 0.7))},
+        {"face_index": 2, "matches": hits((b, 0.6), (a, 0.85))},
+    ]
+
+    with patch("app.services.face_index.ml_client") as mock_client, patch.object(
+        face_index,
+        "identify_faces",
+        AsyncMock(return_value={"success": True, "results": results}),
+    ):
+        mock_client.detect_faces_bytes = AsyncMock(
+            return_value={"success": True, "faces": faces}
+        )
+
+        response = await face_index.recognize_roster(roster, b"jpeg", 0.04, 0.5)
+
+    matched = [(f["student_id"], f["status"]) for f in response["faces"]]
+    # a goes to its closest face; face 0 only matches a student off the roster
+    assert matched == [(None, "unknown"), (a, "present"), (b, "present")]
+    # Unassigned, but its real distance to the closest roster student, a
+    assert response["faces"][0]["distance"] == pytest.approx(0.2)
+    assert response["faces"][2]["distance"] == pytest.approx(0.4)
+    # Runner-ups are the other roster students, in the gallery path's shape
+    [runner_up] = response["faces"][0]["runner_ups"]
+    assert runner_up["student_id"] == a
+    assert runner_up["min_distance"] == pytest.approx(0.2)
+    assert [r["student_id"] for r in response["faces"][2]["runner_ups"]] == [a]
+
+
+@pytest.mark.asyncio
+async def test_refresh_student_index_retrains_existing_index():
+    from app.services import face_index
+
+    with patch("app.services.face_index.ml_client") as mock_client, patch.object(
+        face_index, "rebuild_student_index", AsyncMock()
+    ) as mock_rebuild:
+        mock_client.train_index = AsyncMock(return_value={"success": True})
+
+        await face_index.refresh_student_index()
+
+    mock_client.train_index.assert_awaited_once_with("students")
+    mock_rebuild.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_replace_student_embeddings_swallows_ml_errors():
+    from app.services.face_index import replace_student_embeddings
+
+    with patch("app.services.face_index.ml_client") as mock_client:
+        mock_client.add_index_embeddings = AsyncMock(side_effect=Exception("down"))
+
+        await replace_student_embeddings("student1", [[0.1, 0.2]])
+
+    mock_client.add_index_embeddings.assert_awaited_once_with(
+        "students",
+        [{"student_id": "student1", "embeddings": [[0.1, 0.2]]}],
+        replace=True,
+    )
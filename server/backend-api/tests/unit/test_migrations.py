@@ -0,0 +1,47 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+
+
+class _AsyncCursor:
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def batch_size(self, _size):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+@pytest.mark.asyncio
+async def test_migrate_face_embeddings_packs_legacy_arrays():
+    from app.db.migrations import migrate_face_embeddings
+    from app.utils.embedding_storage import is_packed, pack_embedding
+
+    already_packed = pack_embedding([0.5, 0.5])
+    students = [
+        {"_id": ObjectId(), "face_embeddings": [[0.1, 0.2], already_packed]},
+        {"_id": ObjectId(), "face_embeddings": [[0.3, 0.4]]},
+    ]
+
+    with patch("app.db.migrations.db") as mock_db:
+        mock_db.students.find.return_value = _AsyncCursor(students)
+        mock_db.students.bulk_write = AsyncMock(
+            return_value=MagicMock(modified_count=2)
+        )
+
+        result = await migrate_face_embeddings(batch_size=10)
+
+    assert result == {"scanned": 2, "converted": 2}
+    operations = mock_db.students.bulk_write.await_args.args[0]
+    first = operations[0]._doc["$set"]["face_embeddings"]
+    assert all(is_packed(e) for e in first)
+    assert first[1] is already_packed
+    assert operations[0]._filter["face_embeddings"] == [[0.1, 0.2], already_packed]
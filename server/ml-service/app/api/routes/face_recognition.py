@@ -1,15 +1,18 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Query, Request
+import asyncio
 import base64
-from io import BytesIO
 import time
+from typing import Dict, List, Optional, Tuple
+
 import numpy as np
-from PIL import Image
 
 from app.schemas.requests import (
     EncodeFaceRequest,
     DetectFacesRequest,
     MatchFacesRequest,
     BatchMatchRequest,
+    CandidateEmbedding,
+    RecognizeRequest,
 )
 from app.schemas.responses import (
     EncodeFaceResponse,
@@ -20,163 +23,745 @@ from app.schemas.responses import (
     EncodeFaceMetadata,
     DetectedFaceInfo,
     DetectFacesMetadata,
+    FaceQualityInfo,
+    LowQualityFace,
     MatchResult,
     DistanceInfo,
     BatchMatchResult,
+    RecognizedFace,
+    RecognizeResponse,
 )
 from app.core.constants import (
     ERROR_NO_FACE,
     ERROR_MULTIPLE_FACES,
     ERROR_FACE_TOO_SMALL,
+    ERROR_LOW_QUALITY,
+    ERROR_INVALID_IMAGE,
     ERROR_PROCESSING,
+    ERROR_GALLERY_NOT_FOUND,
+    ERROR_EMBEDDING_VERSION,
+    DEFAULT_MIN_FACE_AREA_RATIO,
+    DEFAULT_NUM_JITTERS,
+    DEFAULT_MODEL,
+    ENCODING_MIN_FACE_AREA_RATIO,
+    ENCODING_NUM_JITTERS,
+    CONFIDENT_THRESHOLD,
+    DEFAULT_RUNNER_UPS,
+)
+from app.core.config import settings
+from app.core.metrics import (
+    FACE_DETECTION_ACCURACY,
+    FACES_DETECTED_TOTAL,
+    ML_ERRORS,
+    ML_FACES_LOW_QUALITY,
 )
+from app.core.result_cache import image_key, result_cache
 from app.core.security import verify_api_key
-
-from app.ml.face_detector import detect_faces
-from app.ml.face_encoder import get_face_embedding
-from app.ml.face_matcher import cosine_similarity
+from app.core.stage_timing import (
+    STAGE_BASE64_DECODE,
+    STAGE_CROP,
+    STAGE_DETECT,
+    STAGE_EMBED,
+    STAGE_IMAGE_DECODE,
+    STAGE_MATCH,
+    STAGE_QUALITY,
+    TimedRoute,
+    record_stages,
+    stage,
+)
+from app.core.worker_pool import worker_pool
+from app.utils.embedding_codec import negotiate_embedding_encoding
+from app.utils.image_utils import decode_image, to_original_box
+
+from app.ml.face_detector import detect_faces_scored
+from app.ml.batcher import embedding_batcher, match_batcher
+from app.ml.face_encoder import (
+    MAX_JITTERS,
+    average_jitters,
+    crop_faces,
+    embed_jittered,
+    jitter_count,
+    jitter_crops,
+)
+from app.ml.face_quality import QUALITY_OFF, QUALITY_SKIP, score_crops
+from app.ml.face_matcher import GalleryMatrix
+from app.ml.projection import (
+    EmbeddingVersionError,
+    conform_candidates,
+    conform_embeddings,
+    current_embedding_dim,
+    current_embedding_version,
+)
+from app.ml.gallery_store import gallery_store
 
 router = APIRouter(
-    prefix="/api/ml", tags=["ML"], dependencies=[Depends(verify_api_key)]
+    prefix="/api/ml",
+    tags=["ML"],
+    dependencies=[Depends(verify_api_key), Depends(negotiate_embedding_encoding)],
+    route_class=TimedRoute,
 )
 
 
-@router.post("/encode-face", response_model=EncodeFaceResponse)
-async def encode_face(request: EncodeFaceRequest):
+RAW_IMAGE_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/octet-stream": {
+                "schema": {"type": "string", "format": "binary"}
+            },
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            },
+        },
+    }
+}
+
+
+async def read_image_upload(request: Request) -> bytes:
+    """Image bytes from a multipart ``file`` field or a raw request body."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            return b""
+        return await upload.read()
+    return await request.body()
+
+
+def _assess_crops(crops, boxes, confidences) -> List[Optional[FaceQualityInfo]]:
+    """Quality of each crop, all ``None`` when ``ML_FACE_QUALITY`` is off."""
+    if settings.ML_FACE_QUALITY == QUALITY_OFF:
+        return [None] * len(crops)
+
+    quality = score_crops(crops, boxes, confidences)
+    acceptable = quality.acceptable
+    return [
+        FaceQualityInfo(
+            sharpness=float(quality.sharpness[i]),
+            brightness=float(quality.brightness[i]),
+            size_px=int(quality.size[i]),
+            confidence=float(quality.confidence[i]),
+            issues=[name for name, failed in quality.failures.items() if failed[i]],
+            acceptable=bool(acceptable[i]),
+        )
+        for i in range(len(crops))
+    ]
+
+
+def _is_skipped(quality: Optional[FaceQualityInfo]) -> bool:
+    return (
+        quality is not None
+        and not quality.acceptable
+        and settings.ML_FACE_QUALITY == QUALITY_SKIP
+    )
+
+
+def _record_quality(qualities) -> None:
+    # Counted here, on the request's process, not on the pipeline worker
+    for quality in qualities:
+        for issue in quality.issues if quality is not None else []:
+            ML_FACES_LOW_QUALITY.labels(reason=issue).inc()
+
+
+def _mean_confidence(confidences) -> Optional[float]:
+    return float(np.mean(confidences)) if len(confidences) else None
+
+
+def _record_detection(confidence: Optional[float]) -> None:
+    # Set here, on the request's process, not on the pipeline worker
+    if confidence is not None:
+        FACE_DETECTION_ACCURACY.set(confidence)
+
+
+def _encode_face_image(
+    image_bytes: bytes,
+    validate_single: bool,
+    min_face_area_ratio: float,
+    num_jitters: int = ENCODING_NUM_JITTERS,
+) -> Tuple[EncodeFaceResponse, Optional[float], Dict[str, float]]:
+    """
+    Runs on a worker; returns the response, the mean detection confidence
+    (``None`` when detection was not reached) and the stage durations.
+    """
+    durations: Dict[str, float] = {}
+    confidence = None
     try:
-        image_bytes = base64.b64decode(request.image_base64)
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
-        image_np = np.array(image)
+        with stage(STAGE_IMAGE_DECODE, durations):
+            decoded = decode_image(image_bytes)
+        image_np = decoded.pixels
 
-        faces = detect_faces(image_np)
+        with stage(STAGE_DETECT, durations):
+            faces, confidences = detect_faces_scored(image_np)
+        confidence = _mean_confidence(confidences)
 
         if not faces:
-            return EncodeFaceResponse(
-                success=False, error="No face detected", error_code=ERROR_NO_FACE
+            return (
+                EncodeFaceResponse(
+                    success=False, error="No face detected", error_code=ERROR_NO_FACE
+                ),
+                confidence,
+                durations,
             )
 
-        if request.validate_single and len(faces) > 1:
-            return EncodeFaceResponse(
-                success=False,
-                error="Multiple faces detected",
-                error_code=ERROR_MULTIPLE_FACES,
+        if validate_single and len(faces) > 1:
+            return (
+                EncodeFaceResponse(
+                    success=False,
+                    error="Multiple faces detected",
+                    error_code=ERROR_MULTIPLE_FACES,
+                ),
+                confidence,
+                durations,
             )
 
-        x, y, face_w, face_h = faces[0]
-        top = y
-        right = x + face_w
-        bottom = y + face_h
-        left = x
+        _, _, face_w, face_h = faces[0]
 
         im_h, im_w, _ = image_np.shape
         face_area = face_w * face_h
         image_area = im_h * im_w
 
-        if (face_area / image_area) < request.min_face_area_ratio:
-            return EncodeFaceResponse(
-                success=False, error="Face too small", error_code=ERROR_FACE_TOO_SMALL
+        if (face_area / image_area) < min_face_area_ratio:
+            return (
+                EncodeFaceResponse(
+                    success=False,
+                    error="Face too small",
+                    error_code=ERROR_FACE_TOO_SMALL,
+                ),
+                confidence,
+                durations,
             )
 
-        face_img = image_np[top:bottom, left:right]
-        embedding = get_face_embedding(face_img)
+        with stage(STAGE_CROP, durations):
+            crops = crop_faces(image_np, faces[:1])
+        with stage(STAGE_QUALITY, durations):
+            quality = _assess_crops(crops, faces[:1], confidences[:1])[0]
+
+        x, y, face_w, face_h = to_original_box(faces[0], decoded.scale)
+        face_location = FaceLocation(top=y, right=x + face_w, bottom=y + face_h, left=x)
+        metadata = EncodeFaceMetadata(
+            face_area_ratio=face_area / image_area,
+            image_dimensions=list(decoded.original_size),
+            quality=quality,
+        )
 
-        return EncodeFaceResponse(
-            success=True,
-            embedding=embedding,
-            face_location=FaceLocation(top=top, right=right, bottom=bottom, left=left),
-            metadata=EncodeFaceMetadata(
-                face_area_ratio=face_area / image_area, image_dimensions=[im_w, im_h]
+        if _is_skipped(quality):
+            return (
+                EncodeFaceResponse(
+                    success=False,
+                    error=f"Face image quality too low: {', '.join(quality.issues)}",
+                    error_code=ERROR_LOW_QUALITY,
+                    face_location=face_location,
+                    metadata=metadata,
+                ),
+                confidence,
+                durations,
+            )
+
+        with stage(STAGE_EMBED, durations):
+            embedding = embed_jittered(crops, num_jitters)[0]
+
+        return (
+            EncodeFaceResponse(
+                success=True,
+                embedding=embedding,
+                embedding_version=current_embedding_version(),
+                face_location=face_location,
+                metadata=metadata,
             ),
+            confidence,
+            durations,
         )
 
     except Exception as e:
-        return EncodeFaceResponse(
-            success=False, error=str(e), error_code=ERROR_PROCESSING
+        return (
+            EncodeFaceResponse(
+                success=False, error=str(e), error_code=ERROR_PROCESSING
+            ),
+            confidence,
+            durations,
         )
 
 
-@router.post("/detect-faces", response_model=DetectFacesResponse)
-async def detect_faces_api(request: DetectFacesRequest):
-    start = time.time()
-
-    try:
-        image_bytes = base64.b64decode(request.image_base64)
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
-        image_np = np.array(image)
+def _is_cacheable(response) -> bool:
+    """Deterministic outcomes only; processing errors may be transient."""
+    return response.error_code != ERROR_PROCESSING
 
-        faces = detect_faces(image_np)
-        h, w, _ = image_np.shape
-        image_area = h * w
 
-        detected = []
-        for x, y, cw, ch in faces:
-            # Convert to TRBL
-            top = y
-            left = x
-            bottom = y + ch
-            right = x + cw
+async def _encode_face_cached(
+    image_bytes: bytes,
+    validate_single: bool,
+    min_face_area_ratio: float,
+    num_jitters: int,
+    idempotency_key: Optional[str],
+) -> EncodeFaceResponse:
 
-            face_area = cw * ch
-
-            if face_area / image_area < request.min_face_area_ratio:
-                continue
+    async def compute():
+        response, confidence, durations = await worker_pool.run(
+            _encode_face_image,
+            image_bytes,
+            validate_single,
+            min_face_area_ratio,
+            num_jitters,
+        )
+        record_stages(durations)
+        _record_detection(confidence)
+        if response.error_code == ERROR_PROCESSING:
+            ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        if response.metadata is not None:
+            _record_quality([response.metadata.quality])
+        return response
+
+    return await result_cache.get_or_compute(
+        "encode",
+        (
+            image_key(image_bytes, idempotency_key),
+            validate_single,
+            min_face_area_ratio,
+            jitter_count(num_jitters),
+        ),
+        compute,
+        cacheable=_is_cacheable,
+    )
+
+
+def _detect_and_crop(
+    image_bytes: bytes, min_face_area_ratio: float, model: str, num_jitters: int = 1
+):
+    """
+    Decode, detect and crop every face large enough to keep.
+
+    Returns ``(faces, low_quality, crops, [width, height], confidence,
+    durations)`` where ``faces`` holds ``(FaceLocation, face_area_ratio,
+    quality)`` triples, ``crops`` their (N * K, 96, 96) stack of K
+    `jitter_crops` each, ready for embedding, ``low_quality`` the faces
+    skipped for their quality (see `app.ml.face_quality`), ``confidence``
+    the mean detector score of the image's faces (``None`` without any) and
+    ``durations`` the time spent in each stage.
+    """
+    durations: Dict[str, float] = {}
+    with stage(STAGE_IMAGE_DECODE, durations):
+        decoded = decode_image(image_bytes)
+    image_np = decoded.pixels
+
+    with stage(STAGE_DETECT, durations):
+        faces, confidences = detect_faces_scored(image_np, model)
+    h, w, _ = image_np.shape
+    image_area = h * w
+
+    kept = []
+    boxes = []
+    scores = []
+    for box, confidence in zip(faces, confidences):
+        _, _, cw, ch = box
+        face_area = cw * ch
+
+        if face_area / image_area < min_face_area_ratio:
+            continue
+
+        boxes.append(box)
+        scores.append(confidence)
+
+        # Convert to TRBL in original-image pixels
+        x, y, cw, ch = to_original_box(box, decoded.scale)
+        kept.append(
+            (
+                FaceLocation(top=y, right=x + cw, bottom=y + ch, left=x),
+                face_area / image_area,
+            )
+        )
 
-            face_img = image_np[top:bottom, left:right]
-            embedding = get_face_embedding(face_img)
+    with stage(STAGE_CROP, durations):
+        crops = crop_faces(image_np, boxes)
+    with stage(STAGE_QUALITY, durations):
+        qualities = _assess_crops(crops, boxes, scores)
+
+    kept = [face + (quality,) for face, quality in zip(kept, qualities)]
+    skipped = np.array([_is_skipped(quality) for quality in qualities], dtype=bool)
+    low_quality = [face for face, skip in zip(kept, skipped) if skip]
+    kept = [face for face, skip in zip(kept, skipped) if not skip]
+    crops = crops[~skipped]
+    if jitter_count(num_jitters) > 1:
+        with stage(STAGE_CROP, durations):
+            crops = jitter_crops(crops, num_jitters)
+    return (
+        kept,
+        low_quality,
+        crops,
+        list(decoded.original_size),
+        _mean_confidence(confidences),
+        durations,
+    )
+
+
+async def _detect_and_embed_uncached(
+    image_bytes: bytes, min_face_area_ratio: float, model: str, num_jitters: int
+):
+    (
+        faces,
+        low_quality,
+        crops,
+        dimensions,
+        confidence,
+        durations,
+    ) = await worker_pool.run(
+        _detect_and_crop, image_bytes, min_face_area_ratio, model, num_jitters
+    )
+    record_stages(durations)
+    _record_detection(confidence)
+    FACES_DETECTED_TOTAL.inc(len(faces) + len(low_quality))
+    _record_quality(quality for _, _, quality in faces + low_quality)
+    if not faces:
+        embeddings = np.zeros((0, current_embedding_dim()), dtype=np.float32)
+    else:
+        with stage(STAGE_EMBED):
+            embeddings = await embedding_batcher.submit(crops)
+            if jitter_count(num_jitters) > 1:
+                embeddings = average_jitters(embeddings, num_jitters)
+    # Shared by every cache hit
+    embeddings.flags.writeable = False
+    return faces, low_quality, embeddings, dimensions
+
+
+async def _detect_and_embed(
+    image_bytes: bytes,
+    min_face_area_ratio: float,
+    model: str = DEFAULT_MODEL,
+    idempotency_key: Optional[str] = None,
+    num_jitters: int = 1,
+):
+    """
+    `_detect_and_crop` on a worker, then a (micro-batched) embedding pass
+    of the faces not skipped for their quality. ``num_jitters`` above 1
+    averages each face over that many jitters.
+
+    Results are cached, so a resent image (or ``Idempotency-Key``) is not
+    processed again.
+    """
+    num_jitters = jitter_count(num_jitters)
+    return await result_cache.get_or_compute(
+        "detect",
+        (
+            image_key(image_bytes, idempotency_key),
+            min_face_area_ratio,
+            model,
+            num_jitters,
+        ),
+        lambda: _detect_and_embed_uncached(
+            image_bytes, min_face_area_ratio, model, num_jitters
+        ),
+    )
+
+
+def _low_quality_faces(low_quality) -> List[LowQualityFace]:
+    return [
+        LowQualityFace(location=location, face_area_ratio=ratio, quality=quality)
+        for location, ratio, quality in low_quality
+    ]
+
+
+async def _detect_faces_image(
+    image_bytes: bytes,
+    min_face_area_ratio: float,
+    model: str,
+    start: float,
+    idempotency_key: Optional[str] = None,
+    num_jitters: int = DEFAULT_NUM_JITTERS,
+) -> DetectFacesResponse:
+    try:
+        faces, low_quality, embeddings, dimensions = await _detect_and_embed(
+            image_bytes, min_face_area_ratio, model, idempotency_key, num_jitters
+        )
 
-            detected.append(
-                DetectedFaceInfo(
-                    embedding=embedding,
-                    location=FaceLocation(
-                        top=top, right=right, bottom=bottom, left=left
-                    ),
-                    face_area_ratio=face_area / image_area,
-                )
+        detected = [
+            DetectedFaceInfo(
+                embedding=embedding,
+                location=location,
+                face_area_ratio=ratio,
+                quality=quality,
             )
+            for (location, ratio, quality), embedding in zip(faces, embeddings)
+        ]
 
         return DetectFacesResponse(
             success=True,
             faces=detected,
             count=len(detected),
+            low_quality_faces=_low_quality_faces(low_quality),
+            embedding_version=current_embedding_version(),
             metadata=DetectFacesMetadata(
-                image_dimensions=[w, h], processing_time_ms=(time.time() - start) * 1000
+                image_dimensions=dimensions,
+                processing_time_ms=(time.time() - start) * 1000,
             ),
         )
 
     except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
         return DetectFacesResponse(success=False, error=str(e))
 
 
+def _resolve_gallery(
+    gallery_id: Optional[str], candidate_embeddings: List[CandidateEmbedding]
+) -> Tuple[Optional[GalleryMatrix], Optional[int]]:
+    """Registered gallery (and its version) or one built from the candidates.
+
+    Returns ``(None, None)`` when ``gallery_id`` is not registered.
+    """
+    if gallery_id is None:
+        with stage(STAGE_MATCH):
+            gallery = GalleryMatrix.from_candidates(
+                conform_candidates(candidate_embeddings)
+            )
+        return gallery, None
+
+    registered = gallery_store.get(gallery_id)
+    if registered is None:
+        return None, None
+    return registered.matrix, registered.version
+
+
+async def _match_embeddings(
+    gallery: GalleryMatrix,
+    embeddings: List,
+    confident_threshold: float,
+    shared: bool = False,
+    runner_ups: int = 0,
+) -> List[BatchMatchResult]:
+    """
+    Match the faces of one photo to distinct students, with runner-ups.
+    Scoring against a shared (registered) gallery is micro-batched with
+    concurrent requests for the same gallery.
+    """
+    queries = np.array(embeddings, dtype=np.float32, ndmin=2)
+    if len(embeddings) == 0:
+        return []
+    if shared and len(gallery):
+        if queries.shape[1] != gallery.matrix.shape[1]:
+            raise ValueError(
+                f"Embedding dimension {queries.shape[1]} does not match "
+                f"gallery dimension {gallery.matrix.shape[1]}"
+            )
+        with stage(STAGE_MATCH):
+            scores = await match_batcher.submit(queries, key=gallery)
+            assignment = gallery.assign_scores(scores, confident_threshold, runner_ups)
+    else:
+        with stage(STAGE_MATCH):
+            assignment = await asyncio.to_thread(
+                gallery.assign, queries, confident_threshold, runner_ups
+            )
+
+    return [
+        BatchMatchResult(
+            face_index=idx,
+            student_id=student_id,
+            distance=1 - float(score),
+            status="present" if student_id is not None else "unknown",
+            runner_ups=[
+                DistanceInfo(student_id=other_id, min_distance=1 - other_score)
+                for other_id, other_score in others
+            ],
+        )
+        for idx, (student_id, score, others) in enumerate(zip(*assignment))
+    ]
+
+
+async def _recognize_image(
+    image_bytes: bytes,
+    gallery_id: Optional[str],
+    candidate_embeddings: List[CandidateEmbedding],
+    min_face_area_ratio: float,
+    confident_threshold: float,
+    return_embeddings: bool,
+    model: str,
+    start: float,
+    idempotency_key: Optional[str] = None,
+    runner_ups: int = DEFAULT_RUNNER_UPS,
+) -> RecognizeResponse:
+    try:
+        gallery, gallery_version = _resolve_gallery(gallery_id, candidate_embeddings)
+        if gallery is None:
+            return RecognizeResponse(
+                success=False,
+                error=f"Gallery '{gallery_id}' not found",
+                error_code=ERROR_GALLERY_NOT_FOUND,
+            )
+
+        faces, low_quality, embeddings, dimensions = await _detect_and_embed(
+            image_bytes, min_face_area_ratio, model, idempotency_key
+        )
+        matches = await _match_embeddings(
+            gallery,
+            embeddings,
+            confident_threshold,
+            shared=gallery_version is not None,
+            runner_ups=runner_ups,
+        )
+
+        recognized = [
+            RecognizedFace(
+                face_index=match.face_index,
+                location=location,
+                face_area_ratio=ratio,
+                student_id=match.student_id,
+                distance=match.distance,
+                status=match.status,
+                runner_ups=match.runner_ups,
+                embedding=embedding if return_embeddings else None,
+                quality=quality,
+            )
+            for (location, ratio, quality), embedding, match in zip(
+                faces, embeddings, matches
+            )
+        ]
+
+        return RecognizeResponse(
+            success=True,
+            faces=recognized,
+            count=len(recognized),
+            low_quality_faces=_low_quality_faces(low_quality),
+            gallery_version=gallery_version,
+            embedding_version=current_embedding_version(),
+            metadata=DetectFacesMetadata(
+                image_dimensions=dimensions,
+                processing_time_ms=(time.time() - start) * 1000,
+            ),
+        )
+
+    except EmbeddingVersionError as e:
+        ML_ERRORS.labels(error_type=ERROR_EMBEDDING_VERSION).inc()
+        return RecognizeResponse(
+            success=False, error=str(e), error_code=ERROR_EMBEDDING_VERSION
+        )
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        return RecognizeResponse(
+            success=False, error=str(e), error_code=ERROR_PROCESSING
+        )
+
+
+@router.post("/encode-face", response_model=EncodeFaceResponse)
+async def encode_face(
+    request: EncodeFaceRequest, idempotency_key: Optional[str] = Header(None)
+):
+    try:
+        with stage(STAGE_BASE64_DECODE):
+            image_bytes = base64.b64decode(request.image_base64)
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_INVALID_IMAGE).inc()
+        return EncodeFaceResponse(
+            success=False, error=str(e), error_code=ERROR_INVALID_IMAGE
+        )
+
+    return await _encode_face_cached(
+        image_bytes,
+        request.validate_single,
+        request.min_face_area_ratio,
+        request.num_jitters,
+        idempotency_key,
+    )
+
+
+@router.post(
+    "/encode-face/raw",
+    response_model=EncodeFaceResponse,
+    openapi_extra=RAW_IMAGE_OPENAPI,
+)
+async def encode_face_raw(
+    request: Request,
+    validate_single: bool = True,
+    min_face_area_ratio: float = ENCODING_MIN_FACE_AREA_RATIO,
+    num_jitters: int = Query(ENCODING_NUM_JITTERS, ge=1, le=MAX_JITTERS),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """encode-face taking the image as a raw body or multipart ``file``."""
+    image_bytes = await read_image_upload(request)
+    if not image_bytes:
+        return EncodeFaceResponse(
+            success=False, error="Empty image upload", error_code=ERROR_INVALID_IMAGE
+        )
+
+    return await _encode_face_cached(
+        image_bytes, validate_single, min_face_area_ratio, num_jitters, idempotency_key
+    )
+
+
+@router.post("/detect-faces", response_model=DetectFacesResponse)
+async def detect_faces_api(
+    request: DetectFacesRequest, idempotency_key: Optional[str] = Header(None)
+):
+    start = time.time()
+
+    try:
+        with stage(STAGE_BASE64_DECODE):
+            image_bytes = base64.b64decode(request.image_base64)
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_INVALID_IMAGE).inc()
+        return DetectFacesResponse(success=False, error=str(e))
+
+    return await _detect_faces_image(
+        image_bytes,
+        request.min_face_area_ratio,
+        request.model,
+        start,
+        idempotency_key,
+        request.num_jitters,
+    )
+
+
+@router.post(
+    "/detect-faces/raw",
+    response_model=DetectFacesResponse,
+    openapi_extra=RAW_IMAGE_OPENAPI,
+)
+async def detect_faces_raw(
+    request: Request,
+    min_face_area_ratio: float = DEFAULT_MIN_FACE_AREA_RATIO,
+    num_jitters: int = Query(DEFAULT_NUM_JITTERS, ge=1, le=MAX_JITTERS),
+    model: str = DEFAULT_MODEL,
+    idempotency_key: Optional[str] = Header(None),
+):
+    """detect-faces taking the image as a raw body or multipart ``file``."""
+    start = time.time()
+
+    image_bytes = await read_image_upload(request)
+    if not image_bytes:
+        return DetectFacesResponse(success=False, error="Empty image upload")
+
+    return await _detect_faces_image(
+        image_bytes, min_face_area_ratio, model, start, idempotency_key, num_jitters
+    )
+
+
 @router.post("/match-faces", response_model=MatchFacesResponse)
 async def match_faces(request: MatchFacesRequest):
     try:
-        best_match = None
-        best_score = -1.0
-        all_distances = []
+        with stage(STAGE_MATCH):
+            gallery = GalleryMatrix.from_candidates(
+                conform_candidates(request.candidate_embeddings)
+            )
+            query = conform_embeddings(
+                [request.query_embedding], request.embedding_version
+            )
+            scores = gallery.score(query)[0]
 
-        for candidate in request.candidate_embeddings:
-            scores = [
-                cosine_similarity(request.query_embedding, emb)
-                for emb in candidate.embeddings
+        all_distances = []
+        if request.return_all_distances:
+            all_distances = [
+                DistanceInfo(student_id=student_id, min_distance=1 - float(score))
+                for student_id, score in zip(gallery.student_ids, scores)
             ]
-            score = max(scores)
-
-            if request.return_all_distances:
-                all_distances.append(
-                    DistanceInfo(
-                        student_id=candidate.student_id, min_distance=1 - score
-                    )
-                )
-
-            if score > best_score:
-                best_score = score
-                best_match = candidate.student_id
 
-        if best_score >= request.threshold:
+        if len(gallery) and scores.max() >= request.threshold:
+            best = int(scores.argmax())
+            best_score = float(scores[best])
             return MatchFacesResponse(
                 success=True,
                 match=MatchResult(
-                    student_id=best_match,
+                    student_id=gallery.student_ids[best],
                     distance=1 - best_score,
                     confidence=best_score,
                     status="confident",
@@ -186,44 +771,118 @@ async def match_faces(request: MatchFacesRequest):
 
         return MatchFacesResponse(success=True, match=None)
 
+    except EmbeddingVersionError as e:
+        ML_ERRORS.labels(error_type=ERROR_EMBEDDING_VERSION).inc()
+        return MatchFacesResponse(
+            success=False, error=str(e), error_code=ERROR_EMBEDDING_VERSION
+        )
     except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
         return MatchFacesResponse(success=False, error=str(e))
 
 
 @router.post("/batch-match", response_model=BatchMatchResponse)
 async def batch_match(request: BatchMatchRequest):
     try:
-        results = []
-
-        for idx, face in enumerate(request.detected_faces):
-            best_id = None
-            best_score = -1.0
+        gallery, gallery_version = _resolve_gallery(
+            request.gallery_id, request.candidate_embeddings
+        )
+        if gallery is None:
+            return BatchMatchResponse(
+                success=False,
+                error=f"Gallery '{request.gallery_id}' not found",
+                error_code=ERROR_GALLERY_NOT_FOUND,
+            )
 
-            for candidate in request.candidate_embeddings:
-                scores = [
-                    cosine_similarity(face.embedding, emb)
-                    for emb in candidate.embeddings
-                ]
-                score = max(scores)
+        embeddings = conform_embeddings(
+            [face.embedding for face in request.detected_faces],
+            request.embedding_version,
+        )
+        results = await _match_embeddings(
+            gallery,
+            embeddings,
+            request.confident_threshold,
+            shared=gallery_version is not None,
+            runner_ups=request.runner_ups,
+        )
 
-                if score > best_score:
-                    best_score = score
-                    best_id = candidate.student_id
+        return BatchMatchResponse(
+            success=True, matches=results, gallery_version=gallery_version
+        )
 
-            status = (
-                "present" if best_score >= request.confident_threshold else "unknown"
-            )
+    except EmbeddingVersionError as e:
+        ML_ERRORS.labels(error_type=ERROR_EMBEDDING_VERSION).inc()
+        return BatchMatchResponse(
+            success=False, error=str(e), error_code=ERROR_EMBEDDING_VERSION
+        )
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        return BatchMatchResponse(success=False, error=str(e))
 
-            results.append(
-                BatchMatchResult(
-                    face_index=idx,
-                    student_id=best_id if status == "present" else None,
-                    distance=1 - best_score,
-                    status=status,
-                )
-            )
 
-        return BatchMatchResponse(success=True, matches=results)
+@router.post("/recognize", response_model=RecognizeResponse)
+async def recognize(
+    request: RecognizeRequest, idempotency_key: Optional[str] = Header(None)
+):
+    """Detect, embed and match in one call against a gallery or candidates."""
+    start = time.time()
 
+    try:
+        with stage(STAGE_BASE64_DECODE):
+            image_bytes = base64.b64decode(request.image_base64)
     except Exception as e:
-        return BatchMatchResponse(success=False, error=str(e))
+        ML_ERRORS.labels(error_type=ERROR_INVALID_IMAGE).inc()
+        return RecognizeResponse(
+            success=False, error=str(e), error_code=ERROR_INVALID_IMAGE
+        )
+
+    return await _recognize_image(
+        image_bytes,
+        request.gallery_id,
+        request.candidate_embeddings,
+        request.min_face_area_ratio,
+        request.confident_threshold,
+        request.return_embeddings,
+        request.model,
+        start,
+        idempotency_key,
+        request.runner_ups,
+    )
+
+
+@router.post(
+    "/recognize/raw",
+    response_model=RecognizeResponse,
+    openapi_extra=RAW_IMAGE_OPENAPI,
+)
+async def recognize_raw(
+    request: Request,
+    gallery_id: str,
+    min_face_area_ratio: float = DEFAULT_MIN_FACE_AREA_RATIO,
+    confident_threshold: float = CONFIDENT_THRESHOLD,
+    return_embeddings: bool = False,
+    model: str = DEFAULT_MODEL,
+    runner_ups: int = Query(DEFAULT_RUNNER_UPS, ge=0, le=10),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """recognize against a registered gallery, image as raw body or ``file``."""
+    start = time.time()
+
+    image_bytes = await read_image_upload(request)
+    if not image_bytes:
+        return RecognizeResponse(
+            success=False, error="Empty image upload", error_code=ERROR_INVALID_IMAGE
+        )
+
+    return await _recognize_image(
+        image_bytes,
+        gallery_id,
+        [],
+        min_face_area_ratio,
+        confident_threshold,
+        return_embeddings,
+        model,
+        start,
+        idempotency_key,
+        runner_ups,
+    )
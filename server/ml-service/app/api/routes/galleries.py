@@ -0,0 +1,107 @@
+from typing import List
+
+from fastapi import APIRouter, Depends
+
+from app.schemas.requests import RegisterGalleryRequest, UpdateGalleryRequest
+from app.schemas.responses import GalleryInfo, GalleryResponse
+from app.core.constants import (
+    ERROR_EMBEDDING_VERSION,
+    ERROR_GALLERY_NOT_FOUND,
+    ERROR_PROCESSING,
+)
+from app.core.metrics import ML_ERRORS
+from app.core.security import verify_api_key
+
+from app.ml.gallery_store import Gallery, gallery_store
+from app.ml.projection import (
+    EmbeddingVersionError,
+    conform_candidates,
+    conform_embeddings,
+)
+
+router = APIRouter(
+    prefix="/api/ml/galleries",
+    tags=["Galleries"],
+    dependencies=[Depends(verify_api_key)],
+)
+
+
+def _gallery_info(gallery: Gallery) -> GalleryInfo:
+    return GalleryInfo(
+        gallery_id=gallery.gallery_id,
+        version=gallery.version,
+        num_students=gallery.num_students,
+        num_embeddings=gallery.num_embeddings,
+    )
+
+
+def _not_found(gallery_id: str) -> GalleryResponse:
+    return GalleryResponse(
+        success=False,
+        error=f"Gallery '{gallery_id}' not found",
+        error_code=ERROR_GALLERY_NOT_FOUND,
+    )
+
+
+def _version_mismatch(e: EmbeddingVersionError) -> GalleryResponse:
+    return GalleryResponse(
+        success=False, error=str(e), error_code=ERROR_EMBEDDING_VERSION
+    )
+
+
+@router.get("/{gallery_id}", response_model=GalleryResponse)
+async def get_gallery(gallery_id: str):
+    gallery = gallery_store.get(gallery_id)
+    if gallery is None:
+        return _not_found(gallery_id)
+    return GalleryResponse(success=True, gallery=_gallery_info(gallery))
+
+
+@router.put("/{gallery_id}", response_model=GalleryResponse)
+async def register_gallery(gallery_id: str, request: RegisterGalleryRequest):
+    try:
+        skipped: List[str] = []
+        gallery = gallery_store.register(
+            gallery_id, conform_candidates(request.candidate_embeddings, skipped)
+        )
+        return GalleryResponse(
+            success=True, gallery=_gallery_info(gallery), skipped=skipped
+        )
+
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        return GalleryResponse(success=False, error=str(e))
+
+
+@router.post("/{gallery_id}/embeddings", response_model=GalleryResponse)
+async def add_gallery_embeddings(gallery_id: str, request: UpdateGalleryRequest):
+    try:
+        embeddings = conform_embeddings(request.embeddings, request.embedding_version)
+        gallery = gallery_store.add_embeddings(
+            gallery_id, request.student_id, embeddings, request.replace
+        )
+        if gallery is None:
+            return _not_found(gallery_id)
+        return GalleryResponse(success=True, gallery=_gallery_info(gallery))
+
+    except EmbeddingVersionError as e:
+        ML_ERRORS.labels(error_type=ERROR_EMBEDDING_VERSION).inc()
+        return _version_mismatch(e)
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        return GalleryResponse(success=False, error=str(e))
+
+
+@router.delete("/{gallery_id}/students/{student_id}", response_model=GalleryResponse)
+async def remove_gallery_student(gallery_id: str, student_id: str):
+    gallery = gallery_store.remove_student(gallery_id, student_id)
+    if gallery is None:
+        return _not_found(gallery_id)
+    return GalleryResponse(success=True, gallery=_gallery_info(gallery))
+
+
+@router.delete("/{gallery_id}", response_model=GalleryResponse)
+async def evict_gallery(gallery_id: str):
+    if not gallery_store.evict(gallery_id):
+        return _not_found(gallery_id)
+    return GalleryResponse(success=True)
@@ -1,8 +1,11 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from datetime import datetime, timezone
 import psutil
 import shutil
 
+from app.ml.model_lifecycle import model_state
+
 router = APIRouter()
 
 
@@ -35,6 +38,21 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
 
+@router.get("/ready")
+async def readiness_check():
+    """Ready to serve: models loaded and warmed up (503 until then)."""
+    body = {
+        "status": model_state.status,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    if model_state.ready:
+        body["model_load_seconds"] = model_state.load_seconds
+        return body
+    if model_state.error:
+        body["error"] = model_state.error
+    return JSONResponse(status_code=503, content=body)
+
+
 @router.get("/health/detailed")
 async def detailed_health():
     try:
@@ -50,7 +68,10 @@ async def detailed_health():
     return {
         "status": "healthy",
         "timestamp": datetime.now(timezone.utc).isoformat(),
-        "checks": {"storage": storage},
+        "checks": {
+            "storage": storage,
+            "models": {"status": model_state.status, "error": model_state.error},
+        },
         "metrics": {
             "uptime_seconds": get_uptime(),
             "memory": get_memory_usage(),
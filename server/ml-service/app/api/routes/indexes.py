@@ -0,0 +1,194 @@
+import asyncio
+import time
+from typing import List
+
+from fastapi import APIRouter, Depends
+
+from app.schemas.requests import (
+    AddIndexEmbeddingsRequest,
+    BuildIndexRequest,
+    SearchIndexRequest,
+    TrainIndexRequest,
+)
+from app.schemas.responses import (
+    IndexInfo,
+    IndexMatch,
+    IndexResponse,
+    IndexSearchResponse,
+    IndexSearchResult,
+)
+from app.core.constants import (
+    ERROR_EMBEDDING_VERSION,
+    ERROR_INDEX_NOT_FOUND,
+    ERROR_PROCESSING,
+)
+from app.core.metrics import ML_ERRORS
+from app.core.security import verify_api_key
+
+from app.ml.ann_index import IVFIndex, index_store
+from app.ml.projection import (
+    EmbeddingVersionError,
+    conform_candidates,
+    conform_embeddings,
+)
+
+router = APIRouter(
+    prefix="/api/ml/indexes",
+    tags=["Indexes"],
+    dependencies=[Depends(verify_api_key)],
+)
+
+
+def _index_info(index: IVFIndex) -> IndexInfo:
+    return IndexInfo(
+        index_id=index.index_id,
+        version=index.version,
+        num_students=index.num_students,
+        num_embeddings=index.num_embeddings,
+        nlist=index.nlist,
+        trained=index.trained,
+        trained_size=index.trained_size,
+    )
+
+
+def _not_found(index_id: str) -> IndexResponse:
+    return IndexResponse(
+        success=False,
+        error=f"Index '{index_id}' not found",
+        error_code=ERROR_INDEX_NOT_FOUND,
+    )
+
+
+@router.get("/{index_id}", response_model=IndexResponse)
+async def get_index(index_id: str):
+    index = index_store.get(index_id)
+    if index is None:
+        return _not_found(index_id)
+    return IndexResponse(success=True, index=_index_info(index))
+
+
+@router.put("/{index_id}", response_model=IndexResponse)
+async def build_index(index_id: str, request: BuildIndexRequest):
+    """Create (or replace) an index, optionally seeded and trained."""
+    try:
+        skipped: List[str] = []
+        index = IVFIndex(index_id)
+        await asyncio.to_thread(
+            index.add_many, conform_candidates(request.candidate_embeddings, skipped)
+        )
+        if request.train:
+            await asyncio.to_thread(index.train, request.nlist)
+        await asyncio.to_thread(index_store.put, index)
+        return IndexResponse(success=True, index=_index_info(index), skipped=skipped)
+
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        return IndexResponse(success=False, error=str(e))
+
+
+@router.post("/{index_id}/embeddings", response_model=IndexResponse)
+async def add_index_embeddings(index_id: str, request: AddIndexEmbeddingsRequest):
+    """Incrementally insert students into their nearest lists."""
+    try:
+        skipped: List[str] = []
+        candidates = conform_candidates(request.candidate_embeddings, skipped)
+
+        def add(index: IVFIndex):
+            for student_id, embeddings in candidates:
+                index.add(student_id, embeddings, request.replace)
+
+        index = await asyncio.to_thread(index_store.update, index_id, add)
+        if index is None:
+            return _not_found(index_id)
+        return IndexResponse(success=True, index=_index_info(index), skipped=skipped)
+
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        return IndexResponse(success=False, error=str(e))
+
+
+@router.post("/{index_id}/train", response_model=IndexResponse)
+async def train_index(index_id: str, request: TrainIndexRequest):
+    """Re-cluster after bulk loads or substantial growth."""
+    try:
+        index = await asyncio.to_thread(
+            index_store.update, index_id, lambda index: index.train(request.nlist)
+        )
+        if index is None:
+            return _not_found(index_id)
+        return IndexResponse(success=True, index=_index_info(index))
+
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        return IndexResponse(success=False, error=str(e))
+
+
+@router.post("/{index_id}/search", response_model=IndexSearchResponse)
+async def search_index(index_id: str, request: SearchIndexRequest):
+    """Open-set identification: top-k students for every query embedding."""
+    start = time.time()
+
+    index = index_store.get(index_id)
+    if index is None:
+        return IndexSearchResponse(
+            success=False,
+            error=f"Index '{index_id}' not found",
+            error_code=ERROR_INDEX_NOT_FOUND,
+        )
+
+    try:
+        queries = conform_embeddings(request.embeddings, request.embedding_version)
+        hits = await asyncio.to_thread(
+            index.search, queries, request.k, request.nprobe, request.rerank
+        )
+
+        results = []
+        for face_index, face_hits in enumerate(hits):
+            matches = [
+                IndexMatch(student_id=sid, similarity=score, distance=1 - score)
+                for sid, score in face_hits
+            ]
+            identified = bool(matches) and matches[0].similarity >= request.threshold
+            results.append(
+                IndexSearchResult(
+                    face_index=face_index,
+                    student_id=matches[0].student_id if identified else None,
+                    distance=matches[0].distance if matches else None,
+                    status="present" if identified else "unknown",
+                    matches=matches,
+                )
+            )
+
+        return IndexSearchResponse(
+            success=True,
+            results=results,
+            count=len(results),
+            index_version=index.version,
+            processing_time_ms=(time.time() - start) * 1000,
+        )
+
+    except EmbeddingVersionError as e:
+        ML_ERRORS.labels(error_type=ERROR_EMBEDDING_VERSION).inc()
+        return IndexSearchResponse(
+            success=False, error=str(e), error_code=ERROR_EMBEDDING_VERSION
+        )
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_PROCESSING).inc()
+        return IndexSearchResponse(success=False, error=str(e))
+
+
+@router.delete("/{index_id}/students/{student_id}", response_model=IndexResponse)
+async def remove_index_student(index_id: str, student_id: str):
+    index = await asyncio.to_thread(
+        index_store.update, index_id, lambda index: index.remove(student_id)
+    )
+    if index is None:
+        return _not_found(index_id)
+    return IndexResponse(success=True, index=_index_info(index))
+
+
+@router.delete("/{index_id}", response_model=IndexResponse)
+async def evict_index(index_id: str):
+    if not index_store.evict(index_id):
+        return _not_found(index_id)
+    return IndexResponse(success=True)
@@ -0,0 +1,250 @@
+"""
+Streaming attendance over a WebSocket.
+
+The teacher's device opens ``/api/ml/stream?gallery_id=<subject>`` and sends
+video frames as binary messages (JPEG/PNG bytes). Frames are decoded,
+detected and cropped on the pipeline `worker_pool`, with that worker's
+detector, and each is admitted like an image request (see
+``app.core.admission``). Each stream owns a `FaceTracker`; only new tracks
+are embedded and matched, and the server pushes JSON events:
+
+- ``{"type": "frame", "frame", "tracks": [...], "processing_time_ms"}``
+  after every frame, the client's cue to send the next one
+- ``{"type": "identified", "track_id", "student_id", "distance", ...}``
+  the first time a student is recognised in the stream
+- ``{"type": "unknown", "track_id", ...}`` for a track that stayed
+  unidentified after every attempt
+- ``{"type": "track_lost", "track_id"}`` when a face leaves the view
+- ``{"type": "error", "error", "error_code"}``; fatal ones close the socket.
+  A frame shed for overload gets ``SERVICE_OVERLOADED`` and ``retry_after``
+"""
+
+import time
+from typing import Optional, Set
+
+import numpy as np
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.status import WS_1008_POLICY_VIOLATION
+
+from app.core.admission import ADMISSION_SCOPE_KEY, Overloaded, admit
+from app.core.config import settings
+from app.core.constants import (
+    CONFIDENT_THRESHOLD,
+    ERROR_GALLERY_NOT_FOUND,
+    ERROR_INVALID_IMAGE,
+    ERROR_OVERLOADED,
+)
+from app.core.metrics import (
+    ML_ERRORS,
+    ML_STREAM_EMBEDDINGS,
+    ML_STREAM_FRAMES,
+    ML_STREAMS_ACTIVE,
+)
+from app.core.worker_pool import worker_pool
+from app.ml.batcher import embedding_batcher, match_batcher
+from app.ml.face_detector import detect_faces
+from app.ml.face_encoder import crop_faces
+from app.ml.face_tracker import FaceTracker, Track
+from app.ml.gallery_store import gallery_store
+from app.utils.image_utils import decode_image, to_original_box
+
+router = APIRouter(prefix="/api/ml", tags=["Streaming"])
+
+
+def _detect_frame(frame_bytes: bytes):
+    """
+    Decode one frame, detect its faces and crop them all.
+
+    Runs on a pipeline worker; returns ``(boxes, scale, crops)``.
+    """
+    decoded = decode_image(frame_bytes)
+    boxes = detect_faces(decoded.pixels)
+    return boxes, decoded.scale, crop_faces(decoded.pixels, boxes)
+
+
+class StreamSession:
+    """Per-connection tracker and identification state."""
+
+    def __init__(self, gallery_id: str, confident_threshold: float):
+        self.gallery_id = gallery_id
+        self.confident_threshold = confident_threshold
+        self.tracker = FaceTracker()
+        self.identified_students: Set[str] = set()
+        self.scale = 1.0
+
+    def track(self, boxes, scale: float, crops: np.ndarray):
+        """Track one frame's faces; returns the crops of those due for matching."""
+        self.scale = scale
+        visible, lost = self.tracker.update(boxes)
+        due = self.tracker.due_for_identification(visible)
+        return visible, lost, [visible[i] for i in due], crops[due]
+
+    def location(self, track: Track) -> dict:
+        x, y, w, h = to_original_box(track.box, self.scale)
+        return {"top": y, "right": x + w, "bottom": y + h, "left": x}
+
+
+def _authorized(websocket: WebSocket) -> bool:
+    # Browsers cannot set headers on a WebSocket, so a query param also works
+    api_key = websocket.headers.get("x-api-key") or websocket.query_params.get(
+        "api_key"
+    )
+    return api_key == settings.API_KEY
+
+
+def _gallery_not_found(gallery_id: str) -> dict:
+    return {
+        "type": "error",
+        "error": f"Gallery '{gallery_id}' not found",
+        "error_code": ERROR_GALLERY_NOT_FOUND,
+    }
+
+
+async def _identify(session: StreamSession, due, crops) -> Optional[list]:
+    """Embed and match the due tracks; returns events, or None if no gallery."""
+    gallery = gallery_store.get(session.gallery_id)
+    if gallery is None:
+        return None
+
+    embeddings = await embedding_batcher.submit(crops)
+    ML_STREAM_EMBEDDINGS.inc(len(due))
+    if len(gallery.matrix):
+        scores = await match_batcher.submit(
+            np.asarray(embeddings, dtype=np.float32), key=gallery.matrix
+        )
+        # Faces in one frame are distinct students
+        best_ids, best_scores, _ = gallery.matrix.assign_scores(
+            scores, session.confident_threshold
+        )
+    else:
+        best_ids, best_scores = [None] * len(due), [0.0] * len(due)
+
+    events = []
+    for track, student_id, score in zip(due, best_ids, best_scores):
+        score = float(score)
+        confident = student_id is not None and score >= session.confident_threshold
+        session.tracker.record_attempt(track, student_id if confident else None, score)
+
+        if confident and student_id not in session.identified_students:
+            session.identified_students.add(student_id)
+            events.append(
+                {
+                    "type": "identified",
+                    "track_id": track.track_id,
+                    "student_id": student_id,
+                    "distance": 1 - score,
+                    "location": session.location(track),
+                    "frame": session.tracker.frame,
+                }
+            )
+        elif track.exhausted:
+            events.append(
+                {
+                    "type": "unknown",
+                    "track_id": track.track_id,
+                    "distance": 1 - score,
+                    "location": session.location(track),
+                    "frame": session.tracker.frame,
+                }
+            )
+    return events
+
+
+async def _process_frame(
+    session: StreamSession, frame_bytes: bytes, start: float
+) -> Optional[list]:
+    """Events of one frame, ending with its "frame" event; None if no gallery."""
+    try:
+        boxes, scale, crops = await worker_pool.run(_detect_frame, frame_bytes)
+    except Exception as e:
+        ML_ERRORS.labels(error_type=ERROR_INVALID_IMAGE).inc()
+        return [{"type": "error", "error": str(e), "error_code": ERROR_INVALID_IMAGE}]
+    ML_STREAM_FRAMES.inc()
+    visible, lost, due, due_crops = session.track(boxes, scale, crops)
+
+    events = [{"type": "track_lost", "track_id": t.track_id} for t in lost]
+    if due:
+        identified = await _identify(session, due, due_crops)
+        if identified is None:
+            return None
+        events.extend(identified)
+
+    events.append(
+        {
+            "type": "frame",
+            "frame": session.tracker.frame,
+            "tracks": [
+                {
+                    "track_id": t.track_id,
+                    "student_id": t.student_id,
+                    "location": session.location(t),
+                }
+                for t in visible
+            ],
+            "processing_time_ms": (time.time() - start) * 1000,
+        }
+    )
+    return events
+
+
+@router.websocket("/stream")
+async def stream_attendance(
+    websocket: WebSocket,
+    gallery_id: str,
+    confident_threshold: float = CONFIDENT_THRESHOLD,
+):
+    """Identify the students of a registered gallery in a live frame stream."""
+    if not _authorized(websocket):
+        await websocket.close(code=WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    if gallery_store.get(gallery_id) is None:
+        await websocket.send_json(_gallery_not_found(gallery_id))
+        await websocket.close()
+        return
+
+    session = StreamSession(gallery_id, confident_threshold)
+    admission = websocket.scope.get(ADMISSION_SCOPE_KEY)
+    ML_STREAMS_ACTIVE.inc()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            frame_bytes = message.get("bytes")
+            if not frame_bytes:
+                await websocket.send_json(
+                    {
+                        "type": "error",
+                        "error": "Frames must be sent as binary messages",
+                        "error_code": ERROR_INVALID_IMAGE,
+                    }
+                )
+                continue
+
+            start = time.time()
+            try:
+                async with admit(admission, len(frame_bytes)):
+                    events = await _process_frame(session, frame_bytes, start)
+            except Overloaded as e:
+                await websocket.send_json(
+                    {
+                        "type": "error",
+                        "error": f"Service overloaded ({e.reason}), retry later",
+                        "error_code": ERROR_OVERLOADED,
+                        "retry_after": e.retry_after,
+                    }
+                )
+                continue
+            if events is None:
+                await websocket.send_json(_gallery_not_found(gallery_id))
+                await websocket.close()
+                break
+            for event in events:
+                await websocket.send_json(event)
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ML_STREAMS_ACTIVE.dec()
@@ -0,0 +1,262 @@
+"""
+Admission control for the image endpoints.
+
+A burst of large uploads otherwise piles up in memory until the container
+is OOM-killed. Each image endpoint gets an in-flight budget in request bytes
+(``ML_ADMISSION_INFLIGHT_MB``): a request is charged its ``Content-Length``,
+so a 4 MB photo takes the room of many small ones. Requests over budget wait
+in a FIFO queue of at most ``ML_ADMISSION_MAX_QUEUE`` entries, and only for
+as long as they could still finish in time. The wait is bounded by the
+client's ``X-Request-Timeout`` minus the endpoint's recent latency, and by
+``ML_ADMISSION_MAX_WAIT_S``.
+
+Admission runs before the body is read. Overload is answered at once:
+``429`` when the queue is full, ``503`` when a request could not be started
+before its deadline. Both carry a ``Retry-After`` estimated from the work
+ahead.
+
+The video stream is one long WebSocket, so it is admitted per frame: the
+middleware hands the stream its controller in the connection scope
+(``ADMISSION_SCOPE_KEY``) and each frame is charged with `admit`.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Iterable, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.constants import ERROR_OVERLOADED
+from app.core.metrics import (
+    ML_ADMISSION_INFLIGHT_BYTES,
+    ML_ADMISSION_QUEUE_DEPTH,
+    ML_ADMISSION_REJECTED,
+)
+
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+# Charge for bodies without a Content-Length (chunked uploads)
+MIN_REQUEST_COST = 256 * 1024
+LATENCY_SMOOTHING = 0.2
+MAX_RETRY_AFTER_S = 60
+
+ADMISSION_CONTROLLED_PATHS = (
+    "/api/ml/encode-face",
+    "/api/ml/encode-face/raw",
+    "/api/ml/detect-faces",
+    "/api/ml/detect-faces/raw",
+    "/api/ml/recognize",
+    "/api/ml/recognize/raw",
+    "/api/ml/stream",
+)
+ADMISSION_SCOPE_KEY = "admission_controller"
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, cost: int, future: asyncio.Future):
+        self.cost = cost
+        self.future = future
+
+
+class AdmissionController:
+    """In-flight byte budget and deadline-bounded FIFO queue of one endpoint."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        capacity_bytes: int,
+        max_queue: int,
+        max_wait_s: float,
+    ):
+        self.endpoint = endpoint
+        self.capacity = capacity_bytes
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.in_flight = 0
+        self.running = 0
+        # Smoothed seconds a request spends in the endpoint once admitted
+        self.latency_s: Optional[float] = None
+        self._queue: Deque[_Waiter] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def _fits(self, cost: int) -> bool:
+        # A request larger than the whole budget runs alone
+        return self.in_flight == 0 or self.in_flight + cost <= self.capacity
+
+    def _retry_after(self) -> int:
+        latency = self.latency_s or 1.0
+        rounds = (self.queued + 1) / max(1, self.running)
+        return min(MAX_RETRY_AFTER_S, max(1, math.ceil(latency * rounds)))
+
+    def _reject(self, status_code: int, reason: str):
+        ML_ADMISSION_REJECTED.labels(endpoint=self.endpoint, reason=reason).inc()
+        raise Overloaded(status_code, reason, self._retry_after())
+
+    def _start(self, cost: int):
+        self.in_flight += cost
+        self.running += 1
+        ML_ADMISSION_INFLIGHT_BYTES.labels(endpoint=self.endpoint).set(self.in_flight)
+
+    async def acquire(self, cost: int, client_timeout_s: Optional[float] = None) -> int:
+        """Wait for room for ``cost`` bytes; returns the charged cost."""
+        cost = min(max(cost, MIN_REQUEST_COST), self.capacity)
+        if not self._queue and self._fits(cost):
+            self._start(cost)
+            return cost
+
+        if self.queued >= self.max_queue:
+            self._reject(429, "queue_full")
+
+        max_wait = self.max_wait_s
+        if client_timeout_s is not None:
+            max_wait = min(max_wait, client_timeout_s - (self.latency_s or 0.0))
+        if max_wait <= 0:
+            self._reject(503, "deadline")
+
+        waiter = _Waiter(cost, asyncio.get_running_loop().create_future())
+        self._queue.append(waiter)
+        ML_ADMISSION_QUEUE_DEPTH.labels(endpoint=self.endpoint).set(self.queued)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                self._queue.remove(waiter)
+                ML_ADMISSION_QUEUE_DEPTH.labels(endpoint=self.endpoint).set(self.queued)
+                self._reject(503, "deadline")
+        except BaseException:
+            # Cancelled while queued: give back a slot granted meanwhile
+            if waiter.future.done():
+                self.release(cost)
+            elif waiter in self._queue:
+                self._queue.remove(waiter)
+                ML_ADMISSION_QUEUE_DEPTH.labels(endpoint=self.endpoint).set(self.queued)
+            raise
+        return cost
+
+    def release(self, cost: int, elapsed_s: Optional[float] = None):
+        self.in_flight -= cost
+        self.running -= 1
+        if elapsed_s is not None:
+            self.latency_s = (
+                elapsed_s
+                if self.latency_s is None
+                else self.latency_s + LATENCY_SMOOTHING * (elapsed_s - self.latency_s)
+            )
+        # Grant in arrival order, so large uploads are not starved
+        while self._queue and self._fits(self._queue[0].cost):
+            waiter = self._queue.popleft()
+            self._start(waiter.cost)
+            waiter.future.set_result(None)
+        ML_ADMISSION_QUEUE_DEPTH.labels(endpoint=self.endpoint).set(self.queued)
+        ML_ADMISSION_INFLIGHT_BYTES.labels(endpoint=self.endpoint).set(self.in_flight)
+
+
+@asynccontextmanager
+async def admit(controller: Optional[AdmissionController], cost: int):
+    """Hold ``cost`` bytes of ``controller`` (if any); raises `Overloaded`."""
+    if controller is None:
+        yield
+        return
+    cost = await controller.acquire(cost)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        controller.release(cost, time.monotonic() - start)
+
+
+def _content_length(headers: Headers) -> int:
+    try:
+        return max(0, int(headers.get("content-length") or 0))
+    except ValueError:
+        return 0
+
+
+def _client_timeout(headers: Headers) -> Optional[float]:
+    try:
+        return float(headers[REQUEST_TIMEOUT_HEADER])
+    except (KeyError, ValueError):
+        return None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an `AdmissionController` per endpoint path."""
+
+    def __init__(
+        self,
+        app,
+        paths: Iterable[str] = ADMISSION_CONTROLLED_PATHS,
+        capacity_mb: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        max_wait_s: Optional[float] = None,
+    ):
+        self.app = app
+        capacity_mb = (
+            settings.ML_ADMISSION_INFLIGHT_MB if capacity_mb is None else capacity_mb
+        )
+        self.controllers: Dict[str, AdmissionController] = {}
+        if capacity_mb > 0:
+            self.controllers = {
+                path: AdmissionController(
+                    path,
+                    int(capacity_mb * 2**20),
+                    settings.ML_ADMISSION_MAX_QUEUE if max_queue is None else max_queue,
+                    settings.ML_ADMISSION_MAX_WAIT_S
+                    if max_wait_s is None
+                    else max_wait_s,
+                )
+                for path in paths
+            }
+
+    async def __call__(self, scope, receive, send):
+        controller = (
+            self.controllers.get(scope["path"])
+            if scope["type"] in ("http", "websocket")
+            else None
+        )
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+        if scope["type"] == "websocket":
+            # Admitted per message by the endpoint, see `admit`
+            await self.app({ADMISSION_SCOPE_KEY: controller, **scope}, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        try:
+            cost = await controller.acquire(
+                _content_length(headers), _client_timeout(headers)
+            )
+        except Overloaded as e:
+            response = JSONResponse(
+                status_code=e.status_code,
+                content={
+                    "success": False,
+                    "error": f"Service overloaded ({e.reason}), retry later",
+                    "error_code": ERROR_OVERLOADED,
+                },
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(cost, time.monotonic() - start)
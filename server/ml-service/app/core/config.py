@@ -18,6 +18,60 @@ class Settings(BaseSettings):
     NUM_JITTERS: int = 5
     MIN_FACE_AREA_RATIO: float = 0.04
 
+    # Load and warm up the models at startup; /ready reports when done
+    ML_WARMUP: bool = True
+
+    # CPU pipeline pool: "thread", "process" or "inline" (on the event loop)
+    ML_WORKER_MODE: str = "thread"
+    ML_WORKERS: int = 2
+
+    # Directory (on /dev/shm) where galleries are published for every server
+    # process to map; set by gunicorn.conf.py. Empty keeps them per process
+    ML_SHARED_GALLERY_DIR: str = ""
+    # Shared gallery format: "float32" (rewritten per change) or append-only
+    # "int8"/"float16" codes; students per query re-scored exactly after a
+    # quantized scan; fraction of dead rows that triggers compaction
+    ML_GALLERY_QUANTIZATION: str = "float32"
+    ML_GALLERY_RESCORE_K: int = 8
+    ML_GALLERY_COMPACT_RATIO: float = 0.25
+
+    # Admission control of the image endpoints: request MB in flight per
+    # endpoint (0 disables), requests queued beyond it, longest queue wait
+    ML_ADMISSION_INFLIGHT_MB: float = 32.0
+    ML_ADMISSION_MAX_QUEUE: int = 64
+    ML_ADMISSION_MAX_WAIT_S: float = 10.0
+
+    # Cross-request micro-batching of embedding/matching (0 ms disables)
+    ML_BATCH_MAX_WAIT_MS: float = 2.0
+    ML_BATCH_MAX_SIZE: int = 32
+
+    # Decode uploads reduced (JPEG DCT scaling) towards this longest side; 0 = full
+    ML_DECODE_MAX_DIMENSION: int = 1920
+
+    # Face crop quality: "skip" low-quality faces before embedding, "flag"
+    # them only, or "off"; a face failing any threshold is low quality
+    ML_FACE_QUALITY: str = "skip"
+    ML_FACE_MIN_SHARPNESS: float = 20.0
+    ML_FACE_MIN_BRIGHTNESS: float = 40.0
+    ML_FACE_MAX_BRIGHTNESS: float = 220.0
+    ML_FACE_MIN_SIZE_PX: int = 24
+    ML_FACE_MIN_CONFIDENCE: float = 0.7
+
+    # Threads detecting the tiles of one image when model="tiled"
+    ML_DETECT_TILE_WORKERS: int = 2
+
+    # Detection/encoding results of repeated uploads (0 entries disables)
+    ML_RESULT_CACHE_SIZE: int = 128
+    ML_RESULT_CACHE_TTL_S: float = 300.0
+
+    # PCA projection (.npz from fit_projection.py); empty keeps raw embeddings
+    ML_PROJECTION_PATH: str = ""
+
+    # ANN (IVF) index: lists (0 = sqrt(N)), lists scanned, students re-ranked
+    ML_ANN_NLIST: int = 0
+    ML_ANN_NPROBE: int = 8
+    ML_ANN_RERANK: int = 32
+
     # 👇 IMPORTANT FIX
     CORS_ORIGINS: Union[str, List[str]] = ["*"]
 
@@ -2,21 +2,27 @@
 
 # Face Detection
 DEFAULT_MIN_FACE_AREA_RATIO = 0.04
-DEFAULT_NUM_JITTERS = 3
-DEFAULT_MODEL = "hog"  # hog or cnn
+DEFAULT_NUM_JITTERS = 1  # live matching: no jitters, see face_encoder.JITTERS
+DEFAULT_MODEL = "hog"  # hog (single full-frame pass) or tiled
 
 # Face Encoding
 ENCODING_MIN_FACE_AREA_RATIO = 0.05
-ENCODING_NUM_JITTERS = 5
+ENCODING_NUM_JITTERS = 5  # enrolment: embeddings averaged over 5 jitters
 
 # Face Matching
 DEFAULT_MATCH_THRESHOLD = 0.6
 CONFIDENT_THRESHOLD = 0.50
 UNCERTAIN_THRESHOLD = 0.60
+DEFAULT_RUNNER_UPS = 2  # next best students returned per matched face
 
 # Error Codes
 ERROR_NO_FACE = "NO_FACE_FOUND"
 ERROR_MULTIPLE_FACES = "MULTIPLE_FACES_FOUND"
 ERROR_FACE_TOO_SMALL = "FACE_TOO_SMALL"
+ERROR_LOW_QUALITY = "FACE_LOW_QUALITY"
 ERROR_INVALID_IMAGE = "INVALID_IMAGE"
 ERROR_PROCESSING = "PROCESSING_ERROR"
+ERROR_GALLERY_NOT_FOUND = "GALLERY_NOT_FOUND"
+ERROR_INDEX_NOT_FOUND = "INDEX_NOT_FOUND"
+ERROR_EMBEDDING_VERSION = "EMBEDDING_VERSION_MISMATCH"
+ERROR_OVERLOADED = "SERVICE_OVERLOADED"
@@ -1,4 +1,4 @@
-from prometheus_client import Counter, Gauge
+from prometheus_client import Counter, Gauge, Histogram
 
 FACE_DETECTION_ACCURACY = Gauge(
     "face_detection_confidence", "Confidence score of face detection"
@@ -9,3 +9,104 @@ FACES_DETECTED_TOTAL = Counter(
 )
 
 ML_ERRORS = Counter("ml_service_errors_total", "ML service errors", ["error_type"])
+
+ML_WORKER_POOL_SIZE = Gauge("ml_worker_pool_size", "Workers in the ML pipeline pool")
+
+ML_WORKER_BUSY = Gauge(
+    "ml_worker_busy", "ML pipeline workers currently running a task"
+)
+
+ML_WORKER_QUEUE_DEPTH = Gauge(
+    "ml_worker_queue_depth", "ML pipeline tasks waiting for a free worker"
+)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+ML_BATCH_REQUESTS = Histogram(
+    "ml_microbatch_requests",
+    "Requests merged into one micro-batch",
+    ["batcher"],
+    buckets=BATCH_SIZE_BUCKETS,
+)
+
+ML_BATCH_ROWS = Histogram(
+    "ml_microbatch_rows",
+    "Faces stacked into one micro-batch pass",
+    ["batcher"],
+    buckets=BATCH_SIZE_BUCKETS,
+)
+
+ML_RESULT_CACHE_HITS = Counter(
+    "ml_result_cache_hits_total",
+    "Repeated uploads served from the result cache",
+    ["operation"],
+)
+
+ML_RESULT_CACHE_MISSES = Counter(
+    "ml_result_cache_misses_total",
+    "Uploads processed because no cached result existed",
+    ["operation"],
+)
+
+ML_RESULT_CACHE_ENTRIES = Gauge(
+    "ml_result_cache_entries", "Results currently held in the result cache"
+)
+
+ML_STREAMS_ACTIVE = Gauge("ml_streams_active", "Open video attendance streams")
+
+ML_STREAM_FRAMES = Counter("ml_stream_frames_total", "Video stream frames processed")
+
+ML_STREAM_EMBEDDINGS = Counter(
+    "ml_stream_embeddings_total", "Face tracks embedded and matched in video streams"
+)
+
+ML_MODEL_LOAD_SECONDS = Gauge(
+    "ml_model_load_seconds", "Time to load and warm up the models in every worker"
+)
+
+STAGE_LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+ML_STAGE_SECONDS = Histogram(
+    "ml_stage_duration_seconds",
+    "Time one request spent in a stage of the ML pipeline",
+    ["endpoint", "stage"],
+    buckets=STAGE_LATENCY_BUCKETS,
+)
+
+ML_ADMISSION_QUEUE_DEPTH = Gauge(
+    "ml_admission_queue_depth",
+    "Requests waiting for admission to an image endpoint",
+    ["endpoint"],
+)
+
+ML_ADMISSION_INFLIGHT_BYTES = Gauge(
+    "ml_admission_inflight_bytes",
+    "Request bytes admitted and being processed by an image endpoint",
+    ["endpoint"],
+)
+
+ML_ADMISSION_REJECTED = Counter(
+    "ml_admission_rejected_total",
+    "Requests shed by admission control (queue_full: 429, deadline: 503)",
+    ["endpoint", "reason"],
+)
+
+ML_FACES_LOW_QUALITY = Counter(
+    "ml_faces_low_quality_total",
+    "Detected faces failing a quality check (a face may fail several)",
+    ["reason"],
+)
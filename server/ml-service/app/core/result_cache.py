@@ -0,0 +1,134 @@
+"""
+Bounded result cache for the image pipeline.
+
+Clients retry timed-out requests by resending the whole image, and teachers
+double-tap "mark", so the same photo often arrives several times within
+seconds. Detection/encoding results are cached under a key built from the
+request's ``Idempotency-Key`` header or, without one, a BLAKE2 hash of the
+image bytes, plus the parameters that affect the result. Entries are evicted
+least-recently-used beyond ``ML_RESULT_CACHE_SIZE`` and after
+``ML_RESULT_CACHE_TTL_S`` seconds.
+
+A duplicate that arrives while the original is still being processed waits
+for it instead of starting a second pass.
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import (
+    ML_RESULT_CACHE_ENTRIES,
+    ML_RESULT_CACHE_HITS,
+    ML_RESULT_CACHE_MISSES,
+)
+
+
+def image_key(image_bytes: bytes, idempotency_key: Optional[str] = None) -> str:
+    """Identity of an upload: the client's idempotency key or a content hash."""
+    if idempotency_key:
+        return f"key:{idempotency_key}"
+    return "sha:" + hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """``(found, value)`` for a live entry, refreshing its LRU position."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                ML_RESULT_CACHE_ENTRIES.set(len(self._entries))
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            ML_RESULT_CACHE_ENTRIES.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            ML_RESULT_CACHE_ENTRIES.set(0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_compute(
+        self,
+        operation: str,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda result: True,
+    ) -> Any:
+        """
+        Cached result for ``(operation, key)``, or ``await compute()``.
+
+        Results ``cacheable`` rejects (e.g. transient failures) are returned
+        but not stored; exceptions are never cached.
+        """
+        if not self.enabled:
+            return await compute()
+
+        key = (operation, key)
+        found, value = self.get(key)
+        if found:
+            ML_RESULT_CACHE_HITS.labels(operation=operation).inc()
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            ML_RESULT_CACHE_HITS.labels(operation=operation).inc()
+            return await asyncio.shield(pending)
+
+        ML_RESULT_CACHE_MISSES.labels(operation=operation).inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await compute()
+        except Exception as e:
+            future.set_exception(e)
+            # Only duplicates waiting on it need to see the error
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            if cacheable(result):
+                self.put(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+
+# Global result cache instance
+result_cache = ResultCache(
+    max_entries=settings.ML_RESULT_CACHE_SIZE,
+    ttl_seconds=settings.ML_RESULT_CACHE_TTL_S,
+)
@@ -0,0 +1,135 @@
+"""
+Per-stage latency of ML requests.
+
+Routes built with ``TimedRoute`` run every request under a
+``RequestTimings``: code on the request's path (or in ``asyncio.to_thread``,
+which copies the context) wraps each step in ``stage(...)``. Work done on a
+pipeline worker, possibly another process, times itself into a plain dict
+passed to ``stage(..., durations)`` and returns it with its result, and the
+route merges it with `record_stages`.
+
+When the response is ready, each stage's total is observed in the
+``ml_stage_duration_seconds`` histogram (labelled by endpoint and stage) and
+reported in a ``Server-Timing`` header, which browser dev tools display as a
+waterfall. Request parsing and response serialization, which FastAPI does
+around the endpoint, are timed as the ``parse`` and ``serialize`` stages.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+from fastapi.routing import APIRoute
+
+from app.core.metrics import ML_STAGE_SECONDS
+
+STAGE_PARSE = "parse"
+STAGE_BASE64_DECODE = "base64_decode"
+STAGE_IMAGE_DECODE = "image_decode"
+STAGE_DETECT = "detect"
+STAGE_CROP = "crop"
+STAGE_QUALITY = "quality"
+STAGE_EMBED = "embed"
+STAGE_MATCH = "match"
+STAGE_SERIALIZE = "serialize"
+
+_current_timings: ContextVar[Optional["RequestTimings"]] = ContextVar(
+    "ml_request_timings", default=None
+)
+
+
+class RequestTimings:
+    """Seconds spent in each stage of one request."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.endpoint_started: Optional[float] = None
+        self.endpoint_finished: Optional[float] = None
+        self.durations: Dict[str, float] = {}
+
+    def add(self, stage_name: str, seconds: float):
+        self.durations[stage_name] = self.durations.get(stage_name, 0.0) + seconds
+
+    def finish(self) -> float:
+        """Add the parse/serialize stages, observe every stage; total seconds."""
+        finished = time.perf_counter()
+        if self.endpoint_started is not None:
+            self.add(STAGE_PARSE, self.endpoint_started - self.started)
+        if self.endpoint_finished is not None:
+            self.add(STAGE_SERIALIZE, finished - self.endpoint_finished)
+        for stage_name, seconds in self.durations.items():
+            ML_STAGE_SECONDS.labels(endpoint=self.endpoint, stage=stage_name).observe(
+                seconds
+            )
+        return finished - self.started
+
+    def server_timing(self, total: float) -> str:
+        metrics = [
+            f"{stage_name};dur={seconds * 1000:.2f}"
+            for stage_name, seconds in self.durations.items()
+        ]
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(metrics)
+
+
+def record_stages(durations: Dict[str, float]):
+    """Add stage durations measured elsewhere (e.g. on a worker) to the request."""
+    timings = _current_timings.get()
+    if timings is not None:
+        for stage_name, seconds in durations.items():
+            timings.add(stage_name, seconds)
+
+
+@contextmanager
+def stage(name: str, durations: Optional[Dict[str, float]] = None):
+    """Time the block into ``durations``, or into the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if durations is not None:
+            durations[name] = durations.get(name, 0.0) + elapsed
+        else:
+            record_stages({name: elapsed})
+
+
+class TimedRoute(APIRoute):
+    """``APIRoute`` that times each request's stages (see module docstring)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            # Marks where FastAPI's parsing ends and its serialization begins
+            async def timed_call(**values):
+                timings = _current_timings.get()
+                if timings is not None:
+                    timings.endpoint_started = time.perf_counter()
+                try:
+                    return await call(**values)
+                finally:
+                    if timings is not None:
+                        timings.endpoint_finished = time.perf_counter()
+
+            self.dependant.call = timed_call
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        endpoint = self.path_format
+
+        async def timed_handler(request):
+            timings = RequestTimings(endpoint)
+            token = _current_timings.set(timings)
+            try:
+                response = await handler(request)
+            finally:
+                _current_timings.reset(token)
+            total = timings.finish()
+            response.headers["Server-Timing"] = timings.server_timing(total)
+            return response
+
+        return timed_handler
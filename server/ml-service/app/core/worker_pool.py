@@ -0,0 +1,90 @@
+"""
+Worker pool for the CPU-bound image pipeline.
+
+Image decode, MediaPipe detection and OpenCV resizing are blocking, so the
+routes hand them to a pool instead of running them on the event loop. The
+pool runs either threads (default; each thread gets its own detector, see
+``face_detector.get_detector``) or spawned processes, which sidestep the GIL
+at the cost of pickling images and results across the process boundary.
+
+In-flight work is capped at the pool size with a semaphore, so tasks waiting
+on it are the queue depth and tasks holding it are busy workers.
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+from app.core.metrics import (
+    ML_WORKER_BUSY,
+    ML_WORKER_POOL_SIZE,
+    ML_WORKER_QUEUE_DEPTH,
+)
+
+MODE_THREAD = "thread"
+MODE_PROCESS = "process"
+MODE_INLINE = "inline"
+
+
+class WorkerPool:
+    def __init__(self, mode: str = MODE_THREAD, workers: int = 2):
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+        ML_WORKER_POOL_SIZE.set(self.workers)
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.mode == MODE_INLINE:
+            return None
+        if self._executor is None:
+            if self.mode == MODE_PROCESS:
+                # spawn, not fork: MediaPipe/TFLite handles do not survive fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="ml-worker"
+                )
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` on a worker and await its result."""
+        executor = self._get_executor()
+        if executor is None:
+            return fn(*args)
+
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._slots_loop = loop
+        slots = self._slots
+
+        ML_WORKER_QUEUE_DEPTH.inc()
+        try:
+            await slots.acquire()
+        finally:
+            ML_WORKER_QUEUE_DEPTH.dec()
+
+        ML_WORKER_BUSY.inc()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        finally:
+            ML_WORKER_BUSY.dec()
+            slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._slots = None
+        self._slots_loop = None
+
+
+# Global worker pool instance
+worker_pool = WorkerPool(mode=settings.ML_WORKER_MODE, workers=settings.ML_WORKERS)
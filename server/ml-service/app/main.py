@@ -1,3 +1,4 @@
+import asyncio
 import os
 import time
 import logging
@@ -5,13 +6,21 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import sentry_sdk
 from sentry_sdk.integrations.fastapi import FastApiIntegration
 
+from app.core.admission import AdmissionMiddleware
 from app.core.config import settings
+from app.core.worker_pool import worker_pool
+from app.ml.model_lifecycle import STATUS_READY, model_state, warm_up
 from app.api.routes.face_recognition import router as ml_router
+from app.api.routes.galleries import router as galleries_router
+from app.api.routes.indexes import router as indexes_router
+from app.api.routes.stream import router as stream_router
 
 # New Imports
 from prometheus_fastapi_instrumentator import Instrumentator
@@ -42,6 +51,21 @@ if SENTRY_DSN := os.getenv("SENTRY_DSN"):
 service_start_time = time.time()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background: /health answers at once, /ready when done
+    warmup_task = None
+    if settings.ML_WARMUP:
+        warmup_task = asyncio.create_task(warm_up())
+    else:
+        model_state.status = STATUS_READY
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    worker_pool.shutdown()
+    logger.info("ML worker pool shut down")
+
+
 def create_app() -> FastAPI:
     """Create and configure the ML Service FastAPI application"""
 
@@ -49,9 +73,11 @@ def create_app() -> FastAPI:
         title=settings.SERVICE_NAME,
         version=settings.SERVICE_VERSION,
         description="Machine Learning Service for Face Recognition",
+        lifespan=lifespan,
     )
 
-    # Middleware
+    # Middleware (the last added runs first): shed load before the body is read
+    app.add_middleware(AdmissionMiddleware)
     app.add_middleware(CorrelationIdMiddleware)
     app.add_middleware(TimingMiddleware)
 
@@ -72,6 +98,9 @@ def create_app() -> FastAPI:
 
     # Include routers
     app.include_router(ml_router)
+    app.include_router(galleries_router)
+    app.include_router(indexes_router)
+    app.include_router(stream_router)
     app.include_router(health_router, tags=["Health"])
 
     return app
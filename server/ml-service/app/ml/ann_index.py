@@ -0,0 +1,443 @@
+"""
+Approximate nearest-neighbour (IVF) index for institution-scale matching.
+
+Per-subject galleries are scanned exhaustively, which is fine for a class but
+not for open-set identification against every enrolled student (e.g. gate
+cameras). ``IVFIndex`` clusters the embeddings with spherical k-means into
+``nlist`` inverted lists. A search scores the query against the centroids,
+scans only the ``nprobe`` closest lists and then re-ranks the best ``rerank``
+students exactly against all of their embeddings, so a student whose other
+embeddings landed in unprobed lists is still scored correctly.
+
+``nprobe`` trades recall for latency; ``nprobe >= nlist`` is an exhaustive
+search. Until ``train`` is called every embedding sits in a single list.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.face_matcher import normalize_rows
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 40
+KMEANS_MAX_SAMPLE = 8192
+ASSIGN_CHUNK_ROWS = 4096
+
+# (student_id, similarity) pairs, best first
+SearchHits = List[Tuple[str, float]]
+
+
+class _InvertedList:
+    """Growable contiguous block of unit vectors and their student labels."""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.labels = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    @classmethod
+    def wrap(cls, vectors: np.ndarray, labels: np.ndarray) -> "_InvertedList":
+        """A full list over existing arrays; appending copies them first."""
+        inverted = cls.__new__(cls)
+        inverted.vectors, inverted.labels = vectors, labels
+        inverted.size = len(labels)
+        return inverted
+
+    def append(self, rows: np.ndarray, row_labels) -> range:
+        """Append rows labelled with one label or one label per row."""
+        needed = self.size + len(rows)
+        if needed > len(self.labels):
+            capacity = max(needed, 2 * len(self.labels))
+            vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            vectors[: self.size] = self.vectors[: self.size]
+            labels = np.empty(capacity, dtype=np.int64)
+            labels[: self.size] = self.labels[: self.size]
+            self.vectors, self.labels = vectors, labels
+
+        self.vectors[self.size : needed] = rows
+        self.labels[self.size : needed] = row_labels
+        positions = range(self.size, needed)
+        self.size = needed
+        return positions
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid of every row, in chunks to bound the score matrix."""
+    assignment = np.empty(len(vectors), dtype=np.intp)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        chunk = vectors[start : start + ASSIGN_CHUNK_ROWS]
+        assignment[start : start + len(chunk)] = (chunk @ centroids.T).argmax(axis=1)
+    return assignment
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    k: int,
+    iterations: int = KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """Unit-norm centroids of ``k`` clusters of unit vectors (cosine k-means)."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=k)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        filled = counts > 0
+        sums = np.add.reduceat(vectors[order], starts[filled], axis=0)
+        centroids[filled] = sums
+        # Re-seed empty clusters from random points
+        empty = np.flatnonzero(~filled)
+        centroids[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        normalize_rows(centroids)
+
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over every enrolled embedding of an institution."""
+
+    def __init__(self, index_id: str):
+        self.index_id = index_id
+        self.version = 0
+        self.updated_at = time.time()
+        self.dim: Optional[int] = None
+        self.trained_size = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[_InvertedList] = []
+        self._student_ids: List[str] = []
+        self._labels: Dict[str, int] = {}
+        # student label -> [(list, row), ...] of its live embeddings
+        self._locations: Dict[int, List[Tuple[int, int]]] = {}
+        self._lock = threading.RLock()
+
+    def _touch(self):
+        self.version += 1
+        self.updated_at = time.time()
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def nlist(self) -> int:
+        return len(self._lists)
+
+    @property
+    def num_students(self) -> int:
+        return len(self._locations)
+
+    @property
+    def num_embeddings(self) -> int:
+        return sum(len(locations) for locations in self._locations.values())
+
+    def _prepare(self, embeddings: Sequence) -> np.ndarray:
+        rows = np.array(embeddings, dtype=np.float32, ndmin=2)
+        if self.dim is None:
+            self.dim = rows.shape[1]
+            self._lists = [_InvertedList(self.dim)]
+        elif rows.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding dimension {rows.shape[1]} does not match "
+                f"index dimension {self.dim}"
+            )
+        return normalize_rows(rows)
+
+    def _insert(self, label: int, rows: np.ndarray):
+        if self._centroids is None:
+            assignment = np.zeros(len(rows), dtype=np.intp)
+        else:
+            assignment = _assign(rows, self._centroids)
+
+        locations = self._locations.setdefault(label, [])
+        for list_no in np.unique(assignment):
+            positions = self._lists[list_no].append(rows[assignment == list_no], label)
+            locations.extend((int(list_no), row) for row in positions)
+
+    def _delete(self, label: int) -> bool:
+        locations = self._locations.pop(label, None)
+        if locations is None:
+            return False
+        for list_no, row in locations:
+            self._lists[list_no].labels[row] = -1
+        return True
+
+    def add(self, student_id: str, embeddings: Sequence, replace: bool = False):
+        """Insert one student's embeddings into their nearest lists."""
+        if len(embeddings) == 0 and not replace:
+            return
+        with self._lock:
+            label = self._labels.get(student_id)
+            if label is None:
+                label = len(self._student_ids)
+                self._student_ids.append(student_id)
+                self._labels[student_id] = label
+            if replace:
+                self._delete(label)
+            if len(embeddings):
+                self._insert(label, self._prepare(embeddings))
+            self._touch()
+
+    def add_many(self, candidates: Iterable[Tuple[str, Sequence]]):
+        for student_id, embeddings in candidates:
+            self.add(student_id, embeddings)
+
+    def remove(self, student_id: str) -> bool:
+        with self._lock:
+            label = self._labels.get(student_id)
+            if label is None or not self._delete(label):
+                return False
+            self._touch()
+            return True
+
+    def _live_vectors(self, sample: Optional[int] = None):
+        """Copies of the live embeddings (optionally a random sample) + labels."""
+        entries = [
+            (label, list_no, row)
+            for label, locations in self._locations.items()
+            for list_no, row in locations
+        ]
+        if sample is not None and len(entries) > sample:
+            rng = np.random.default_rng(0)
+            entries = [entries[i] for i in rng.choice(len(entries), sample, False)]
+
+        vectors = np.empty((len(entries), self.dim or 0), dtype=np.float32)
+        for i, (_, list_no, row) in enumerate(entries):
+            vectors[i] = self._lists[list_no].vectors[row]
+        labels = np.array([label for label, _, _ in entries], dtype=np.int64)
+        return vectors, labels
+
+    def train(self, nlist: Optional[int] = None):
+        """
+        Cluster the current embeddings and rebuild the inverted lists.
+
+        ``nlist`` defaults to ``ML_ANN_NLIST`` or, when that is 0,
+        ``sqrt(num_embeddings)``. Clustering runs on a sample outside the
+        lock, so searches and inserts only wait for the final re-bucketing.
+        """
+        with self._lock:
+            total = self.num_embeddings
+            nlist = max(1, nlist or settings.ML_ANN_NLIST or int(np.sqrt(total)))
+            sample, _ = self._live_vectors(
+                sample=min(KMEANS_MAX_SAMPLE, nlist * KMEANS_SAMPLE_PER_LIST)
+            )
+        if len(sample) == 0:
+            return
+
+        centroids = spherical_kmeans(sample, nlist)
+        del sample
+
+        with self._lock:
+            # Picks up anything inserted or removed while clustering
+            vectors, labels = self._live_vectors()
+            assignment = _assign(vectors, centroids)
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=len(centroids))
+
+            lists = []
+            locations: Dict[int, List[Tuple[int, int]]] = {}
+            start = 0
+            for list_no, count in enumerate(counts):
+                members = order[start : start + count]
+                start += count
+                inverted = _InvertedList(self.dim, capacity=max(16, int(count)))
+                positions = inverted.append(vectors[members], labels[members])
+                for label, row in zip(labels[members].tolist(), positions):
+                    locations.setdefault(label, []).append((list_no, row))
+                lists.append(inverted)
+
+            self._centroids = centroids
+            self._lists = lists
+            self._locations = locations
+            self.trained_size = len(vectors)
+            self._touch()
+
+    def to_arrays(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        """
+        The index as metadata plus arrays: the live rows of every list,
+        concatenated in list order, with their labels and list sizes.
+        """
+        with self._lock:
+            sizes = np.zeros(self.nlist, dtype=np.int64)
+            vectors, labels = [], []
+            for list_no, inverted in enumerate(self._lists):
+                live = inverted.labels[: inverted.size] >= 0
+                sizes[list_no] = live.sum()
+                vectors.append(inverted.vectors[: inverted.size][live])
+                labels.append(inverted.labels[: inverted.size][live])
+            meta = {
+                "index_id": self.index_id,
+                "version": self.version,
+                "updated_at": self.updated_at,
+                "dim": self.dim,
+                "trained_size": self.trained_size,
+                "student_ids": list(self._student_ids),
+            }
+            arrays = {
+                "vectors": (
+                    np.concatenate(vectors)
+                    if vectors
+                    else np.zeros((0, self.dim or 0), dtype=np.float32)
+                ),
+                "labels": (
+                    np.concatenate(labels) if labels else np.zeros(0, dtype=np.int64)
+                ),
+                "sizes": sizes,
+                "centroids": (
+                    self._centroids
+                    if self._centroids is not None
+                    else np.zeros((0, self.dim or 0), dtype=np.float32)
+                ),
+            }
+            return meta, arrays
+
+    @classmethod
+    def from_arrays(cls, meta: Dict, arrays: Dict[str, np.ndarray]) -> "IVFIndex":
+        """Rebuild an index from `to_arrays`; its lists are views of the arrays."""
+        index = cls(meta["index_id"])
+        index.version = meta["version"]
+        index.updated_at = meta["updated_at"]
+        index.dim = meta["dim"]
+        index.trained_size = meta["trained_size"]
+        index._student_ids = list(meta["student_ids"])
+        index._labels = {sid: label for label, sid in enumerate(index._student_ids)}
+        if len(arrays["centroids"]):
+            index._centroids = arrays["centroids"]
+
+        bounds = np.concatenate([[0], np.cumsum(arrays["sizes"])]).tolist()
+        for list_no, (start, end) in enumerate(zip(bounds, bounds[1:])):
+            labels = arrays["labels"][start:end]
+            index._lists.append(
+                _InvertedList.wrap(arrays["vectors"][start:end], labels)
+            )
+            for row, label in enumerate(labels.tolist()):
+                index._locations.setdefault(label, []).append((list_no, row))
+        return index
+
+    def _rerank(self, query: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """Exact best similarity of each student over all their embeddings."""
+        scores = np.empty(len(labels), dtype=np.float32)
+        for i, label in enumerate(labels):
+            vectors = np.stack(
+                [
+                    self._lists[list_no].vectors[row]
+                    for list_no, row in self._locations[label]
+                ]
+            )
+            scores[i] = (vectors @ query).max()
+        return scores
+
+    def search(
+        self,
+        queries: Sequence,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None,
+    ) -> List[SearchHits]:
+        """
+        Top-``k`` students for every query, best first.
+
+        ``nprobe`` lists are scanned (default ``ML_ANN_NPROBE``) and the best
+        ``rerank`` students (default ``ML_ANN_RERANK``, at least ``k``) are
+        re-scored exactly before the final top-``k`` cut.
+        """
+        nprobe = nprobe or settings.ML_ANN_NPROBE
+        rerank = max(k, rerank or settings.ML_ANN_RERANK)
+
+        with self._lock:
+            if self.dim is None or not self._locations:
+                return [[] for _ in range(len(queries))]
+            query_matrix = self._prepare(queries)
+
+            if self._centroids is None:
+                probes = np.zeros((len(query_matrix), 1), dtype=np.intp)
+            else:
+                coarse = query_matrix @ self._centroids.T
+                nprobe = min(nprobe, coarse.shape[1])
+                probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+            results = []
+            for query, probe in zip(query_matrix, probes):
+                scores = []
+                labels = []
+                for list_no in probe:
+                    inverted = self._lists[list_no]
+                    scores.append(inverted.vectors[: inverted.size] @ query)
+                    labels.append(inverted.labels[: inverted.size])
+                scores = np.concatenate(scores)
+                labels = np.concatenate(labels)
+                live = labels >= 0
+                scores, labels = scores[live], labels[live]
+
+                # Best score per student: first occurrence in descending order
+                order = np.argsort(-scores, kind="stable")
+                _, first = np.unique(labels[order], return_index=True)
+                best = order[np.sort(first)][:rerank]
+
+                shortlist = labels[best]
+                exact = self._rerank(query, shortlist)
+                top = np.argsort(-exact, kind="stable")[:k]
+                results.append(
+                    [(self._student_ids[shortlist[i]], float(exact[i])) for i in top]
+                )
+
+            return results
+
+
+class IndexStore:
+    """
+    Thread-safe map of ``index_id`` -> ``IVFIndex``.
+
+    Indexes live in this process unless ``ML_SHARED_GALLERY_DIR`` is set, in
+    which case every server process maps one shared copy (see
+    ``shared_index``). Changes go through `update` so both work alike.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[str, IVFIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, index_id: str) -> Optional[IVFIndex]:
+        return self._indexes.get(index_id)
+
+    def put(self, index: IVFIndex):
+        """Publish a (re)built index, replacing any with the same id."""
+        with self._lock:
+            self._indexes[index.index_id] = index
+
+    def update(
+        self, index_id: str, apply: Callable[[IVFIndex], None]
+    ) -> Optional[IVFIndex]:
+        """Apply a change (``add``, ``train``, ...) to an index. None if unknown."""
+        index = self.get(index_id)
+        if index is not None:
+            apply(index)
+        return index
+
+    def evict(self, index_id: str) -> bool:
+        with self._lock:
+            return self._indexes.pop(index_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+
+def _create_store() -> IndexStore:
+    if settings.ML_SHARED_GALLERY_DIR:
+        from app.ml.shared_index import SharedIndexStore
+
+        return SharedIndexStore(os.path.join(settings.ML_SHARED_GALLERY_DIR, "indexes"))
+    return IndexStore()
+
+
+# Global ANN index store instance
+index_store = _create_store()
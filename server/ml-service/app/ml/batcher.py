@@ -0,0 +1,132 @@
+"""
+Cross-request micro-batching.
+
+When many requests arrive at once (the 9:00 attendance burst) each would do
+its own small NumPy pass. A ``MicroBatcher`` holds submissions for up to
+``max_wait_ms`` or until ``max_batch`` requests are queued under the same key,
+runs one stacked pass off the event loop, and fans the results back out.
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import ML_BATCH_REQUESTS, ML_BATCH_ROWS
+from app.ml.face_encoder import embed_crops
+
+
+class _PendingBatch:
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.items: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """
+    ``process_batch(key, items)`` receives every item queued under ``key`` and
+    must return one result per item, in order. Items are row-stacked arrays;
+    their lengths are recorded in the batch-size histograms.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[Hashable, List[Any]], List[Any]],
+        max_batch: int,
+        max_wait_ms: float,
+    ):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: Dict[Hashable, _PendingBatch] = {}
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any, key: Hashable = None) -> Any:
+        if self.max_wait == 0 or self.max_batch == 1:
+            ML_BATCH_REQUESTS.labels(self.name).observe(1)
+            ML_BATCH_ROWS.labels(self.name).observe(len(item))
+            results = await asyncio.to_thread(self.process_batch, key, [item])
+            return results[0]
+
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = _PendingBatch(key)
+            self._pending[key] = batch
+            batch.timer = loop.call_later(self.max_wait, self._flush, key)
+
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+
+        if len(batch.items) >= self.max_batch:
+            batch.timer.cancel()
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key: Hashable):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: _PendingBatch):
+        ML_BATCH_REQUESTS.labels(self.name).observe(len(batch.items))
+        ML_BATCH_ROWS.labels(self.name).observe(sum(len(i) for i in batch.items))
+        try:
+            results = await asyncio.to_thread(
+                self.process_batch, batch.key, batch.items
+            )
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def _split_rows(stacked, items: List[Any]) -> List[Any]:
+    bounds = np.cumsum([len(item) for item in items])[:-1]
+    return np.split(stacked, bounds)
+
+
+def _embed_batch(_key, crop_stacks: List[np.ndarray]) -> List[np.ndarray]:
+    """One embedding pass over the face crops of every queued request."""
+    embeddings = embed_crops(np.concatenate(crop_stacks))
+    return _split_rows(embeddings, crop_stacks)
+
+
+def _match_batch(gallery, query_stacks: List[Any]) -> List[np.ndarray]:
+    """
+    One matrix multiply of every queued request's faces against a gallery.
+    Returns each request's (faces, students) similarities; faces are assigned
+    to students per request, since uniqueness only holds within one photo.
+    """
+    scores = gallery.score(np.concatenate(query_stacks))
+    return _split_rows(scores, query_stacks)
+
+
+embedding_batcher = MicroBatcher(
+    "embedding",
+    _embed_batch,
+    max_batch=settings.ML_BATCH_MAX_SIZE,
+    max_wait_ms=settings.ML_BATCH_MAX_WAIT_MS,
+)
+
+match_batcher = MicroBatcher(
+    "match",
+    _match_batch,
+    max_batch=settings.ML_BATCH_MAX_SIZE,
+    max_wait_ms=settings.ML_BATCH_MAX_WAIT_MS,
+)
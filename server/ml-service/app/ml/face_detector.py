@@ -1,55 +1,226 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import cv2
 import mediapipe as mp
 import numpy as np
 from mediapipe.tasks import python
 from mediapipe.tasks.python import vision
 
+from app.core.config import settings
+
 MIN_FACE_AREA_RATIO = 0.04
 NUM_JITTERS = 3
 
+DETECTION_MODEL_FULL = "hog"  # legacy name for the single full-frame pass
+DETECTION_MODEL_TILED = "tiled"
+
+TILE_SIZE = 512
+TILE_OVERLAP = 0.25
+MAX_TILE_GRID = 4
+NMS_OVERLAP_THRESHOLD = 0.5
+
 # Setup MediaPipe Tasks FaceDetector
 # Use absolute path resolution to ensure it works in Docker and all environments
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 model_path = os.path.join(BASE_DIR, "blaze_face_short_range.tflite")
 
-base_options = python.BaseOptions(model_asset_path=model_path)
-options = vision.FaceDetectorOptions(
-    base_options=base_options,
-    running_mode=vision.RunningMode.IMAGE,
-    min_detection_confidence=0.6,
-)
-_detector = vision.FaceDetector.create_from_options(options)
 
+# MediaPipe detectors are not thread-safe: each worker thread gets its own.
+# Nothing is loaded at import time: a detector (and its TFLite interpreter)
+# is created in the thread or process that uses it, see `model_lifecycle`.
+_local = threading.local()
 
-def detect_faces(image: np.ndarray) -> list[tuple[int, int, int, int]]:
-    """Detect faces in image. Expects RGB (e.g. from PIL Image.convert('RGB'))."""
-    # API sends RGB from PIL; MediaPipe expects RGB — use as-is.
-    if image.ndim == 2:
-        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
 
+def _detector_options(running_mode):
+    return vision.FaceDetectorOptions(
+        base_options=python.BaseOptions(model_asset_path=model_path),
+        running_mode=running_mode,
+        min_detection_confidence=0.6,
+    )
+
+
+def get_detector():
+    """Face detector owned by the calling thread, created on first use."""
+    detector = getattr(_local, "detector", None)
+    if detector is None:
+        detector = vision.FaceDetector.create_from_options(
+            _detector_options(vision.RunningMode.IMAGE)
+        )
+        _local.detector = detector
+    return detector
+
+
+_tile_executor: Optional[ThreadPoolExecutor] = None
+_tile_executor_lock = threading.Lock()
+
+
+def _detect_boxes(image: np.ndarray) -> np.ndarray:
+    """One detector pass. Returns an (N, 5) array of x, y, w, h, score."""
     # Create MediaPipe Image
-    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=image)
+    mp_image = mp.Image(
+        image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(image)
+    )
 
     # Detect faces
-    result = _detector.detect(mp_image)
-
-    if not result.detections:
-        return []
+    result = get_detector().detect(mp_image)
 
-    faces = []
+    boxes = np.zeros((len(result.detections or []), 5), dtype=np.float32)
 
     # Parse results - FaceDetector returns bounding box in pixels
-    for detection in result.detections:
+    for i, detection in enumerate(result.detections or []):
         bbox = detection.bounding_box
-        x1 = bbox.origin_x
-        y1 = bbox.origin_y
-        w_box = bbox.width
-        h_box = bbox.height
+        score = detection.categories[0].score if detection.categories else 1.0
+        boxes[i] = (bbox.origin_x, bbox.origin_y, bbox.width, bbox.height, score)
+
+    return boxes
+
+
+def non_max_suppression(boxes: np.ndarray, overlap_threshold: float) -> np.ndarray:
+    """
+    Indices of the (x, y, w, h, score) boxes to keep, best score first.
+
+    Overlap is intersection over the *smaller* box, so a face cut in half at
+    a tile edge is dropped in favour of the whole face from the next tile.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int)
+
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-boxes[:, 4], kind="stable")
+
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        iw = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        smaller = np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[(iw * ih) / smaller <= overlap_threshold]
+
+    return np.array(keep, dtype=int)
+
+
+def _tile_origins(length: int, tile: int, stride: int) -> list[int]:
+    if length <= tile:
+        return [0]
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def _get_tile_executor() -> ThreadPoolExecutor:
+    global _tile_executor
+    with _tile_executor_lock:
+        if _tile_executor is None:
+            _tile_executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.ML_DETECT_TILE_WORKERS),
+                thread_name_prefix="ml-tile",
+            )
+    return _tile_executor
+
+
+def _detect_patch(job) -> np.ndarray:
+    """Detect on one tile, downscaled to at most `TILE_SIZE`, in frame pixels."""
+    x, y, patch = job
+    scale = min(1.0, TILE_SIZE / max(patch.shape[:2]))
+    if scale < 1.0:
+        patch = cv2.resize(
+            patch, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+
+    boxes = _detect_boxes(patch)
+    boxes[:, :4] /= scale
+    boxes[:, 0] += x
+    boxes[:, 1] += y
+    return boxes
+
+
+def detect_boxes_tiled(
+    image: np.ndarray,
+    tile_size: int = TILE_SIZE,
+    overlap: float = TILE_OVERLAP,
+    max_grid: int = MAX_TILE_GRID,
+    pyramid: bool = True,
+) -> np.ndarray:
+    """
+    Detect on overlapping tiles, in parallel, and merge the boxes with NMS.
+
+    Small back-row faces become large enough for the short-range model inside
+    a tile. Tiles grow past ``tile_size`` so there are at most ``max_grid``
+    per side, keeping very large photos to a bounded number of passes. With
+    ``pyramid`` each coarser level doubles the tile size (each tile being
+    downscaled to ``tile_size``) for the near-camera faces; the last level is
+    always one full-frame pass.
+    """
+    h, w = image.shape[:2]
+    longest = max(h, w)
+    size = max(tile_size, int(np.ceil(longest / (max_grid - (max_grid - 1) * overlap))))
+
+    jobs = []
+    while size < longest:
+        stride = max(1, int(size * (1 - overlap)))
+        jobs.extend(
+            (x, y, image[y : y + size, x : x + size])
+            for y in _tile_origins(h, size, stride)
+            for x in _tile_origins(w, size, stride)
+        )
+        if not pyramid:
+            break
+        size *= 2
+    jobs.append((0, 0, image))
+
+    results = list(_get_tile_executor().map(_detect_patch, jobs))
+    boxes = np.concatenate(results)
+    return boxes[non_max_suppression(boxes, NMS_OVERLAP_THRESHOLD)]
+
+
+def _clip_boxes(
+    boxes: np.ndarray, image: np.ndarray
+) -> tuple[list[tuple[int, int, int, int]], np.ndarray]:
+    h, w = image.shape[:2]
+    faces = []
+    scores = []
+    for x, y, w_box, h_box, score in boxes:
+        x1 = int(max(0, round(x)))
+        y1 = int(max(0, round(y)))
+        x2 = int(min(w, round(x + w_box)))
+        y2 = int(min(h, round(y + h_box)))
+        if x2 > x1 and y2 > y1:
+            faces.append((x1, y1, x2 - x1, y2 - y1))
+            scores.append(score)
+
+    return faces, np.array(scores, dtype=np.float32)
+
+
+def detect_faces_scored(
+    image: np.ndarray, model: str = DETECTION_MODEL_FULL
+) -> tuple[list[tuple[int, int, int, int]], np.ndarray]:
+    """`detect_faces` with the detector's confidence in each box."""
+    # API sends RGB from PIL; MediaPipe expects RGB — use as-is.
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+
+    if model == DETECTION_MODEL_TILED:
+        boxes = detect_boxes_tiled(image)
+    else:
+        boxes = _detect_boxes(image)
+
+    return _clip_boxes(boxes, image)
 
-        x2 = x1 + w_box
-        y2 = y1 + h_box
 
-        faces.append((y1, x2, y2, x1))
+def detect_faces(
+    image: np.ndarray, model: str = DETECTION_MODEL_FULL
+) -> list[tuple[int, int, int, int]]:
+    """
+    Detect faces in image. Expects RGB (e.g. from PIL Image.convert('RGB')).
 
-    return faces
+    Returns ``(x, y, w, h)`` boxes clipped to the image. ``model="tiled"``
+    runs `detect_boxes_tiled` for large group photos; anything else is a
+    single full-frame pass.
+    """
+    return detect_faces_scored(image, model)[0]
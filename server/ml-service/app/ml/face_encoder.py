@@ -1,19 +1,128 @@
-from typing import List
+from functools import lru_cache
+from typing import List, Sequence, Tuple
 
 import cv2
 import numpy as np
 
+from app.ml.face_matcher import normalize_rows
+from app.ml.projection import project_raw
+
 MIN_FACE_AREA_RATIO = 0.05  # face must cover at least 5% of image
 NUM_JITTERS = 5  # stronger embedding (1 is default)
 
+EMBEDDING_SIZE = (96, 96)
+EMBEDDING_DIM = EMBEDDING_SIZE[0] * EMBEDDING_SIZE[1]
+
+Box = Tuple[int, int, int, int]
+
+# (scale, dx, dy, mirrored) of each jitter; the first is the crop itself
+JITTERS = (
+    (1.0, 0, 0, False),
+    (1.0, 0, 0, True),
+    (1.0, 2, 0, False),
+    (1.0, -2, 0, False),
+    (1.0, 0, 2, False),
+    (1.0, 0, -2, False),
+    (1.06, 0, 0, False),
+    (0.94, 0, 0, False),
+    (1.06, 0, 0, True),
+    (0.94, 0, 0, True),
+)
+MAX_JITTERS = len(JITTERS)
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """Grayscale copy of an RGB image; gray images are returned as-is."""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+def crop_faces(image: np.ndarray, boxes: Sequence[Box]) -> np.ndarray:
+    """
+    Resize every ``(x, y, w, h)`` box of ``image`` into one (N, 96, 96) stack.
+
+    The frame is converted to grayscale once and each crop is resized
+    straight into its slot of a preallocated array.
+    """
+    crops = np.empty((len(boxes), *EMBEDDING_SIZE), dtype=np.uint8)
+    if len(boxes) == 0:
+        return crops
+
+    gray = to_gray(image)
+    for i, (x, y, w, h) in enumerate(boxes):
+        cv2.resize(gray[y : y + h, x : x + w], EMBEDDING_SIZE, dst=crops[i])
+    return crops
+
+
+def embed_crops(crops: np.ndarray) -> np.ndarray:
+    """
+    Embed a stack of crops from `crop_faces` into unit vectors: (N, 9216)
+    pixel vectors, projected when a projection is configured.
+    """
+    embeddings = np.empty((len(crops), EMBEDDING_DIM), dtype=np.float32)
+    embeddings[...] = crops.reshape(len(crops), EMBEDDING_DIM)
+    return project_raw(normalize_rows(embeddings))
+
+
+def jitter_count(num_jitters: int) -> int:
+    """Jitters actually used for a requested ``num_jitters``, 1 to `MAX_JITTERS`."""
+    return min(max(1, num_jitters), MAX_JITTERS)
+
+
+@lru_cache(maxsize=MAX_JITTERS)
+def _jitter_maps(num_jitters: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Source row and column of every output pixel of each jitter: (K, 96, 96)
+    h, w = EMBEDDING_SIZE
+    cy, cx = (h - 1) / 2, (w - 1) / 2
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    rows, cols = [], []
+    for scale, dx, dy, mirrored in JITTERS[:num_jitters]:
+        src_x = (xs - cx) / scale + cx - dx
+        src_y = (ys - cy) / scale + cy - dy
+        if mirrored:
+            src_x = 2 * cx - src_x
+        rows.append(np.clip(np.rint(src_y), 0, h - 1).astype(np.intp))
+        cols.append(np.clip(np.rint(src_x), 0, w - 1).astype(np.intp))
+    return np.stack(rows), np.stack(cols)
+
+
+def jitter_crops(crops: np.ndarray, num_jitters: int) -> np.ndarray:
+    """
+    Small shifts, scales and mirror images of every crop of an (N, 96, 96)
+    stack, as an (N * K, 96, 96) stack with each crop's K jitters adjacent.
+
+    All of them are sampled in one gather from precomputed pixel maps.
+    """
+    rows, cols = _jitter_maps(jitter_count(num_jitters))
+    return crops[:, rows, cols].reshape(-1, *EMBEDDING_SIZE)
+
+
+def average_jitters(embeddings: np.ndarray, num_jitters: int) -> np.ndarray:
+    """One unit embedding per crop from the embeddings of `jitter_crops`."""
+    k = jitter_count(num_jitters)
+    return normalize_rows(embeddings.reshape(-1, k, embeddings.shape[1]).mean(axis=1))
+
+
+def embed_jittered(crops: np.ndarray, num_jitters: int) -> np.ndarray:
+    """
+    `embed_crops` averaged over ``num_jitters`` jitters of each crop.
+
+    More robust to small misalignments, at ``num_jitters`` times the cost:
+    meant for enrolment, not live matching.
+    """
+    if jitter_count(num_jitters) == 1:
+        return embed_crops(crops)
+    return average_jitters(embed_crops(jitter_crops(crops, num_jitters)), num_jitters)
+
+
+def embed_faces(image: np.ndarray, boxes: Sequence[Box]) -> np.ndarray:
+    """Embed every ``(x, y, w, h)`` face of ``image`` in one vectorised pass."""
+    return embed_crops(crop_faces(image, boxes))
+
 
-def get_face_embedding(face_img: np.ndarray) -> List[float]:
+def get_face_embedding(face_img: np.ndarray, num_jitters: int = 1) -> List[float]:
     """Embedding from face crop. Expects RGB (e.g. from PIL/API)."""
-    if face_img.ndim == 2:
-        gray = face_img
-    else:
-        gray = cv2.cvtColor(face_img, cv2.COLOR_RGB2GRAY)
-    resized = cv2.resize(gray, (96, 96))
-    emb = resized.flatten().astype("float32")
-    emb /= np.linalg.norm(emb)
-    return emb.tolist()
+    h, w = face_img.shape[:2]
+    crops = crop_faces(face_img, [(0, 0, w, h)])
+    return embed_jittered(crops, num_jitters)[0].tolist()
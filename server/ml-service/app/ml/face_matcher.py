@@ -1,6 +1,7 @@
-from typing import List, Union
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 
 
 def cosine_similarity(
@@ -15,3 +16,162 @@ def cosine_similarity(
     if norm_a == 0 or norm_b == 0:
         return 0.0
     return float(np.dot(a_arr, b_arr) / (norm_a * norm_b))
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalise each row in place. Zero rows stay zero (similarity 0)."""
+    # einsum: row norms without materialising matrix**2
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))[:, np.newaxis]
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def stack_embeddings(embeddings: Sequence) -> np.ndarray:
+    """Stack a list of embeddings into a normalised (N, D) float32 matrix."""
+    if len(embeddings) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+    return normalize_rows(matrix)
+
+
+def assign_unique(scores: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    One-to-one assignment of queries (rows) to students (columns).
+
+    Pairs below ``threshold`` are never assigned. Among the rest, the
+    Hungarian algorithm picks the assignment matching the most queries with
+    the highest total similarity, so two faces in a photo never get the same
+    student. Returns each query's column, or -1 when unassigned.
+    """
+    assigned = np.full(scores.shape[0], -1, dtype=np.intp)
+    if scores.size == 0:
+        return assigned
+    eligible = scores >= threshold
+    # Similarity is in [-1, 1]: every eligible pair gains, ineligible ones don't
+    gain = np.where(eligible, 1.0 + scores.astype(np.float64), 0.0)
+    rows, cols = linear_sum_assignment(gain, maximize=True)
+    keep = eligible[rows, cols]
+    assigned[rows[keep]] = cols[keep]
+    return assigned
+
+
+def top_k_columns(scores: np.ndarray, k: int, exclude: np.ndarray) -> np.ndarray:
+    """Each row's ``k`` best columns, best first, skipping ``exclude[row]``."""
+    k = min(k, scores.shape[1] - 1) if scores.shape[1] else 0
+    if k <= 0 or scores.shape[0] == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.intp)
+    masked = scores.astype(np.float32, copy=True)
+    rows = np.flatnonzero(exclude >= 0)
+    masked[rows, exclude[rows]] = -np.inf
+    top = np.argpartition(-masked, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(masked, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+class Assignment(NamedTuple):
+    """Result of `GalleryMatrix.assign`, one entry per query."""
+
+    # Assigned student, or None when the query matched nobody uniquely
+    student_ids: List[Optional[str]]
+    # Similarity to the assigned student; when unassigned, to the closest one
+    # (which may be below the threshold or assigned to another query)
+    scores: np.ndarray
+    # Next best (student_id, similarity) pairs, best first
+    runner_ups: List[List[Tuple[str, float]]]
+
+
+class GalleryMatrix:
+    """
+    All candidate embeddings stacked into one pre-normalised float32 matrix.
+
+    Rows belonging to the same student are contiguous; ``offsets[i]`` is the
+    first row of ``student_ids[i]``. Scoring a batch of queries is one matrix
+    multiply followed by a segment-max over each student's rows.
+    """
+
+    def __init__(self, student_ids: List[str], matrix: np.ndarray, offsets):
+        self.student_ids = student_ids
+        self.matrix = matrix
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+
+    @classmethod
+    def from_candidates(
+        cls, candidates: Sequence[Tuple[str, Sequence]]
+    ) -> "GalleryMatrix":
+        """Build from ``(student_id, [embedding, ...])`` pairs.
+
+        Students without any embedding are dropped.
+        """
+        student_ids: List[str] = []
+        offsets: List[int] = []
+        rows = []
+        for student_id, embeddings in candidates:
+            if len(embeddings) == 0:
+                continue
+            student_ids.append(student_id)
+            offsets.append(len(rows))
+            rows.extend(embeddings)
+        return cls(student_ids, stack_embeddings(rows), offsets)
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    @property
+    def num_embeddings(self) -> int:
+        return self.matrix.shape[0]
+
+    def score(self, queries: Sequence) -> np.ndarray:
+        """Per-student best cosine similarity, shape (n_queries, n_students)."""
+        query_matrix = stack_embeddings(queries)
+        if len(self) == 0 or query_matrix.shape[0] == 0:
+            return np.zeros((query_matrix.shape[0], len(self)), dtype=np.float32)
+        similarities = query_matrix @ self.matrix.T
+        return np.maximum.reduceat(similarities, self.offsets, axis=1)
+
+    def best_matches(self, queries: Sequence) -> Tuple[List, np.ndarray]:
+        """Best student id and similarity for every query.
+
+        Queries are scored as unknown (``None``, -1.0) when the gallery is empty.
+        """
+        scores = self.score(queries)
+        if scores.shape[1] == 0:
+            return [None] * scores.shape[0], np.full(scores.shape[0], -1.0)
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(scores.shape[0]), best]
+        return [self.student_ids[i] for i in best], best_scores
+
+    def assign_scores(
+        self, scores: np.ndarray, threshold: float, runner_ups: int = 0
+    ) -> Assignment:
+        """`Assignment` from a ``score`` matrix of one photo's faces."""
+        if scores.shape[1] == 0:
+            return Assignment(
+                [None] * scores.shape[0],
+                np.full(scores.shape[0], -1.0),
+                [[] for _ in range(scores.shape[0])],
+            )
+        assigned = assign_unique(scores, threshold)
+        matched = assigned >= 0
+        # An unassigned face reports its closest student's similarity, though
+        # it may pass the threshold when that student went to another face;
+        # the student (possibly assigned elsewhere) is its first runner-up
+        assigned_scores = np.where(
+            matched, scores[np.arange(scores.shape[0]), assigned], scores.max(axis=1)
+        )
+
+        others = top_k_columns(scores, runner_ups, assigned)
+        other_scores = np.take_along_axis(scores, others, axis=1).tolist()
+        return Assignment(
+            [self.student_ids[c] if c >= 0 else None for c in assigned],
+            assigned_scores,
+            [
+                [(self.student_ids[c], s) for c, s in zip(row, row_scores)]
+                for row, row_scores in zip(others.tolist(), other_scores)
+            ],
+        )
+
+    def assign(
+        self, queries: Sequence, threshold: float, runner_ups: int = 0
+    ) -> Assignment:
+        """Match one photo's faces to distinct students (see `assign_unique`)."""
+        return self.assign_scores(self.score(queries), threshold, runner_ups)
@@ -0,0 +1,98 @@
+"""
+Quality of face crops, scored for every face of a photo at once.
+
+Blurry, badly exposed, tiny or doubtful detections make poor embeddings:
+they rarely match and occasionally match the wrong student. `score_crops`
+rates the (N, 96, 96) stack from `crop_faces` in a few array passes, before
+any embedding or matching work is spent on it:
+
+- sharpness: variance of each crop's Laplacian (low when blurred);
+- brightness: mean gray level (too dark or blown out);
+- size: shorter side of the detected box, in decoded pixels;
+- confidence: the detector's score (low for occluded or partial faces).
+
+``ML_FACE_QUALITY`` decides what happens to faces failing a threshold:
+"skip" leaves them out of embedding and matching, "flag" only marks them
+and "off" does not score crops.
+"""
+
+from typing import Dict, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.face_encoder import Box
+
+QUALITY_SKIP = "skip"
+QUALITY_FLAG = "flag"
+QUALITY_OFF = "off"
+
+
+class QualityThresholds(NamedTuple):
+    min_sharpness: float
+    min_brightness: float
+    max_brightness: float
+    min_size: int
+    min_confidence: float
+
+    @classmethod
+    def from_settings(cls) -> "QualityThresholds":
+        return cls(
+            settings.ML_FACE_MIN_SHARPNESS,
+            settings.ML_FACE_MIN_BRIGHTNESS,
+            settings.ML_FACE_MAX_BRIGHTNESS,
+            settings.ML_FACE_MIN_SIZE_PX,
+            settings.ML_FACE_MIN_CONFIDENCE,
+        )
+
+
+class CropQuality(NamedTuple):
+    sharpness: np.ndarray  # (N,) Laplacian variance
+    brightness: np.ndarray  # (N,) mean gray level, 0-255
+    size: np.ndarray  # (N,) shorter box side in pixels
+    confidence: np.ndarray  # (N,) detector score
+    failures: Dict[str, np.ndarray]  # check name -> (N,) bool, failed
+
+    @property
+    def acceptable(self) -> np.ndarray:
+        failed = np.zeros(len(self.sharpness), dtype=bool)
+        for mask in self.failures.values():
+            failed |= mask
+        return ~failed
+
+
+def laplacian_variance(crops: np.ndarray) -> np.ndarray:
+    """Variance of the 4-neighbour Laplacian of each crop of an (N, H, W) stack."""
+    pixels = crops.astype(np.float32)
+    laplacian = (
+        pixels[:, :-2, 1:-1]
+        + pixels[:, 2:, 1:-1]
+        + pixels[:, 1:-1, :-2]
+        + pixels[:, 1:-1, 2:]
+        - 4 * pixels[:, 1:-1, 1:-1]
+    )
+    return laplacian.var(axis=(1, 2))
+
+
+def score_crops(
+    crops: np.ndarray,
+    boxes: Sequence[Box],
+    confidences: Sequence[float],
+    thresholds: Optional[QualityThresholds] = None,
+) -> CropQuality:
+    """Quality of the crops of ``boxes`` (from `crop_faces`), and failed checks."""
+    thresholds = thresholds or QualityThresholds.from_settings()
+    sharpness = laplacian_variance(crops)
+    brightness = crops.mean(axis=(1, 2))
+    sides = np.array(boxes, dtype=np.int64, ndmin=2)[:, 2:4].reshape(-1, 2)
+    size = sides.min(axis=1)
+    confidence = np.asarray(confidences, dtype=np.float32).reshape(len(crops))
+
+    failures = {
+        "blurry": sharpness < thresholds.min_sharpness,
+        "dark": brightness < thresholds.min_brightness,
+        "overexposed": brightness > thresholds.max_brightness,
+        "small": size < thresholds.min_size,
+        "low_confidence": confidence < thresholds.min_confidence,
+    }
+    return CropQuality(sharpness, brightness, size, confidence, failures)
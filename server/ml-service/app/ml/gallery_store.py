@@ -0,0 +1,170 @@
+"""
+In-memory registry of named embedding galleries.
+
+A gallery holds the enrolled embeddings of one roster (the backend keys them
+by subject id) so callers can match against ``gallery_id`` instead of shipping
+every candidate embedding with each request. Each change bumps the gallery's
+``version``; the stacked ``GalleryMatrix`` is rebuilt lazily on the next match.
+
+Galleries live in this process unless ``ML_SHARED_GALLERY_DIR`` is set, in
+which case every server process maps one shared copy (see ``shared_gallery``),
+quantized with ``ML_GALLERY_QUANTIZATION`` (see ``quantized_gallery``).
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.face_matcher import GalleryMatrix
+
+
+class Gallery:
+    """Embeddings of one roster, grouped by student id."""
+
+    def __init__(self, gallery_id: str):
+        self.gallery_id = gallery_id
+        self.version = 0
+        self.updated_at = time.time()
+        self._embeddings: Dict[str, List[np.ndarray]] = {}
+        self._matrix: Optional[GalleryMatrix] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_matrix(
+        cls,
+        gallery_id: str,
+        matrix: GalleryMatrix,
+        version: int = 0,
+        updated_at: Optional[float] = None,
+    ) -> "Gallery":
+        """Rebuild a gallery around an existing matrix; rows become views of it."""
+        gallery = cls(gallery_id)
+        gallery.version = version
+        gallery.updated_at = updated_at if updated_at is not None else time.time()
+        bounds = [*matrix.offsets.tolist(), matrix.num_embeddings]
+        gallery._embeddings = {
+            student_id: list(matrix.matrix[bounds[i] : bounds[i + 1]])
+            for i, student_id in enumerate(matrix.student_ids)
+        }
+        gallery._matrix = matrix
+        return gallery
+
+    def _touch(self):
+        self.version += 1
+        self.updated_at = time.time()
+        self._matrix = None
+
+    def replace(self, candidates: Iterable[Tuple[str, Sequence]]):
+        embeddings_by_student: Dict[str, List[np.ndarray]] = {}
+        for student_id, embeddings in candidates:
+            rows = [np.asarray(e, dtype=np.float32) for e in embeddings]
+            if rows:
+                embeddings_by_student.setdefault(student_id, []).extend(rows)
+        with self._lock:
+            self._embeddings = embeddings_by_student
+            self._touch()
+
+    def add(self, student_id: str, embeddings: Sequence, replace: bool = False):
+        rows = [np.asarray(e, dtype=np.float32) for e in embeddings]
+        with self._lock:
+            if replace or student_id not in self._embeddings:
+                self._embeddings[student_id] = rows
+            else:
+                self._embeddings[student_id].extend(rows)
+            if not self._embeddings[student_id]:
+                del self._embeddings[student_id]
+            self._touch()
+
+    def remove(self, student_id: str) -> bool:
+        with self._lock:
+            if self._embeddings.pop(student_id, None) is None:
+                return False
+            self._touch()
+            return True
+
+    @property
+    def num_students(self) -> int:
+        return len(self._embeddings)
+
+    @property
+    def num_embeddings(self) -> int:
+        return sum(len(rows) for rows in self._embeddings.values())
+
+    @property
+    def matrix(self) -> GalleryMatrix:
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = GalleryMatrix.from_candidates(self._embeddings.items())
+            return self._matrix
+
+
+class GalleryStore:
+    """Thread-safe map of ``gallery_id`` -> ``Gallery``."""
+
+    def __init__(self):
+        self._galleries: Dict[str, Gallery] = {}
+        self._lock = threading.Lock()
+
+    def get(self, gallery_id: str) -> Optional[Gallery]:
+        return self._galleries.get(gallery_id)
+
+    def register(
+        self, gallery_id: str, candidates: Iterable[Tuple[str, Sequence]]
+    ) -> Gallery:
+        """Create or fully replace a gallery."""
+        with self._lock:
+            gallery = self._galleries.get(gallery_id) or Gallery(gallery_id)
+            gallery.replace(candidates)
+            self._galleries[gallery_id] = gallery
+            return gallery
+
+    def add_embeddings(
+        self,
+        gallery_id: str,
+        student_id: str,
+        embeddings: Sequence,
+        replace: bool = False,
+    ) -> Optional[Gallery]:
+        """Append (or replace) one student's embeddings. None if unknown."""
+        with self._lock:
+            gallery = self._galleries.get(gallery_id)
+            if gallery is None:
+                return None
+            gallery.add(student_id, embeddings, replace=replace)
+            return gallery
+
+    def remove_student(self, gallery_id: str, student_id: str) -> Optional[Gallery]:
+        with self._lock:
+            gallery = self._galleries.get(gallery_id)
+            if gallery is None:
+                return None
+            gallery.remove(student_id)
+            return gallery
+
+    def evict(self, gallery_id: str) -> bool:
+        with self._lock:
+            return self._galleries.pop(gallery_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._galleries)
+
+
+def _create_store() -> GalleryStore:
+    if settings.ML_SHARED_GALLERY_DIR and settings.ML_GALLERY_QUANTIZATION != "float32":
+        from app.ml.quantized_gallery import QuantizedGalleryStore
+
+        return QuantizedGalleryStore(
+            settings.ML_SHARED_GALLERY_DIR, settings.ML_GALLERY_QUANTIZATION
+        )
+    if settings.ML_SHARED_GALLERY_DIR:
+        from app.ml.shared_gallery import SharedGalleryStore
+
+        return SharedGalleryStore(settings.ML_SHARED_GALLERY_DIR)
+    return GalleryStore()
+
+
+# Global gallery store instance
+gallery_store = _create_store()
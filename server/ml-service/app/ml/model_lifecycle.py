@@ -0,0 +1,150 @@
+"""
+Model lifecycle: load, warm up, report readiness.
+
+Nothing heavy happens at import. At startup the lifespan calls `warm_up`
+in the background: every pipeline worker creates its own detector and runs
+the full decode -> detect -> crop -> embed path once on a synthetic image,
+so the TFLite interpreter is allocated and the first real request does not
+pay for it. The threads detecting the tiles of ``model: "tiled"`` requests
+own detectors too; each of them creates its own during warm-up as well.
+``/health`` answers as soon as the process is up; ``/ready`` only once
+warm-up has finished, so rolling deploys keep traffic on the old
+instances until the new ones are warm.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+from app.core.metrics import ML_MODEL_LOAD_SECONDS
+from app.core.worker_pool import MODE_INLINE, MODE_THREAD, worker_pool
+from app.ml import face_detector
+from app.ml.face_encoder import embed_faces
+from app.ml.projection import get_projection
+from app.utils.image_utils import decode_image
+
+logger = logging.getLogger(__name__)
+
+STATUS_STARTING = "starting"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+WARMUP_IMAGE_SIZE = (640, 480)
+WARMUP_BARRIER_TIMEOUT_S = 60
+
+
+class ModelState:
+    def __init__(self):
+        self.status = STATUS_STARTING
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == STATUS_READY
+
+
+model_state = ModelState()
+
+# Tile threads are shared by the pipeline threads of one process: warm once
+_tile_warm_lock = threading.Lock()
+_tile_workers_warm = False
+
+
+def _synthetic_image() -> bytes:
+    """A JPEG with a face-sized blob, so every pipeline stage does real work."""
+    width, height = WARMUP_IMAGE_SIZE
+    y, x = np.mgrid[:height, :width]
+    blob = ((x - width / 2) / 90) ** 2 + ((y - height / 2) / 120) ** 2 <= 1
+    pixels = np.full((height, width, 3), 90, dtype=np.uint8)
+    pixels[blob] = (200, 160, 140)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def warm_up_tile_workers():
+    """Create the detector of every tile-detection thread of this process."""
+    global _tile_workers_warm
+    with _tile_warm_lock:
+        if _tile_workers_warm:
+            return
+        workers = max(1, settings.ML_DETECT_TILE_WORKERS)
+        barrier = threading.Barrier(workers)
+
+        def warm(_):
+            face_detector.get_detector()
+            barrier.wait(timeout=WARMUP_BARRIER_TIMEOUT_S)
+
+        list(face_detector._get_tile_executor().map(warm, range(workers)))
+        _tile_workers_warm = True
+
+
+def warm_up_worker(image_bytes: bytes, barrier=None) -> float:
+    """
+    Run the pipeline once in this worker; returns the seconds it took.
+
+    With a ``barrier`` the call holds its thread until every worker has
+    started one, so each thread of the pool warms its own detector.
+    """
+    start = time.perf_counter()
+    decoded = decode_image(image_bytes)
+    face_detector.detect_faces(decoded.pixels)
+    width, height = WARMUP_IMAGE_SIZE
+    embed_faces(decoded.pixels, [(width // 4, height // 4, width // 2, height // 2)])
+    warm_up_tile_workers()
+    elapsed = time.perf_counter() - start
+    if barrier is not None:
+        barrier.wait(timeout=WARMUP_BARRIER_TIMEOUT_S)
+    return elapsed
+
+
+async def warm_up():
+    """Load the models into every worker and mark the service ready."""
+    start = time.perf_counter()
+    try:
+        if not os.path.exists(face_detector.model_path):
+            raise FileNotFoundError(
+                f"Model file not found at {face_detector.model_path}. "
+                "Run: python3 download_models.py"
+            )
+        get_projection()
+
+        image_bytes = _synthetic_image()
+        if worker_pool.mode == MODE_INLINE:
+            # Inline requests run on the event loop thread: warm its detector
+            warm_up_worker(image_bytes)
+        else:
+            barrier = (
+                threading.Barrier(worker_pool.workers)
+                if worker_pool.mode == MODE_THREAD
+                else None
+            )
+            await asyncio.gather(
+                *(
+                    worker_pool.run(warm_up_worker, image_bytes, barrier)
+                    for _ in range(worker_pool.workers)
+                )
+            )
+
+        model_state.load_seconds = time.perf_counter() - start
+        ML_MODEL_LOAD_SECONDS.set(model_state.load_seconds)
+        model_state.status = STATUS_READY
+        logger.info(
+            "Models loaded and warmed up in %.2fs (%d %s workers)",
+            model_state.load_seconds,
+            worker_pool.workers,
+            worker_pool.mode,
+        )
+    except Exception as e:
+        model_state.status = STATUS_FAILED
+        model_state.error = str(e)
+        logger.error("Model warm-up failed: %s", e)
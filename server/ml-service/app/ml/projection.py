@@ -0,0 +1,173 @@
+"""
+Optional PCA projection of face embeddings.
+
+The raw embedding is the 9216-dim (96x96) pixel vector, which dominates
+storage, network and matrix-multiply cost. A projection fitted offline on the
+enrolled corpus (see ``fit_projection.py``) maps it to a few hundred
+dimensions. It is enabled by pointing ``ML_PROJECTION_PATH`` at the saved
+``.npz``.
+
+Every embedding carries an ``embedding_version``: ``RAW_EMBEDDING_VERSION``
+for pixel vectors, the projection's own version otherwise, so vectors from
+different spaces are never compared. Raw embeddings sent by a caller are
+projected on the way in (the projection is a function of the raw vector),
+anything else that does not match the current version is rejected.
+"""
+
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.face_matcher import normalize_rows
+
+RAW_EMBEDDING_VERSION = "pixel96-v1"
+RAW_EMBEDDING_DIM = 96 * 96
+
+
+class EmbeddingVersionError(ValueError):
+    """Embeddings from a different embedding space than the service's."""
+
+
+class Projection:
+    """``y = normalize((x - mean) @ components.T)`` for unit-norm raw ``x``."""
+
+    def __init__(self, version: str, mean: np.ndarray, components: np.ndarray):
+        self.version = version
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+
+    @property
+    def dims(self) -> int:
+        return self.components.shape[0]
+
+    def apply(self, embeddings: np.ndarray) -> np.ndarray:
+        """Project (N, 9216) unit vectors to (N, dims) unit vectors."""
+        projected = (embeddings - self.mean) @ self.components.T
+        return normalize_rows(projected.astype(np.float32, copy=False))
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            version=np.array(self.version),
+            mean=self.mean,
+            components=self.components,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        with np.load(path) as data:
+            return cls(str(data["version"]), data["mean"], data["components"])
+
+
+def fit_pca(
+    embeddings: np.ndarray,
+    dims: int,
+    version: str,
+    seed: int = 0,
+) -> Projection:
+    """
+    Fit a ``dims``-component PCA with scikit-learn's randomized solver.
+
+    ``embeddings`` are raw vectors; they are normalised first, as the encoder
+    does. The randomized solver never forms the 9216 x 9216 covariance, so
+    fitting on tens of thousands of vectors takes seconds.
+    """
+    # Only needed offline, by fit_projection.py
+    from sklearn.decomposition import PCA
+
+    x = normalize_rows(np.array(embeddings, dtype=np.float32, ndmin=2))
+    pca = PCA(
+        n_components=min(dims, *x.shape), svd_solver="randomized", random_state=seed
+    )
+    pca.fit(x)
+    return Projection(version, pca.mean_, pca.components_)
+
+
+_projection: Optional[Projection] = None
+_projection_loaded = False
+_projection_lock = threading.Lock()
+
+
+def get_projection() -> Optional[Projection]:
+    """The configured projection, loaded on first use; None when disabled."""
+    global _projection, _projection_loaded
+    if not _projection_loaded:
+        with _projection_lock:
+            if not _projection_loaded:
+                if settings.ML_PROJECTION_PATH:
+                    _projection = Projection.load(settings.ML_PROJECTION_PATH)
+                _projection_loaded = True
+    return _projection
+
+
+def current_embedding_version() -> str:
+    projection = get_projection()
+    return projection.version if projection else RAW_EMBEDDING_VERSION
+
+
+def current_embedding_dim() -> int:
+    projection = get_projection()
+    return projection.dims if projection else RAW_EMBEDDING_DIM
+
+
+def project_raw(embeddings: np.ndarray) -> np.ndarray:
+    """Raw encoder output in the current embedding space."""
+    projection = get_projection()
+    return projection.apply(embeddings) if projection else embeddings
+
+
+def conform_embeddings(
+    embeddings: Sequence, embedding_version: Optional[str]
+) -> Sequence:
+    """
+    Bring caller-supplied embeddings into the current embedding space.
+
+    Current-version embeddings pass through untouched, raw ones are projected,
+    anything else raises `EmbeddingVersionError`. Callers that send no
+    version are assumed to send raw vectors when the length says so and
+    current ones otherwise.
+    """
+    current = current_embedding_version()
+    if len(embeddings) == 0 or embedding_version == current:
+        return embeddings
+
+    if embedding_version is None:
+        width = len(embeddings[0])
+        if width != RAW_EMBEDDING_DIM or current == RAW_EMBEDDING_VERSION:
+            return embeddings
+        embedding_version = RAW_EMBEDDING_VERSION
+
+    if embedding_version != RAW_EMBEDDING_VERSION:
+        raise EmbeddingVersionError(
+            f"Embedding version '{embedding_version}' does not match "
+            f"the service's '{current}'"
+        )
+
+    raw = normalize_rows(np.array(embeddings, dtype=np.float32, ndmin=2))
+    return get_projection().apply(raw)
+
+
+def conform_candidates(
+    candidates: Sequence, skipped: Optional[List[str]] = None
+) -> List[Tuple[str, Sequence]]:
+    """
+    ``(student_id, embeddings)`` pairs of request candidates, conformed.
+
+    Given a ``skipped`` list, candidates in another embedding space are left
+    out and their student ids appended to it, so one student awaiting
+    re-enrolment does not fail a whole gallery or index page; otherwise they
+    raise `EmbeddingVersionError`.
+    """
+    conformed = []
+    for c in candidates:
+        try:
+            embeddings = conform_embeddings(c.embeddings, c.embedding_version)
+        except EmbeddingVersionError:
+            if skipped is None:
+                raise
+            skipped.append(c.student_id)
+            continue
+        conformed.append((c.student_id, embeddings))
+    return conformed
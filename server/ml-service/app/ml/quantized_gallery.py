@@ -0,0 +1,406 @@
+"""
+Quantized, append-only gallery files.
+
+With ``ML_GALLERY_QUANTIZATION`` set to ``int8`` or ``float16``, galleries in
+``ML_SHARED_GALLERY_DIR`` are stored as raw row files that every worker maps
+with ``numpy.memmap``. Rows are normalised embeddings stored as codes plus a
+per-row scale (``row ~= codes * scale``). Matching scans the codes in
+chunks, so a worker only holds page-cache pages shared with every other
+worker, never a float32 copy of the gallery. The best
+``ML_GALLERY_RESCORE_K`` students of each query are then re-scored exactly
+against their float16 rows. For ``float16`` galleries these are the codes
+themselves; int8 galleries keep a float16 copy next to the codes, so their
+files take about 3/4 of float32 (1 + 2 bytes per dimension), of which each
+scan reads the quarter holding the codes.
+
+Changes append rows to the gallery's files and publish a new manifest. The
+manifest maps each student to its rows, so replaced and removed rows are only
+dropped from it. Once ``ML_GALLERY_COMPACT_RATIO`` of the rows are dead, the
+live rows are rewritten into fresh files. Galleries survive restarts only if
+``ML_SHARED_GALLERY_DIR`` is a persistent directory (gunicorn's default one is
+removed on exit); a new worker then maps them without re-registering.
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.ml.face_matcher import GalleryMatrix, stack_embeddings
+from app.ml.shared_gallery import (
+    MANIFEST_SUFFIX,
+    SharedGalleryStore,
+    _file_key,
+    _write_atomic,
+)
+
+CODE_DTYPES = {"int8": np.int8, "float16": np.float16}
+INT8_MAX = 127
+# Code rows converted to float32 at a time while scanning
+SCAN_CHUNK_ROWS = 1024
+
+CODES_SUFFIX = ".codes"
+SCALES_SUFFIX = ".scales"
+EXACT_SUFFIX = ".f16"
+
+
+def quantize_rows(rows: np.ndarray, quantization: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Normalised float rows -> (codes, per-row scales)."""
+    if quantization == "float16":
+        return rows.astype(np.float16), np.ones(len(rows), dtype=np.float32)
+    peak = np.abs(rows).max(axis=1) if rows.size else np.zeros(len(rows))
+    scales = np.where(peak > 0, peak / INT8_MAX, 1.0).astype(np.float32)
+    codes = np.rint(rows / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales
+
+
+class QuantizedGalleryMatrix(GalleryMatrix):
+    """
+    ``GalleryMatrix`` over quantized rows, which need not be contiguous per
+    student: ``rows_by_student[i]`` lists the rows of ``student_ids[i]``.
+    """
+
+    def __init__(
+        self,
+        student_ids: List[str],
+        codes: np.ndarray,
+        scales: np.ndarray,
+        exact: np.ndarray,
+        rows_by_student: List[Sequence[int]],
+        rescore_k: int,
+    ):
+        self.rows_by_student = [np.asarray(r, dtype=np.intp) for r in rows_by_student]
+        order = (
+            np.concatenate(self.rows_by_student)
+            if self.rows_by_student
+            else np.zeros(0, dtype=np.intp)
+        )
+        offsets = np.cumsum([0] + [len(r) for r in self.rows_by_student[:-1]])
+        super().__init__(student_ids, codes, offsets)
+        self.scales = scales
+        self.exact = exact
+        self.order = order
+        self.rescore_k = rescore_k
+
+    @property
+    def num_embeddings(self) -> int:
+        return len(self.order)
+
+    def _scan(self, query_matrix: np.ndarray) -> np.ndarray:
+        """Approximate similarity of every query to every stored row."""
+        similarities = np.empty(
+            (query_matrix.shape[0], self.matrix.shape[0]), dtype=np.float32
+        )
+        for start in range(0, self.matrix.shape[0], SCAN_CHUNK_ROWS):
+            end = start + SCAN_CHUNK_ROWS
+            chunk = self.matrix[start:end].astype(np.float32)
+            similarities[:, start:end] = query_matrix @ chunk.T
+            similarities[:, start:end] *= self.scales[start:end]
+        return similarities
+
+    def score(self, queries: Sequence) -> np.ndarray:
+        """Quantized scores, exact for each query's top ``rescore_k`` students."""
+        query_matrix = stack_embeddings(queries)
+        if len(self) == 0 or query_matrix.shape[0] == 0:
+            return np.zeros((query_matrix.shape[0], len(self)), dtype=np.float32)
+        similarities = self._scan(query_matrix)[:, self.order]
+        scores = np.maximum.reduceat(similarities, self.offsets, axis=1)
+
+        k = min(self.rescore_k, len(self))
+        if k > 0:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            students = np.unique(top)
+            rows = [self.rows_by_student[s] for s in students]
+            starts = np.cumsum([0] + [len(r) for r in rows[:-1]])
+            exact = self.exact[np.concatenate(rows)].astype(np.float32)
+            scores[:, students] = np.maximum.reduceat(
+                query_matrix @ exact.T, starts, axis=1
+            )
+        return scores
+
+
+class QuantizedGallery:
+    """Read-only snapshot of one published quantized gallery."""
+
+    def __init__(
+        self, gallery_id: str, version: int, updated_at: float, matrix: GalleryMatrix
+    ):
+        self.gallery_id = gallery_id
+        self.version = version
+        self.updated_at = updated_at
+        self.matrix = matrix
+
+    @property
+    def num_students(self) -> int:
+        return len(self.matrix)
+
+    @property
+    def num_embeddings(self) -> int:
+        return self.matrix.num_embeddings
+
+
+def _map_rows(path: str, dtype, rows: int, dim: Optional[int] = None) -> np.ndarray:
+    shape = (rows,) if dim is None else (rows, dim)
+    if rows == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def _write_rows(path: str, row_offset: int, array: np.ndarray):
+    """Write ``array`` starting at row ``row_offset`` of a raw row file."""
+    array = np.ascontiguousarray(array)
+    row_bytes = array.itemsize * (array.shape[1] if array.ndim == 2 else 1)
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+        # Past the published rows: bytes of an interrupted append are overwritten
+        f.seek(row_offset * row_bytes)
+        f.write(array.tobytes())
+
+
+def _conform_rows(rows: np.ndarray, manifest: dict) -> np.ndarray:
+    """Normalised ``(N, dim)`` rows; fixes the gallery's dimension on first use."""
+    rows = stack_embeddings(rows)
+    if manifest["dim"] is None:
+        manifest["dim"] = rows.shape[1]
+    elif rows.shape[1] != manifest["dim"]:
+        raise ValueError(
+            f"Embedding dimension {rows.shape[1]} does not match "
+            f"gallery dimension {manifest['dim']}"
+        )
+    return rows
+
+
+class QuantizedGalleryStore(SharedGalleryStore):
+    """``SharedGalleryStore`` keeping galleries as quantized, append-only files."""
+
+    def __init__(
+        self,
+        directory: str,
+        quantization: str = "int8",
+        rescore_k: Optional[int] = None,
+        compact_ratio: Optional[float] = None,
+    ):
+        if quantization not in CODE_DTYPES:
+            raise ValueError(f"Unknown gallery quantization '{quantization}'")
+        super().__init__(directory)
+        self.quantization = quantization
+        self.rescore_k = (
+            settings.ML_GALLERY_RESCORE_K if rescore_k is None else rescore_k
+        )
+        self.compact_ratio = (
+            settings.ML_GALLERY_COMPACT_RATIO
+            if compact_ratio is None
+            else compact_ratio
+        )
+
+    def _segment_path(self, segment: str, suffix: str) -> str:
+        return os.path.join(self.directory, segment + suffix)
+
+    def _segment_files(self, manifest: dict) -> List[str]:
+        suffixes = [CODES_SUFFIX, SCALES_SUFFIX]
+        if manifest["quantization"] == "int8":
+            suffixes.append(EXACT_SUFFIX)
+        return [self._segment_path(manifest["segment"], s) for s in suffixes]
+
+    def _files(self, manifest: dict) -> List[str]:
+        return self._segment_files(manifest) if manifest["segment"] else []
+
+    def _read_manifest(self, gallery_id: str) -> Optional[dict]:
+        try:
+            with open(self._path(gallery_id, MANIFEST_SUFFIX)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _map(self, gallery_id: str) -> Optional[QuantizedGallery]:
+        manifest_path = self._path(gallery_id, MANIFEST_SUFFIX)
+        for _ in range(2):
+            try:
+                stat = os.stat(manifest_path)
+            except FileNotFoundError:
+                self._mapped.pop(gallery_id, None)
+                return None
+            identity = (stat.st_ino, stat.st_mtime_ns)
+            cached = self._mapped.get(gallery_id)
+            if cached is not None and cached[0] == identity:
+                return cached[1]
+            manifest = self._read_manifest(gallery_id)
+            if manifest is None:
+                continue
+            try:
+                gallery = self._open(manifest)
+            except FileNotFoundError:
+                # Compacted between reading the manifest and mapping its files
+                continue
+            self._mapped[gallery_id] = (identity, gallery)
+            return gallery
+        return None
+
+    def _open(self, manifest: dict) -> QuantizedGallery:
+        rows, dim = manifest["rows"], manifest["dim"] or 0
+        codes_dtype = CODE_DTYPES[manifest["quantization"]]
+        codes_path, scales_path, *exact_path = self._segment_files(manifest)
+        codes = _map_rows(codes_path, codes_dtype, rows, dim)
+        scales = _map_rows(scales_path, np.float32, rows)
+        exact = _map_rows(exact_path[0], np.float16, rows, dim) if exact_path else codes
+        students = manifest["students"]
+        matrix = QuantizedGalleryMatrix(
+            list(students),
+            codes,
+            scales,
+            exact,
+            list(students.values()),
+            self.rescore_k,
+        )
+        return QuantizedGallery(
+            manifest["gallery_id"], manifest["version"], manifest["updated_at"], matrix
+        )
+
+    def _write_segment(self, manifest: dict, row_offset: int, rows: np.ndarray):
+        codes, scales = quantize_rows(rows, manifest["quantization"])
+        codes_path, scales_path, *exact_path = self._segment_files(manifest)
+        _write_rows(codes_path, row_offset, codes)
+        _write_rows(scales_path, row_offset, scales)
+        if exact_path:
+            _write_rows(exact_path[0], row_offset, rows.astype(np.float16))
+
+    def _compact(self, manifest: dict, candidates: Iterable[Tuple[str, Sequence]]):
+        """Rewrite ``candidates`` (student, float rows) into a fresh segment."""
+        manifest["segment"] = (
+            f"{_file_key(manifest['gallery_id'])}-{uuid.uuid4().hex[:12]}"
+        )
+        manifest["students"] = {}
+        blocks = []
+        rows = 0
+        for student_id, embeddings in candidates:
+            if len(embeddings) == 0:
+                continue
+            manifest["students"].setdefault(student_id, []).extend(
+                range(rows, rows + len(embeddings))
+            )
+            blocks.append(np.asarray(embeddings, dtype=np.float32))
+            rows += len(embeddings)
+        manifest["rows"] = rows
+        if blocks:
+            matrix = _conform_rows(np.concatenate(blocks), manifest)
+            self._write_segment(manifest, 0, matrix)
+        else:
+            for path in self._segment_files(manifest):
+                open(path, "wb").close()
+
+    def _live_rows(self, manifest: dict) -> List[Tuple[str, np.ndarray]]:
+        gallery = self._open(manifest)
+        return [
+            (student_id, gallery.matrix.exact[rows].astype(np.float32))
+            for student_id, rows in zip(
+                gallery.matrix.student_ids, gallery.matrix.rows_by_student
+            )
+        ]
+
+    def _update(
+        self,
+        gallery_id: str,
+        apply: Callable[[dict], bool],
+        create: bool = False,
+    ) -> Optional[QuantizedGallery]:
+        """Apply ``apply`` to the latest manifest and publish it if it changed."""
+        with self._lock, self._writer_lock(gallery_id):
+            manifest = self._read_manifest(gallery_id)
+            if manifest is None:
+                if not create:
+                    return None
+                manifest = {
+                    "gallery_id": gallery_id,
+                    "version": 0,
+                    "quantization": self.quantization,
+                    "dim": None,
+                    "segment": None,
+                    "rows": 0,
+                    "students": {},
+                }
+            previous_files = (
+                self._segment_files(manifest) if manifest["segment"] else []
+            )
+            if not apply(manifest):
+                return self._map(gallery_id)
+
+            live = sum(len(rows) for rows in manifest["students"].values())
+            dead = manifest["rows"] - live
+            if dead and dead >= self.compact_ratio * manifest["rows"]:
+                self._compact(manifest, self._live_rows(manifest))
+
+            manifest["version"] += 1
+            manifest["updated_at"] = time.time()
+            _write_atomic(
+                self._path(gallery_id, MANIFEST_SUFFIX),
+                lambda f: f.write(json.dumps(manifest).encode()),
+            )
+            for path in set(previous_files) - set(self._segment_files(manifest)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            return self._map(gallery_id)
+
+    def register(
+        self, gallery_id: str, candidates: Iterable[Tuple[str, Sequence]]
+    ) -> QuantizedGallery:
+        candidates = list(candidates)
+
+        def replace(manifest: dict) -> bool:
+            manifest["dim"] = None
+            manifest["quantization"] = self.quantization
+            self._compact(manifest, candidates)
+            return True
+
+        return self._update(gallery_id, replace, create=True)
+
+    def add_embeddings(
+        self,
+        gallery_id: str,
+        student_id: str,
+        embeddings: Sequence,
+        replace: bool = False,
+    ) -> Optional[QuantizedGallery]:
+        def append(manifest: dict) -> bool:
+            start = manifest["rows"]
+            if len(embeddings):
+                rows = _conform_rows(np.array(embeddings, dtype=np.float32), manifest)
+                self._write_segment(manifest, start, rows)
+                manifest["rows"] += len(rows)
+            new_rows = list(range(start, manifest["rows"]))
+            students = manifest["students"]
+            if replace or student_id not in students:
+                students[student_id] = new_rows
+            else:
+                students[student_id].extend(new_rows)
+            if not students[student_id]:
+                del students[student_id]
+            return True
+
+        return self._update(gallery_id, append)
+
+    def remove_student(
+        self, gallery_id: str, student_id: str
+    ) -> Optional[QuantizedGallery]:
+        return self._update(
+            gallery_id,
+            lambda manifest: manifest["students"].pop(student_id, None) is not None,
+        )
+
+    def evict(self, gallery_id: str) -> bool:
+        with self._lock, self._writer_lock(gallery_id):
+            self._mapped.pop(gallery_id, None)
+            manifest = self._read_manifest(gallery_id)
+            if manifest is None:
+                return False
+            os.unlink(self._path(gallery_id, MANIFEST_SUFFIX))
+            for path in self._files(manifest):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            return True
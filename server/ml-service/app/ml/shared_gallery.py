@@ -0,0 +1,207 @@
+"""
+Galleries shared by every process of a multi-worker server.
+
+With ``ML_SHARED_GALLERY_DIR`` set (``gunicorn.conf.py`` points it at a
+fresh directory on ``/dev/shm``), a gallery is not kept per process. Each
+change is published as a ``.npy`` file holding the stacked, normalised
+matrix plus a small JSON manifest with the student ids, row offsets and
+version. Workers map the file read-only (``np.load(mmap_mode="r")``), so the
+pages live once in the shared page cache however many workers serve it, and
+a worker that did not receive the update sees it on its next lookup.
+
+Writers serialise on a per-gallery ``flock``: they re-read the latest
+manifest, apply the change and publish a new file under a fresh name, then
+atomically replace the manifest. Files of older versions are unlinked; a
+worker still mapping one keeps its pages until it moves on.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.ml.face_matcher import GalleryMatrix
+from app.ml.gallery_store import Gallery, GalleryStore
+
+MANIFEST_SUFFIX = ".json"
+
+
+def _file_key(gallery_id: str) -> str:
+    # Gallery ids come from URLs: hash them into safe file names
+    return hashlib.sha1(gallery_id.encode()).hexdigest()
+
+
+def _write_atomic(path: str, write: Callable):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class SharedGalleryStore(GalleryStore):
+    """``GalleryStore`` whose galleries live in files mapped by every worker."""
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # gallery_id -> (manifest identity, gallery mapped from it)
+        self._mapped: Dict[str, Tuple[Tuple[int, int], Gallery]] = {}
+
+    def _path(self, gallery_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, _file_key(gallery_id) + suffix)
+
+    @contextmanager
+    def _writer_lock(self, gallery_id: str):
+        with open(self._path(gallery_id, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _map(self, gallery_id: str) -> Optional[Gallery]:
+        """The published gallery, remapped only when its manifest changed."""
+        manifest_path = self._path(gallery_id, MANIFEST_SUFFIX)
+        for _ in range(2):
+            try:
+                stat = os.stat(manifest_path)
+            except FileNotFoundError:
+                self._mapped.pop(gallery_id, None)
+                return None
+            identity = (stat.st_ino, stat.st_mtime_ns)
+            cached = self._mapped.get(gallery_id)
+            if cached is not None and cached[0] == identity:
+                return cached[1]
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                matrix = np.load(
+                    os.path.join(self.directory, manifest["data"]), mmap_mode="r"
+                )
+            except FileNotFoundError:
+                # Replaced between stat and open: read the newer manifest
+                continue
+            gallery = Gallery.from_matrix(
+                gallery_id,
+                GalleryMatrix(manifest["student_ids"], matrix, manifest["offsets"]),
+                version=manifest["version"],
+                updated_at=manifest["updated_at"],
+            )
+            self._mapped[gallery_id] = (identity, gallery)
+            return gallery
+        return None
+
+    def _publish(self, gallery: Gallery) -> Gallery:
+        previous_data = None
+        manifest_path = self._path(gallery.gallery_id, MANIFEST_SUFFIX)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                previous_data = json.load(f)["data"]
+
+        matrix = gallery.matrix
+        data_name = f"{_file_key(gallery.gallery_id)}-{uuid.uuid4().hex[:12]}.npy"
+        _write_atomic(
+            os.path.join(self.directory, data_name),
+            lambda f: np.save(f, matrix.matrix),
+        )
+        manifest = {
+            "gallery_id": gallery.gallery_id,
+            "version": gallery.version,
+            "updated_at": gallery.updated_at,
+            "data": data_name,
+            "student_ids": matrix.student_ids,
+            "offsets": matrix.offsets.tolist(),
+        }
+        _write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest).encode()))
+
+        if previous_data is not None and previous_data != data_name:
+            try:
+                os.unlink(os.path.join(self.directory, previous_data))
+            except FileNotFoundError:
+                pass
+        return self._map(gallery.gallery_id)
+
+    def _update(
+        self,
+        gallery_id: str,
+        apply: Callable[[Gallery], bool],
+        create: bool = False,
+    ) -> Optional[Gallery]:
+        """Apply ``apply`` to the latest version and publish it if it changed."""
+        with self._lock, self._writer_lock(gallery_id):
+            current = self._map(gallery_id)
+            if current is None and not create:
+                return None
+            gallery = (
+                Gallery.from_matrix(
+                    gallery_id, current.matrix, current.version, current.updated_at
+                )
+                if current is not None
+                else Gallery(gallery_id)
+            )
+            if not apply(gallery):
+                return current
+            return self._publish(gallery)
+
+    def get(self, gallery_id: str) -> Optional[Gallery]:
+        with self._lock:
+            return self._map(gallery_id)
+
+    def register(
+        self, gallery_id: str, candidates: Iterable[Tuple[str, Sequence]]
+    ) -> Gallery:
+        candidates = list(candidates)
+
+        def replace(gallery: Gallery) -> bool:
+            gallery.replace(candidates)
+            return True
+
+        return self._update(gallery_id, replace, create=True)
+
+    def add_embeddings(
+        self,
+        gallery_id: str,
+        student_id: str,
+        embeddings: Sequence,
+        replace: bool = False,
+    ) -> Optional[Gallery]:
+        def add(gallery: Gallery) -> bool:
+            gallery.add(student_id, embeddings, replace=replace)
+            return True
+
+        return self._update(gallery_id, add)
+
+    def remove_student(self, gallery_id: str, student_id: str) -> Optional[Gallery]:
+        return self._update(gallery_id, lambda gallery: gallery.remove(student_id))
+
+    def evict(self, gallery_id: str) -> bool:
+        with self._lock, self._writer_lock(gallery_id):
+            manifest_path = self._path(gallery_id, MANIFEST_SUFFIX)
+            self._mapped.pop(gallery_id, None)
+            try:
+                with open(manifest_path) as f:
+                    data_name = json.load(f)["data"]
+            except FileNotFoundError:
+                return False
+            os.unlink(manifest_path)
+            try:
+                os.unlink(os.path.join(self.directory, data_name))
+            except FileNotFoundError:
+                pass
+            return True
+
+    def __len__(self) -> int:
+        return sum(
+            name.endswith(MANIFEST_SUFFIX) for name in os.listdir(self.directory)
+        )
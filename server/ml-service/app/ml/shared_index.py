@@ -0,0 +1,148 @@
+"""
+ANN indexes shared by every process of a multi-worker server.
+
+Like ``shared_gallery``: with ``ML_SHARED_GALLERY_DIR`` set, an index is not
+kept per process, or a build, insert or search would only reach whichever
+worker received it. Each change is published as ``.npy`` files (the live
+rows of every list, their labels, the list sizes and the centroids) plus a
+JSON manifest with the student ids and version. Workers map the rows
+read-only and rebuild their view only when the manifest changed.
+
+Writers serialise on a per-index ``flock``: they load a private, writable
+copy of the latest version, apply the change and publish new files, then
+atomically replace the manifest and unlink the old files.
+"""
+
+import fcntl
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.ml.ann_index import IndexStore, IVFIndex
+from app.ml.shared_gallery import MANIFEST_SUFFIX, _file_key, _write_atomic
+
+ARRAYS = ("vectors", "labels", "sizes", "centroids")
+
+
+class SharedIndexStore(IndexStore):
+    """``IndexStore`` whose indexes live in files mapped by every worker."""
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # index_id -> (manifest identity, index mapped from it)
+        self._mapped: Dict[str, Tuple[Tuple[int, int], IVFIndex]] = {}
+
+    def _path(self, index_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, _file_key(index_id) + suffix)
+
+    @contextmanager
+    def _writer_lock(self, index_id: str):
+        with open(self._path(index_id, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self, index_id: str, writable: bool = False) -> Optional[IVFIndex]:
+        """The published index: mapped and cached, or a private copy to change."""
+        manifest_path = self._path(index_id, MANIFEST_SUFFIX)
+        for _ in range(2):
+            try:
+                stat = os.stat(manifest_path)
+            except FileNotFoundError:
+                self._mapped.pop(index_id, None)
+                return None
+            identity = (stat.st_ino, stat.st_mtime_ns)
+            cached = self._mapped.get(index_id)
+            if not writable and cached is not None and cached[0] == identity:
+                return cached[1]
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                arrays = {
+                    name: np.load(
+                        os.path.join(self.directory, manifest["data"][name]),
+                        mmap_mode=None if writable else "r",
+                    )
+                    for name in ARRAYS
+                }
+            except FileNotFoundError:
+                # Replaced between stat and open: read the newer manifest
+                continue
+            index = IVFIndex.from_arrays(manifest, arrays)
+            if not writable:
+                self._mapped[index_id] = (identity, index)
+            return index
+        return None
+
+    def _publish(self, index: IVFIndex) -> IVFIndex:
+        manifest_path = self._path(index.index_id, MANIFEST_SUFFIX)
+        previous = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                previous = json.load(f)["data"]
+
+        manifest, arrays = index.to_arrays()
+        prefix = f"{_file_key(index.index_id)}-{uuid.uuid4().hex[:12]}"
+        manifest["data"] = {}
+        for name in ARRAYS:
+            data_name = f"{prefix}.{name}.npy"
+            _write_atomic(
+                os.path.join(self.directory, data_name),
+                lambda f, array=arrays[name]: np.save(f, array),
+            )
+            manifest["data"][name] = data_name
+        _write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest).encode()))
+
+        self._unlink(previous.values())
+        return self._load(index.index_id)
+
+    def _unlink(self, data_names):
+        for data_name in data_names:
+            try:
+                os.unlink(os.path.join(self.directory, data_name))
+            except FileNotFoundError:
+                pass
+
+    def get(self, index_id: str) -> Optional[IVFIndex]:
+        with self._lock:
+            return self._load(index_id)
+
+    def put(self, index: IVFIndex):
+        with self._lock, self._writer_lock(index.index_id):
+            self._publish(index)
+
+    def update(
+        self, index_id: str, apply: Callable[[IVFIndex], None]
+    ) -> Optional[IVFIndex]:
+        with self._lock, self._writer_lock(index_id):
+            index = self._load(index_id, writable=True)
+            if index is None:
+                return None
+            apply(index)
+            return self._publish(index)
+
+    def evict(self, index_id: str) -> bool:
+        with self._lock, self._writer_lock(index_id):
+            manifest_path = self._path(index_id, MANIFEST_SUFFIX)
+            self._mapped.pop(index_id, None)
+            try:
+                with open(manifest_path) as f:
+                    data_names = json.load(f)["data"].values()
+            except FileNotFoundError:
+                return False
+            os.unlink(manifest_path)
+            self._unlink(data_names)
+            return True
+
+    def __len__(self) -> int:
+        return sum(
+            name.endswith(MANIFEST_SUFFIX) for name in os.listdir(self.directory)
+        )
@@ -1,5 +1,8 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
+
+from app.ml.face_encoder import MAX_JITTERS
+from app.utils.embedding_codec import Embedding
 
 
 class EncodeFaceRequest(BaseModel):
@@ -13,7 +16,13 @@ class EncodeFaceRequest(BaseModel):
         default=0.05, description="Minimum face area ratio"
     )
     num_jitters: int = Field(
-        default=5, description="Number of times to re-sample face for encoding"
+        default=5,
+        ge=1,
+        le=MAX_JITTERS,
+        description=(
+            "Shifted, scaled and mirrored copies of the face whose embeddings "
+            "are averaged (1 to 10)"
+        ),
     )
 
 
@@ -25,24 +34,42 @@ class DetectFacesRequest(BaseModel):
         default=0.04, description="Minimum face area ratio"
     )
     num_jitters: int = Field(
-        default=3, description="Number of times to re-sample face for encoding"
+        default=1,
+        ge=1,
+        le=MAX_JITTERS,
+        description=(
+            "Shifted, scaled and mirrored copies of each face whose embeddings "
+            "are averaged (1 to 10); 1 for live matching"
+        ),
+    )
+    model: str = Field(
+        default="hog",
+        description=(
+            "Detection model: hog (single full-frame pass) or tiled "
+            "(overlapping tiles + downscale pyramid, for large group photos)"
+        ),
     )
-    model: str = Field(default="hog", description="Detection model: hog or cnn")
 
 
 class CandidateEmbedding(BaseModel):
     """Candidate student embeddings for matching"""
 
     student_id: str = Field(..., description="Student ID")
-    embeddings: List[List[float]] = Field(
+    embeddings: List[Embedding] = Field(
         ..., description="List of face embeddings for this student"
     )
+    embedding_version: Optional[str] = Field(
+        default=None, description="Embedding space (inferred from length if unset)"
+    )
 
 
 class MatchFacesRequest(BaseModel):
     """Request to match a single face embedding against candidates"""
 
-    query_embedding: List[float] = Field(..., description="Face embedding to match")
+    query_embedding: Embedding = Field(..., description="Face embedding to match")
+    embedding_version: Optional[str] = Field(
+        default=None, description="Embedding space (inferred from length if unset)"
+    )
     candidate_embeddings: List[CandidateEmbedding] = Field(
         ..., description="Candidate students with embeddings"
     )
@@ -55,7 +82,7 @@ class MatchFacesRequest(BaseModel):
 class DetectedFace(BaseModel):
     """A detected face with embedding"""
 
-    embedding: List[float] = Field(..., description="Face embedding")
+    embedding: Embedding = Field(..., description="Face embedding")
 
 
 class BatchMatchRequest(BaseModel):
@@ -64,8 +91,15 @@ class BatchMatchRequest(BaseModel):
     detected_faces: List[DetectedFace] = Field(
         ..., description="List of detected faces to match"
     )
+    embedding_version: Optional[str] = Field(
+        default=None, description="Embedding space (inferred from length if unset)"
+    )
     candidate_embeddings: List[CandidateEmbedding] = Field(
-        ..., description="Candidate students with embeddings"
+        default_factory=list, description="Candidate students with embeddings"
+    )
+    gallery_id: Optional[str] = Field(
+        default=None,
+        description="Match against a registered gallery instead of candidates",
     )
     confident_threshold: float = Field(
         default=0.50, description="Threshold for confident match"
@@ -73,3 +107,107 @@ class BatchMatchRequest(BaseModel):
     uncertain_threshold: float = Field(
         default=0.60, description="Threshold for uncertain match"
     )
+    runner_ups: int = Field(
+        default=2, ge=0, le=10, description="Next best students to return per face"
+    )
+
+
+class RegisterGalleryRequest(BaseModel):
+    """Request to create or replace a named embedding gallery"""
+
+    candidate_embeddings: List[CandidateEmbedding] = Field(
+        ..., description="Enrolled students with embeddings"
+    )
+
+
+class UpdateGalleryRequest(BaseModel):
+    """Request to add embeddings for one student in a gallery"""
+
+    student_id: str = Field(..., description="Student ID")
+    embeddings: List[Embedding] = Field(..., description="Embeddings to add")
+    embedding_version: Optional[str] = Field(
+        default=None, description="Embedding space (inferred from length if unset)"
+    )
+    replace: bool = Field(
+        default=False, description="Replace the student's existing embeddings"
+    )
+
+
+class BuildIndexRequest(BaseModel):
+    """Request to create or replace an ANN index"""
+
+    candidate_embeddings: List[CandidateEmbedding] = Field(
+        default_factory=list, description="Initial students with embeddings"
+    )
+    train: bool = Field(
+        default=True, description="Cluster the initial embeddings into lists"
+    )
+    nlist: Optional[int] = Field(
+        default=None, description="Number of inverted lists (default: sqrt(N))"
+    )
+
+
+class AddIndexEmbeddingsRequest(BaseModel):
+    """Request to insert students' embeddings into an ANN index"""
+
+    candidate_embeddings: List[CandidateEmbedding] = Field(
+        ..., description="Students with embeddings to insert"
+    )
+    replace: bool = Field(
+        default=False, description="Replace these students' existing embeddings"
+    )
+
+
+class TrainIndexRequest(BaseModel):
+    """Request to re-cluster an ANN index"""
+
+    nlist: Optional[int] = Field(
+        default=None, description="Number of inverted lists (default: sqrt(N))"
+    )
+
+
+class SearchIndexRequest(BaseModel):
+    """Request for the top-k students of each query embedding"""
+
+    embeddings: List[Embedding] = Field(..., description="Query face embeddings")
+    embedding_version: Optional[str] = Field(
+        default=None, description="Embedding space (inferred from length if unset)"
+    )
+    k: int = Field(default=5, ge=1, le=100, description="Students per query")
+    nprobe: Optional[int] = Field(
+        default=None, ge=1, description="Lists to scan (higher = better recall)"
+    )
+    rerank: Optional[int] = Field(
+        default=None, ge=1, description="Students re-scored exactly before top-k"
+    )
+    threshold: float = Field(
+        default=0.50, description="Similarity needed to identify the best match"
+    )
+
+
+class RecognizeRequest(BaseModel):
+    """Request to detect and match all faces in an image in one call"""
+
+    image_base64: str = Field(..., description="Base64 encoded image string")
+    gallery_id: Optional[str] = Field(
+        default=None, description="Registered gallery to match against"
+    )
+    candidate_embeddings: List[CandidateEmbedding] = Field(
+        default_factory=list,
+        description="Candidate students with embeddings (if no gallery_id)",
+    )
+    min_face_area_ratio: float = Field(
+        default=0.04, description="Minimum face area ratio"
+    )
+    confident_threshold: float = Field(
+        default=0.50, description="Threshold for confident match"
+    )
+    model: str = Field(
+        default="hog", description="Detection model: hog or tiled (see detect-faces)"
+    )
+    return_embeddings: bool = Field(
+        default=False, description="Include face embeddings in the response"
+    )
+    runner_ups: int = Field(
+        default=2, ge=0, le=10, description="Next best students to return per face"
+    )
@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 from typing import Optional, List
 
+from app.utils.embedding_codec import Embedding
+
 
 class FaceLocation(BaseModel):
     """Face location in image"""
@@ -11,18 +13,32 @@ class FaceLocation(BaseModel):
     left: int
 
 
+class FaceQualityInfo(BaseModel):
+    """Quality of a detected face crop"""
+
+    sharpness: float  # Laplacian variance of the 96x96 crop
+    brightness: float  # mean gray level, 0-255
+    size_px: int  # shorter side of the detected box
+    confidence: float  # detector score
+    # Failed checks: "blurry", "dark", "overexposed", "small", "low_confidence"
+    issues: List[str] = []
+    acceptable: bool = True
+
+
 class EncodeFaceMetadata(BaseModel):
     """Metadata for face encoding"""
 
     face_area_ratio: float
     image_dimensions: List[int]
+    quality: Optional[FaceQualityInfo] = None
 
 
 class EncodeFaceResponse(BaseModel):
     """Response from encode face endpoint"""
 
     success: bool
-    embedding: Optional[List[float]] = None
+    embedding: Optional[Embedding] = None
+    embedding_version: Optional[str] = None
     face_location: Optional[FaceLocation] = None
     metadata: Optional[EncodeFaceMetadata] = None
     error: Optional[str] = None
@@ -32,9 +48,18 @@ class EncodeFaceResponse(BaseModel):
 class DetectedFaceInfo(BaseModel):
     """Information about a detected face"""
 
-    embedding: List[float]
+    embedding: Embedding
+    location: FaceLocation
+    face_area_ratio: float
+    quality: Optional[FaceQualityInfo] = None
+
+
+class LowQualityFace(BaseModel):
+    """A detected face left out of embedding and matching"""
+
     location: FaceLocation
     face_area_ratio: float
+    quality: FaceQualityInfo
 
 
 class DetectFacesMetadata(BaseModel):
@@ -50,6 +75,9 @@ class DetectFacesResponse(BaseModel):
     success: bool
     faces: List[DetectedFaceInfo] = []
     count: int = 0
+    # Faces skipped for their quality (not counted in ``count``)
+    low_quality_faces: List[LowQualityFace] = []
+    embedding_version: Optional[str] = None
     metadata: Optional[DetectFacesMetadata] = None
     error: Optional[str] = None
 
@@ -77,6 +105,7 @@ class MatchFacesResponse(BaseModel):
     match: Optional[MatchResult] = None
     all_distances: Optional[List[DistanceInfo]] = None
     error: Optional[str] = None
+    error_code: Optional[str] = None
 
 
 class BatchMatchResult(BaseModel):
@@ -86,6 +115,8 @@ class BatchMatchResult(BaseModel):
     student_id: Optional[str] = None
     distance: float
     status: str  # "present", "unknown"
+    # Next best students, closest first (not assigned to this face)
+    runner_ups: List[DistanceInfo] = []
 
 
 class BatchMatchResponse(BaseModel):
@@ -93,7 +124,111 @@ class BatchMatchResponse(BaseModel):
 
     success: bool
     matches: List[BatchMatchResult] = []
+    gallery_version: Optional[int] = None
+    error: Optional[str] = None
+    error_code: Optional[str] = None
+
+
+class RecognizedFace(BaseModel):
+    """A detected face with its match"""
+
+    face_index: int
+    location: FaceLocation
+    face_area_ratio: float
+    student_id: Optional[str] = None
+    distance: float
+    status: str  # "present", "unknown"
+    runner_ups: List[DistanceInfo] = []
+    embedding: Optional[Embedding] = None
+    quality: Optional[FaceQualityInfo] = None
+
+
+class RecognizeResponse(BaseModel):
+    """Response from recognize endpoint"""
+
+    success: bool
+    faces: List[RecognizedFace] = []
+    count: int = 0
+    # Faces skipped for their quality (not counted in ``count``)
+    low_quality_faces: List[LowQualityFace] = []
+    gallery_version: Optional[int] = None
+    embedding_version: Optional[str] = None
+    metadata: Optional[DetectFacesMetadata] = None
     error: Optional[str] = None
+    error_code: Optional[str] = None
+
+
+class GalleryInfo(BaseModel):
+    """Summary of a registered gallery"""
+
+    gallery_id: str
+    version: int
+    num_students: int
+    num_embeddings: int
+
+
+class GalleryResponse(BaseModel):
+    """Response from gallery management endpoints"""
+
+    success: bool
+    gallery: Optional[GalleryInfo] = None
+    # Students left out for embeddings in another embedding version
+    skipped: List[str] = []
+    error: Optional[str] = None
+    error_code: Optional[str] = None
+
+
+class IndexInfo(BaseModel):
+    """Summary of an ANN index"""
+
+    index_id: str
+    version: int
+    num_students: int
+    num_embeddings: int
+    nlist: int
+    trained: bool
+    trained_size: int
+
+
+class IndexResponse(BaseModel):
+    """Response from ANN index management endpoints"""
+
+    success: bool
+    index: Optional[IndexInfo] = None
+    # Students left out for embeddings in another embedding version
+    skipped: List[str] = []
+    error: Optional[str] = None
+    error_code: Optional[str] = None
+
+
+class IndexMatch(BaseModel):
+    """One candidate student from an index search"""
+
+    student_id: str
+    similarity: float
+    distance: float
+
+
+class IndexSearchResult(BaseModel):
+    """Search result for one query embedding"""
+
+    face_index: int
+    student_id: Optional[str] = None
+    distance: Optional[float] = None
+    status: str  # "present" or "unknown"
+    matches: List[IndexMatch]
+
+
+class IndexSearchResponse(BaseModel):
+    """Response from ANN index search"""
+
+    success: bool
+    results: List[IndexSearchResult] = []
+    count: int = 0
+    index_version: Optional[int] = None
+    processing_time_ms: Optional[float] = None
+    error: Optional[str] = None
+    error_code: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
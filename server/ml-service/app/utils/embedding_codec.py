@@ -0,0 +1,85 @@
+"""
+Compact wire encoding for face embeddings.
+
+Embeddings are accepted either as a JSON list of floats or as a tagged
+base64 string of little-endian floats, e.g. ``"f16:AAA8..."`` or
+``"f32:AACAPw..."``. Responses use the encoding the caller asks for in the
+``X-Embedding-Encoding`` header (``json``, ``f32`` or ``f16``); the default
+stays ``json`` so existing clients see plain float lists.
+"""
+
+import base64
+from contextvars import ContextVar
+from typing import Annotated, Any, Optional, Union
+
+import numpy as np
+from fastapi import Header
+from pydantic import BeforeValidator, PlainSerializer, WithJsonSchema
+
+EMBEDDING_ENCODING_HEADER = "X-Embedding-Encoding"
+
+ENCODING_JSON = "json"
+ENCODING_DTYPES = {"f32": np.dtype("<f4"), "f16": np.dtype("<f2")}
+
+_response_encoding: ContextVar[str] = ContextVar(
+    "embedding_encoding", default=ENCODING_JSON
+)
+
+
+def decode_embedding(value: Any) -> np.ndarray:
+    """Decode a float list or tagged base64 string into a float32 vector."""
+    if isinstance(value, str):
+        tag, sep, data = value.partition(":")
+        dtype = ENCODING_DTYPES.get(tag)
+        if not sep or dtype is None:
+            raise ValueError(f"Unknown embedding encoding '{tag}'")
+        raw = base64.b64decode(data, validate=True)
+        if len(raw) % dtype.itemsize:
+            raise ValueError("Embedding byte length does not match its dtype")
+        return np.frombuffer(raw, dtype=dtype).astype(np.float32, copy=False)
+
+    arr = np.asarray(value, dtype=np.float32)
+    if arr.ndim != 1:
+        raise ValueError("Embedding must be a flat list of numbers")
+    return arr
+
+
+def encode_embedding(value: Any, encoding: str) -> Union[list, str]:
+    """Encode a vector as a float list (``json``) or a tagged base64 string."""
+    dtype = ENCODING_DTYPES.get(encoding)
+    if dtype is None:
+        return np.asarray(value, dtype=np.float32).tolist()
+    raw = np.asarray(value, dtype=dtype).tobytes()
+    return f"{encoding}:{base64.b64encode(raw).decode('ascii')}"
+
+
+def _serialize_embedding(value: Any) -> Union[list, str]:
+    return encode_embedding(value, _response_encoding.get())
+
+
+async def negotiate_embedding_encoding(
+    x_embedding_encoding: Optional[str] = Header(default=None),
+) -> str:
+    """Route dependency selecting the response embedding encoding."""
+    encoding = (x_embedding_encoding or ENCODING_JSON).lower()
+    if encoding not in ENCODING_DTYPES:
+        encoding = ENCODING_JSON
+    _response_encoding.set(encoding)
+    return encoding
+
+
+# Pydantic field type: validates to a float32 ndarray and serialises to JSON
+# using the negotiated encoding.
+Embedding = Annotated[
+    Any,
+    BeforeValidator(decode_embedding),
+    PlainSerializer(_serialize_embedding, when_used="json"),
+    WithJsonSchema(
+        {
+            "anyOf": [
+                {"type": "array", "items": {"type": "number"}},
+                {"type": "string", "pattern": "^(f16|f32):"},
+            ]
+        }
+    ),
+]
@@ -0,0 +1,95 @@
+"""
+Image ingest for the ML routes.
+
+Phone photos are often 12+ megapixels while detection and the 96x96 face
+crops need far less, so images are decoded straight to a reduced size:
+OpenCV's ``IMREAD_REDUCED_*`` flags use JPEG DCT scaling (1/2, 1/4, 1/8)
+instead of decoding every pixel and resizing afterwards. The upload bytes
+are wrapped, not copied, and the RGB swap happens in place, so the decoded
+array is the only pixel buffer per request.
+
+Boxes found on the decoded image are mapped back with ``DecodedImage.scale``
+so clients always see original-image coordinates.
+"""
+
+from io import BytesIO
+from typing import NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+
+# (reduction factor, imdecode flags), largest reduction first
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+    (1, cv2.IMREAD_COLOR),
+)
+
+
+class DecodedImage(NamedTuple):
+    pixels: np.ndarray  # (H, W, 3) RGB uint8
+    scale: float  # decoded size / original size
+    original_size: Tuple[int, int]  # (width, height)
+
+
+def _reduction_flags(width: int, height: int, max_dimension: int) -> int:
+    """Largest DCT reduction that keeps the longest side >= ``max_dimension``."""
+    longest = max(width, height)
+    if max_dimension > 0:
+        for factor, flags in _REDUCED_DECODE_FLAGS:
+            if longest // factor >= max_dimension:
+                return flags
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(
+    image_bytes: bytes, max_dimension: Optional[int] = None
+) -> DecodedImage:
+    """
+    Decode an uploaded image to RGB, reduced towards ``max_dimension``.
+
+    The decoded image is never smaller than ``max_dimension`` on its longest
+    side (when the original is at least that large); ``0`` decodes at full
+    size. Defaults to ``settings.ML_DECODE_MAX_DIMENSION``. Raises if the
+    bytes are not an image.
+    """
+    if max_dimension is None:
+        max_dimension = settings.ML_DECODE_MAX_DIMENSION
+
+    # Reads the header only: size without decoding any pixels
+    with Image.open(BytesIO(image_bytes)) as header:
+        width, height = header.size
+
+        flags = _reduction_flags(width, height, max_dimension)
+        # Match PIL: pixels as stored, EXIF orientation is not applied
+        pixels = cv2.imdecode(
+            np.frombuffer(image_bytes, dtype=np.uint8),
+            flags | cv2.IMREAD_IGNORE_ORIENTATION,
+        )
+
+        if pixels is None:
+            # Formats OpenCV cannot read (e.g. GIF): full decode through PIL
+            pixels = np.asarray(header.convert("RGB"))
+        else:
+            cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB, dst=pixels)
+
+    return DecodedImage(
+        pixels=pixels,
+        scale=pixels.shape[1] / width,
+        original_size=(width, height),
+    )
+
+
+def to_original_box(
+    box: Tuple[int, int, int, int], scale: float
+) -> Tuple[int, int, int, int]:
+    """Map an ``(x, y, w, h)`` box on the decoded image to original pixels."""
+    if scale == 1.0:
+        return box
+    x, y, w, h = box
+    left, top = round(x / scale), round(y / scale)
+    return left, top, round((x + w) / scale) - left, round((y + h) / scale) - top
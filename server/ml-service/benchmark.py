@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Benchmark the ML pipeline on synthetic classroom workloads.
+
+Generates seeded JPEG "classroom photos" at several resolutions with a known
+number of face-like blobs, and synthetic galleries of 50 to 10,000 students.
+Each stage is timed in-process (decode, detect, crop, embed, gallery build,
+match). The encode-face, detect-faces, match-faces and batch-match endpoints
+are timed over HTTP. Every result reports p50/p95/p99 latency, throughput
+and peak traced memory.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --preset full --url http://localhost:8001 --output bench.json
+    python benchmark.py --output bench.json --compare baseline.json
+
+Without ``--url`` the endpoints run in-process through the ASGI app. The
+workloads are seeded, so runs on one machine do the same work. Their JSON
+files can be diffed between commits, or checked with ``--compare``, which
+exits non-zero when a p95 regressed by more than ``--fail-threshold``.
+Crops are taken at the generated face boxes, so crop/embed/match do not
+depend on what the detector finds in synthetic images.
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+from app.core.constants import CONFIDENT_THRESHOLD, DEFAULT_RUNNER_UPS
+from app.ml.face_detector import detect_faces
+from app.ml.face_encoder import crop_faces, embed_crops
+from app.ml.face_matcher import GalleryMatrix
+from app.ml.projection import current_embedding_dim
+from app.ml.quantized_gallery import QuantizedGalleryStore
+from app.utils.embedding_codec import encode_embedding
+from app.utils.image_utils import decode_image, to_original_box
+
+PRESETS = {
+    "quick": {
+        "resolutions": [(640, 480), (1920, 1080)],
+        "face_counts": [1, 10],
+        "gallery_sizes": [50, 500],
+        "iterations": 20,
+    },
+    "full": {
+        "resolutions": [(640, 480), (1920, 1080), (4032, 3024)],
+        "face_counts": [1, 10, 30],
+        "gallery_sizes": [50, 500, 2000, 10000],
+        "iterations": 50,
+    },
+}
+
+MATCH_QUERIES = 30
+WARMUP_ITERATIONS = 2
+# Larger galleries are only matched in-process: registering one over HTTP
+# means sending every embedding in one request body
+HTTP_MAX_GALLERY = 2000
+HTTP_INLINE_MAX_GALLERY = 500
+
+Box = Tuple[int, int, int, int]
+
+
+def synthetic_classroom(
+    width: int, height: int, faces: int, rng: np.random.Generator
+) -> Tuple[bytes, List[Box]]:
+    """A JPEG of ``faces`` face-like blobs in rows, and their (x, y, w, h) boxes."""
+    gradient = np.linspace(70, 150, width, dtype=np.float32)
+    pixels = np.repeat(gradient[np.newaxis, :, np.newaxis], height, axis=0)
+    pixels = np.repeat(pixels, 3, axis=2)
+    pixels += rng.normal(0, 6, pixels.shape).astype(np.float32)
+    image = np.clip(pixels, 0, 255).astype(np.uint8)
+
+    columns = max(1, int(np.ceil(np.sqrt(faces * width / height))))
+    rows = int(np.ceil(faces / columns))
+    cell_w, cell_h = width // columns, height // rows
+    size = int(min(cell_w, cell_h) * 0.6)
+    boxes = []
+    for i in range(faces):
+        row, column = divmod(i, columns)
+        w, h = size, int(size * 1.25)
+        h = min(h, int(cell_h * 0.9))
+        x = column * cell_w + (cell_w - w) // 2
+        y = row * cell_h + (cell_h - h) // 2
+        skin = tuple(int(c) for c in rng.integers(140, 220, 3))
+        center = (x + w // 2, y + h // 2)
+        cv2.ellipse(image, center, (w // 2, h // 2), 0, 0, 360, skin, -1)
+        for dx in (-w // 5, w // 5):
+            cv2.circle(
+                image, (center[0] + dx, y + h * 2 // 5), w // 12, (40, 30, 30), -1
+            )
+        cv2.ellipse(
+            image,
+            (center[0], y + h * 3 // 4),
+            (w // 6, h // 16),
+            0,
+            0,
+            360,
+            (90, 40, 50),
+            -1,
+        )
+        boxes.append((x, y, w, h))
+
+    ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    assert ok
+    return encoded.tobytes(), boxes
+
+
+def synthetic_gallery(
+    students: int, dim: int, rng: np.random.Generator, per_student: int = 1
+) -> Tuple[List[Tuple[str, np.ndarray]], np.ndarray]:
+    """``(student_id, embeddings)`` pairs and noisy queries of random students."""
+    identities = rng.standard_normal((students, dim), dtype=np.float32)
+    candidates = [
+        (
+            f"student-{i:05d}",
+            identity + 0.3 * rng.standard_normal((per_student, dim), dtype=np.float32),
+        )
+        for i, identity in enumerate(identities)
+    ]
+    picked = rng.choice(students, min(MATCH_QUERIES, students), replace=False)
+    queries = identities[picked] + 0.3 * rng.standard_normal(
+        (len(picked), dim), dtype=np.float32
+    )
+    return candidates, queries
+
+
+def measure(fn: Callable[[], object], iterations: int) -> Dict[str, float]:
+    """Latency percentiles and throughput of ``fn``, then its traced peak memory."""
+    for _ in range(WARMUP_ITERATIONS):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    wall = time.perf_counter() - started
+
+    # A separate traced call: tracemalloc slows allocation-heavy code down
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return {
+        "iterations": iterations,
+        "mean_ms": round(float(np.mean(samples)) * 1000, 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "throughput_per_s": round(iterations / wall, 2),
+        "peak_memory_mb": round(peak / 2**20, 2),
+    }
+
+
+class Benchmark:
+    def __init__(self, iterations: int):
+        self.iterations = iterations
+        self.results: List[dict] = []
+
+    def run(
+        self,
+        name: str,
+        mode: str,
+        params: dict,
+        fn: Callable[[], object],
+        remote: bool = False,
+    ):
+        entry = {"name": name, "mode": mode, "params": params}
+        try:
+            entry.update(measure(fn, self.iterations))
+        except Exception as e:
+            entry["skipped"] = f"{type(e).__name__}: {e}"
+        if remote and "peak_memory_mb" in entry:
+            # Measured in this process, not in the server
+            entry["peak_memory_mb"] = None
+        self.results.append(entry)
+        summary = entry.get("skipped") or (
+            f"p50 {entry['p50_ms']:.2f} ms  p95 {entry['p95_ms']:.2f} ms  "
+            f"{entry['throughput_per_s']:.1f}/s"
+        )
+        print(
+            f"  {mode:10} {name:14} {json.dumps(params, sort_keys=True):44} {summary}"
+        )
+
+
+def bench_stages(bench: Benchmark, images: dict, galleries: dict):
+    for (width, height, faces), (jpeg, boxes) in images.items():
+        params = {"resolution": f"{width}x{height}", "faces": faces}
+        decoded = decode_image(jpeg)
+        # Generated boxes are in original pixels: map them onto the decoded image
+        scaled = [to_original_box(box, 1 / decoded.scale) for box in boxes]
+        crops = crop_faces(decoded.pixels, scaled)
+
+        bench.run("decode", "in-process", params, lambda: decode_image(jpeg))
+        bench.run("detect", "in-process", params, lambda: detect_faces(decoded.pixels))
+        bench.run(
+            "crop", "in-process", params, lambda: crop_faces(decoded.pixels, scaled)
+        )
+        bench.run("embed", "in-process", params, lambda: embed_crops(crops))
+
+    for students, (candidates, queries) in galleries.items():
+        params = {"students": students, "queries": len(queries)}
+        gallery = GalleryMatrix.from_candidates(candidates)
+        bench.run(
+            "gallery_build",
+            "in-process",
+            params,
+            lambda: GalleryMatrix.from_candidates(candidates),
+        )
+        bench.run(
+            "match",
+            "in-process",
+            params,
+            lambda: gallery.assign(queries, CONFIDENT_THRESHOLD, DEFAULT_RUNNER_UPS),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            quantized = QuantizedGalleryStore(directory, "int8").register(
+                "bench", candidates
+            )
+            bench.run(
+                "match_int8",
+                "in-process",
+                params,
+                lambda: quantized.matrix.assign(
+                    queries, CONFIDENT_THRESHOLD, DEFAULT_RUNNER_UPS
+                ),
+            )
+
+
+def _encoded(rows: Sequence) -> list:
+    return [encode_embedding(row, "f16") for row in rows]
+
+
+def _checked(response) -> dict:
+    response.raise_for_status()
+    data = response.json()
+    if not data.get("success", True):
+        raise RuntimeError(data.get("error_code") or data.get("error"))
+    return data
+
+
+def _post(client, path: str, body: dict) -> dict:
+    # A fresh Idempotency-Key per call, so the result cache never answers
+    return _checked(
+        client.post(path, json=body, headers={"Idempotency-Key": uuid.uuid4().hex})
+    )
+
+
+def bench_endpoints(bench: Benchmark, client, mode: str, images: dict, galleries: dict):
+    remote = mode == "http"
+    for (width, height, faces), (jpeg, _) in images.items():
+        params = {"resolution": f"{width}x{height}", "faces": faces}
+        body = {
+            "image_base64": base64.b64encode(jpeg).decode(),
+            "min_face_area_ratio": 0.0,
+        }
+        if faces == 1:
+            bench.run(
+                "encode-face",
+                mode,
+                params,
+                lambda: _post(client, "/api/ml/encode-face", body),
+                remote,
+            )
+        bench.run(
+            "detect-faces",
+            mode,
+            params,
+            lambda: _post(client, "/api/ml/detect-faces", body),
+            remote,
+        )
+
+    for students, (candidates, queries) in galleries.items():
+        if students > HTTP_MAX_GALLERY:
+            continue
+        params = {"students": students, "queries": len(queries)}
+        candidate_json = [
+            {"student_id": student_id, "embeddings": _encoded(rows)}
+            for student_id, rows in candidates
+        ]
+        if students <= HTTP_INLINE_MAX_GALLERY:
+            match_body = {
+                "query_embedding": _encoded(queries[:1])[0],
+                "candidate_embeddings": candidate_json,
+                "threshold": 0.5,
+            }
+            bench.run(
+                "match-faces",
+                mode,
+                {"students": students, "queries": 1},
+                lambda: _post(client, "/api/ml/match-faces", match_body),
+                remote,
+            )
+
+        gallery_id = f"benchmark-{students}"
+        _checked(
+            client.put(
+                f"/api/ml/galleries/{gallery_id}",
+                json={"candidate_embeddings": candidate_json},
+            )
+        )
+        batch_body = {
+            "gallery_id": gallery_id,
+            "detected_faces": [{"embedding": e} for e in _encoded(queries)],
+        }
+        try:
+            bench.run(
+                "batch-match",
+                mode,
+                params,
+                lambda: _post(client, "/api/ml/batch-match", batch_body),
+                remote,
+            )
+        finally:
+            client.delete(f"/api/ml/galleries/{gallery_id}")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _result_key(entry: dict) -> str:
+    return json.dumps([entry["name"], entry["mode"], entry["params"]], sort_keys=True)
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Print p50/p95 changes against ``baseline``; the regressed result keys."""
+    previous = {_result_key(e): e for e in baseline["results"] if "p95_ms" in e}
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('git_commit') or 'baseline'}:")
+    for entry in current["results"]:
+        old = previous.get(_result_key(entry))
+        if old is None or "p95_ms" not in entry:
+            continue
+        change = entry["p95_ms"] / max(old["p95_ms"], 1e-9) - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(_result_key(entry))
+        print(
+            f"  {entry['mode']:10} {entry['name']:14} "
+            f"{json.dumps(entry['params'], sort_keys=True):44} "
+            f"p50 {old['p50_ms']:.2f} -> {entry['p50_ms']:.2f} ms  "
+            f"p95 {old['p95_ms']:.2f} -> {entry['p95_ms']:.2f} ms "
+            f"({change:+.0%}){flag}"
+        )
+    return regressions
+
+
+def run(
+    preset: str,
+    iterations: Optional[int] = None,
+    url: Optional[str] = None,
+    api_key: Optional[str] = None,
+    seed: int = 0,
+) -> dict:
+    """Run every benchmark of ``preset``; returns the JSON-ready report."""
+    config = PRESETS[preset]
+    bench = Benchmark(iterations or config["iterations"])
+    rng = np.random.default_rng(seed)
+    dim = current_embedding_dim()
+
+    images = {
+        (width, height, faces): synthetic_classroom(width, height, faces, rng)
+        for width, height in config["resolutions"]
+        for faces in config["face_counts"]
+    }
+    galleries = {
+        students: synthetic_gallery(students, dim, rng)
+        for students in config["gallery_sizes"]
+    }
+
+    bench_stages(bench, images, galleries)
+
+    headers = {"X-API-KEY": api_key or settings.API_KEY}
+    if url:
+        import httpx
+
+        with httpx.Client(base_url=url, headers=headers, timeout=120) as client:
+            bench_endpoints(bench, client, "http", images, galleries)
+    else:
+        from fastapi.testclient import TestClient
+
+        from app.main import app
+
+        with TestClient(app, headers=headers) as client:
+            bench_endpoints(bench, client, "asgi", images, galleries)
+
+    return {
+        "meta": {
+            "git_commit": _git_commit(),
+            "preset": preset,
+            "seed": seed,
+            "iterations": bench.iterations,
+            "embedding_dim": dim,
+            "target": url or "in-process",
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": bench.results,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--iterations", type=int, default=None)
+    parser.add_argument("--url", help="benchmark a running service over HTTP")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--fail-threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"Running {args.preset} benchmark...")
+    report = run(args.preset, args.iterations, args.url, args.api_key, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"✓ Wrote {len(report['results'])} results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.fail_threshold)
+        if regressions:
+            print(
+                f"✗ {len(regressions)} results regressed by more than "
+                f"{args.fail_threshold:.0%} at p95"
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
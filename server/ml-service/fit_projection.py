@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Fit the PCA projection used to shrink face embeddings.
+
+The projection is fitted offline on raw (pixel96-v1) embeddings, either from
+a saved ``.npy`` array or straight from the students collection, and written
+to an ``.npz`` that the service loads through ``ML_PROJECTION_PATH``.
+
+Usage:
+    python fit_projection.py --input embeddings.npy --dims 256 --version pca256-v1
+    python fit_projection.py --mongo-uri mongodb://localhost:27017 --dims 256
+
+Give every fitted projection a new ``--version``: embeddings stored under an
+older version are re-projected from raw vectors or re-enrolled, never
+compared with the new ones.
+"""
+
+import argparse
+import struct
+import sys
+import time
+
+import numpy as np
+
+from app.ml.projection import RAW_EMBEDDING_DIM, RAW_EMBEDDING_VERSION, fit_pca
+
+MIN_DIMS = 128
+MAX_DIMS = 512
+
+# Packed BinData embeddings written by the backend (its
+# app.utils.embedding_storage): magic, layout version, dtype code, dimension
+_PACKED_HEADER = struct.Struct("<2sBBI")
+_PACKED_DTYPES = {1: np.dtype("<f2"), 2: np.dtype("<f4")}
+
+
+def unpack_embedding(value) -> np.ndarray:
+    """A stored embedding as a float32 vector, packed BinData or float list."""
+    if not isinstance(value, (bytes, bytearray, memoryview)):
+        return np.asarray(value, dtype=np.float32)
+    magic, layout, code, dim = _PACKED_HEADER.unpack_from(value)
+    if magic != b"FE" or layout != 1 or code not in _PACKED_DTYPES:
+        raise ValueError("Not a packed face embedding")
+    return np.frombuffer(
+        value, dtype=_PACKED_DTYPES[code], count=dim, offset=_PACKED_HEADER.size
+    ).astype(np.float32)
+
+
+def load_from_mongo(uri: str, database: str, limit: int) -> np.ndarray:
+    """Every raw embedding of verified students (pymongo is optional here)."""
+    from pymongo import MongoClient
+
+    client = MongoClient(uri)
+    try:
+        cursor = client[database].students.find(
+            {
+                "verified": True,
+                "face_embeddings": {"$exists": True, "$ne": []},
+                # Students enrolled before versions were stored hold raw ones
+                "embedding_version": {"$in": [RAW_EMBEDDING_VERSION, None]},
+            },
+            {"face_embeddings": 1},
+        )
+        rows = []
+        for student in cursor:
+            embeddings = map(unpack_embedding, student["face_embeddings"])
+            rows.extend(e for e in embeddings if len(e) == RAW_EMBEDDING_DIM)
+            if limit and len(rows) >= limit:
+                break
+    finally:
+        client.close()
+    return np.array(rows[:limit] if limit else rows, dtype=np.float32)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="(N, 9216) .npy array of raw embeddings")
+    source.add_argument("--mongo-uri", help="read embeddings from this MongoDB")
+    parser.add_argument("--database", default="smart-attendance")
+    parser.add_argument("--limit", type=int, default=50000)
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--version", default=None, help="default: pca<dims>-v1")
+    parser.add_argument("--output", default="projection.npz")
+    args = parser.parse_args()
+
+    if not MIN_DIMS <= args.dims <= MAX_DIMS:
+        print(f"✗ --dims must be between {MIN_DIMS} and {MAX_DIMS}")
+        return 1
+
+    if args.input:
+        embeddings = np.load(args.input).astype(np.float32, copy=False)
+    else:
+        embeddings = load_from_mongo(args.mongo_uri, args.database, args.limit)
+
+    if embeddings.ndim != 2 or embeddings.shape[1] != RAW_EMBEDDING_DIM:
+        print(f"✗ Expected (N, {RAW_EMBEDDING_DIM}) raw embeddings")
+        return 1
+    if len(embeddings) < args.dims:
+        print(f"✗ Need at least {args.dims} embeddings, got {len(embeddings)}")
+        return 1
+
+    version = args.version or f"pca{args.dims}-v1"
+    start = time.time()
+    projection = fit_pca(embeddings, args.dims, version)
+    projection.save(args.output)
+
+    print(f"✓ Fitted {version} on {len(embeddings)} embeddings")
+    print(f"  {RAW_EMBEDDING_DIM} -> {projection.dims} dims")
+    print(f"  Took {time.time() - start:.1f}s, saved to {args.output}")
+    print(f"  Enable with ML_PROJECTION_PATH={args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Multi-process ML service: ``gunicorn -c gunicorn.conf.py app.main:app``.
+
+One uvicorn process is one GIL. This runs ``ML_PROCESSES`` uvicorn workers
+(default: one per CPU the container may use, see `_default_workers`)
+forked from a parent that has already imported the app and loaded the PCA
+projection, so that code and those arrays are shared copy-on-write. The
+detector is not created before the fork (MediaPipe handles do not survive
+it); each worker warms its own at startup.
+
+Galleries are published to a fresh directory on ``/dev/shm`` that every
+worker maps (``ML_SHARED_GALLERY_DIR``), so N workers hold one copy of the
+embedding matrices and see each other's updates; ANN indexes are shared
+there too. Prometheus metrics are aggregated across workers through
+``PROMETHEUS_MULTIPROC_DIR``. Docker gives ``/dev/shm`` 64 MB unless the
+container sets ``shm_size``; it is charged to the container's memory limit,
+so size the two together (see docker-compose.prod.yml).
+"""
+
+import math
+import os
+import shutil
+import tempfile
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().split()
+    except OSError:
+        return None
+
+
+def _cpu_quota():
+    """CPUs allowed by the cgroup (v2 ``cpu.max`` or v1 CFS quota), if limited."""
+    limit = _read("/sys/fs/cgroup/cpu.max")
+    if limit is None:
+        quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        limit = quota + period if quota and period else None
+    if not limit or limit[0] in ("max", "-1"):
+        return None
+    return max(1, math.ceil(int(limit[0]) / int(limit[1])))
+
+
+def _default_workers():
+    # Host cores can far exceed what the container may use (and its memory)
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+    cpus = cpus or os.cpu_count() or 1
+    quota = _cpu_quota()
+    return min(cpus, quota) if quota else cpus
+
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8001')}"
+workers = int(os.getenv("ML_PROCESSES", "0")) or _default_workers()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+
+_SHM_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else None
+_created_dirs = []
+
+# Read when the app is imported below, so they must be set before it
+for _variable, _prefix in (
+    ("ML_SHARED_GALLERY_DIR", "ml-galleries-"),
+    ("PROMETHEUS_MULTIPROC_DIR", "ml-metrics-"),
+):
+    if not os.getenv(_variable):
+        os.environ[_variable] = tempfile.mkdtemp(prefix=_prefix, dir=_SHM_ROOT)
+        _created_dirs.append(os.environ[_variable])
+
+
+def when_ready(server):
+    # Runs in the parent after the app is preloaded, before workers fork
+    from app.ml.projection import get_projection
+
+    try:
+        get_projection()
+    except Exception as e:
+        # Each worker's warm-up reports it and keeps /ready failing
+        server.log.warning("Projection not preloaded: %s", e)
+
+    if (
+        os.environ["ML_SHARED_GALLERY_DIR"] in _created_dirs
+        and os.getenv("ML_GALLERY_QUANTIZATION", "float32") != "float32"
+    ):
+        server.log.warning(
+            "Quantized galleries are kept in %s, which is removed on exit; "
+            "set ML_SHARED_GALLERY_DIR to a persistent directory to keep them",
+            os.environ["ML_SHARED_GALLERY_DIR"],
+        )
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    for path in _created_dirs:
+        shutil.rmtree(path, ignore_errors=True)
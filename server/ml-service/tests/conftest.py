@@ -2,6 +2,8 @@ import sys
 import os
 from unittest.mock import Mock
 
+import pytest
+
 # Add the parent directory to sys.path so tests can find 'app'
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
@@ -56,3 +58,12 @@ if "mediapipe" not in sys.modules:
     sys.modules["mediapipe.tasks"] = sys.modules["mediapipe"].tasks
     sys.modules["mediapipe.tasks.python"] = sys.modules["mediapipe"].tasks.python
     sys.modules["mediapipe.tasks.python.vision"] = sys.modules["mediapipe"].tasks.python.vision
+
+
+@pytest.fixture(autouse=True)
+def _clear_result_cache():
+    """Results cached by one test must not answer another's upload."""
+    from app.core.result_cache import result_cache
+
+    result_cache.clear()
+    yield
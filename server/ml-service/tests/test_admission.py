@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.admission import (
+    MIN_REQUEST_COST,
+    AdmissionController,
+    AdmissionMiddleware,
+    Overloaded,
+)
+
+MB = 2**20
+
+
+def test_queue_is_granted_in_arrival_order_and_sheds_when_full():
+    async def main():
+        controller = AdmissionController("/t", 4 * MB, max_queue=2, max_wait_s=5)
+        first = await controller.acquire(3 * MB)
+        order = []
+
+        async def wait(name, cost):
+            await controller.acquire(cost)
+            order.append(name)
+
+        big = asyncio.create_task(wait("big", 4 * MB))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(wait("small", MIN_REQUEST_COST))
+        await asyncio.sleep(0)
+        # The small request fits, but must not overtake the queued large one
+        assert order == [] and controller.queued == 2
+
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire(MB)
+        assert shed.value.status_code == 429
+        assert shed.value.retry_after >= 1
+
+        controller.release(first, elapsed_s=0.5)
+        await big
+        assert order == ["big"] and controller.queued == 1
+        controller.release(4 * MB)
+        await small
+        assert order == ["big", "small"]
+        assert controller.latency_s == 0.5
+
+    asyncio.run(asyncio.wait_for(main(), timeout=5))
+
+
+def test_requests_that_cannot_meet_their_deadline_get_503():
+    async def main():
+        controller = AdmissionController("/t", MB, max_queue=8, max_wait_s=0.05)
+        held = await controller.acquire(MB)
+        controller.latency_s = 2.0
+
+        # Would time out on the client before even starting
+        with pytest.raises(Overloaded) as early:
+            await controller.acquire(MB, client_timeout_s=1.0)
+        assert early.value.status_code == 503
+
+        with pytest.raises(Overloaded) as late:
+            await controller.acquire(MB)
+        assert late.value.status_code == 503
+        assert controller.queued == 0
+
+        controller.release(held)
+        assert controller.in_flight == 0
+
+    asyncio.run(asyncio.wait_for(main(), timeout=5))
+
+
+def test_middleware_answers_overload_with_retry_after():
+    app = FastAPI()
+
+    @app.post("/api/ml/detect-faces")
+    async def detect():
+        return {"success": True}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    middleware = AdmissionMiddleware(app, capacity_mb=1, max_queue=0, max_wait_s=1)
+    controller = middleware.controllers["/api/ml/detect-faces"]
+    client = TestClient(middleware)
+
+    assert client.post("/api/ml/detect-faces", content=b"x").json()["success"]
+    assert controller.in_flight == 0 and controller.running == 0
+
+    controller.in_flight = MB
+    response = client.post("/api/ml/detect-faces", content=b"x")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert response.json()["error_code"] == "SERVICE_OVERLOADED"
+    # Other paths are not admission controlled
+    assert client.get("/health").status_code == 200
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+from app.ml.ann_index import IVFIndex, spherical_kmeans
+from app.ml.face_matcher import GalleryMatrix
+
+
+def _clustered_students(n_students=200, per_student=3, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_students, dim)).astype(np.float32)
+    return [
+        (f"s{i}", center + 0.1 * rng.standard_normal((per_student, dim)))
+        for i, center in enumerate(centers)
+    ], centers
+
+
+def test_spherical_kmeans_returns_unit_centroids():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    centroids = spherical_kmeans(vectors, 8)
+
+    assert centroids.shape == (8, 16)
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, rtol=1e-5)
+
+
+def test_untrained_index_is_exhaustive():
+    students, centers = _clustered_students(n_students=50)
+    index = IVFIndex("t")
+    index.add_many(students)
+
+    hits = index.search(centers[:10], k=3)
+    ids, scores = GalleryMatrix.from_candidates(students).best_matches(centers[:10])
+
+    assert not index.trained
+    assert [h[0][0] for h in hits] == ids
+    np.testing.assert_allclose([h[0][1] for h in hits], scores, rtol=1e-5)
+    assert all(len(h) == 3 for h in hits)
+
+
+def test_trained_index_finds_students():
+    students, centers = _clustered_students()
+    index = IVFIndex("t")
+    index.add_many(students)
+    index.train(nlist=16)
+
+    hits = index.search(centers, k=1, nprobe=4)
+
+    assert index.trained and index.nlist == 16
+    assert index.trained_size == 600
+    recall = np.mean([h[0][0] == f"s{i}" for i, h in enumerate(hits)])
+    assert recall >= 0.95
+
+
+def test_full_probe_matches_exhaustive_search():
+    students, centers = _clustered_students(n_students=100)
+    index = IVFIndex("t")
+    index.add_many(students)
+    index.train(nlist=8)
+
+    hits = index.search(centers, k=1, nprobe=8)
+    ids, _ = GalleryMatrix.from_candidates(students).best_matches(centers)
+
+    assert [h[0][0] for h in hits] == ids
+
+
+def test_incremental_insert_remove_and_replace():
+    students, _ = _clustered_students(n_students=100)
+    index = IVFIndex("t")
+    index.add_many(students)
+    index.train(nlist=8)
+
+    new = np.ones((1, 32), dtype=np.float32)
+    index.add("new", new)
+    assert index.search(new, k=1)[0][0][0] == "new"
+
+    index.add("new", -new, replace=True)
+    assert index.search(-new, k=1)[0][0][0] == "new"
+    assert index.num_embeddings == 301
+
+    assert index.remove("new")
+    assert index.search(-new, k=1)[0][0][0] != "new"
+    assert not index.remove("new")
+    assert index.num_students == 100
+
+
+def test_rerank_scores_all_of_a_students_embeddings():
+    # Students with embeddings far apart land in several lists
+    rng = np.random.default_rng(1)
+    students = [
+        (f"s{i}", rng.standard_normal((4, 16)).astype(np.float32)) for i in range(60)
+    ]
+    index = IVFIndex("t")
+    index.add_many(students)
+    index.train(nlist=8)
+    gallery = GalleryMatrix.from_candidates(students)
+    queries = rng.standard_normal((5, 16)).astype(np.float32)
+
+    hits = index.search(queries, k=5, nprobe=1)
+    exact = gallery.score(queries)
+
+    for query_hits, query_exact in zip(hits, exact):
+        for student_id, score in query_hits:
+            column = gallery.student_ids.index(student_id)
+            assert score == pytest.approx(query_exact[column], rel=1e-5)
+
+
+def test_dimension_mismatch_raises():
+    index = IVFIndex("t")
+    index.add("a", np.ones((1, 8)))
+    with pytest.raises(ValueError):
+        index.add("b", np.ones((1, 4)))
+    with pytest.raises(ValueError):
+        index.search(np.ones((1, 4)))
+
+
+def test_empty_index_search():
+    assert IVFIndex("t").search(np.ones((2, 8))) == [[], []]
+
+
+def test_shared_store_is_seen_by_every_worker(tmp_path):
+    from app.ml.shared_index import SharedIndexStore
+
+    students, centers = _clustered_students(n_students=40, dim=16)
+    worker_a = SharedIndexStore(str(tmp_path))
+    worker_b = SharedIndexStore(str(tmp_path))
+    index = IVFIndex("t")
+    index.add_many(students[:30])
+    worker_a.put(index)
+
+    assert worker_b.update("t", lambda i: i.add_many(students[30:])) is not None
+    assert worker_a.update("t", lambda i: i.train(nlist=4)) is not None
+    mapped = worker_b.get("t")
+    assert all(isinstance(inverted.vectors, np.memmap) for inverted in mapped._lists)
+    assert mapped.trained and mapped.num_students == 40
+    [[(student_id, _)]] = mapped.search(centers[35:36], k=1, nprobe=4)
+    assert student_id == "s35"
+
+    worker_b.update("t", lambda i: i.remove("s35"))
+    [[(student_id, _)]] = worker_a.get("t").search(centers[35:36], k=1, nprobe=4)
+    assert student_id != "s35"
+    assert worker_a.update("missing", lambda i: None) is None
+
+    assert worker_a.evict("t") is True
+    assert worker_b.get("t") is None and len(worker_b) == 0
@@ -5,7 +5,9 @@ import numpy as np
 import io
 from PIL import Image
 from app.core.config import settings
-from unittest.mock import patch
+from unittest.mock import AsyncMock, MagicMock, patch
+from starlette.websockets import WebSocketDisconnect
+import pytest
 import app.api.routes.face_recognition as fr_module
 
 client = TestClient(app)
@@ -89,9 +91,9 @@ def test_match_faces():
 def test_encode_face_success():
     b64_img = create_dummy_image_b64()
     # Mock detect_faces using patch.object to ensure we hit the right module reference
-    with patch.object(fr_module, "detect_faces") as mock_detect:
-        # Mock must return list of (x,y,w,h) tuples
-        mock_detect.return_value = [(10, 10, 50, 50)]
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        # Mock must return (x,y,w,h) tuples and their scores
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
 
         response = client.post("/api/ml/encode-face", json={"image_base64": b64_img})
         assert response.status_code == 200
@@ -107,8 +109,8 @@ def test_encode_face_success():
 
 def test_detect_faces_success():
     b64_img = create_dummy_image_b64()
-    with patch.object(fr_module, "detect_faces") as mock_detect:
-        mock_detect.return_value = [(10, 10, 50, 50)]
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
 
         response = client.post("/api/ml/detect-faces", json={"image_base64": b64_img})
         assert response.status_code == 200
@@ -120,3 +122,517 @@ def test_detect_faces_success():
         assert loc["left"] == 10
         assert loc["right"] == 60
         assert loc["bottom"] == 60
+
+        # Live matching skips jitters unless asked; enrolment averages them
+        jittered = client.post(
+            "/api/ml/detect-faces", json={"image_base64": b64_img, "num_jitters": 5}
+        ).json()
+        encoded = client.post(
+            "/api/ml/encode-face", json={"image_base64": b64_img}
+        ).json()
+        assert jittered["faces"][0]["embedding"] == encoded["embedding"]
+        assert jittered["faces"][0]["embedding"] != data["faces"][0]["embedding"]
+
+
+def test_num_jitters_out_of_range_is_rejected():
+    b64_img = create_dummy_image_b64()
+    for num_jitters in (0, 11):
+        for path in ("/api/ml/detect-faces", "/api/ml/encode-face"):
+            response = client.post(
+                path, json={"image_base64": b64_img, "num_jitters": num_jitters}
+            )
+            assert response.status_code == 422
+        response = client.post(
+            f"/api/ml/detect-faces/raw?num_jitters={num_jitters}",
+            content=base64.b64decode(b64_img),
+            headers={"Content-Type": "image/jpeg"},
+        )
+        assert response.status_code == 422
+
+
+def test_detect_faces_reports_original_coordinates_for_reduced_decode():
+    b64_img = create_dummy_image_b64(width=4000, height=3000)
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(100, 100, 500, 500)], [0.9])
+
+        response = client.post("/api/ml/detect-faces", json={"image_base64": b64_img})
+        data = response.json()
+
+        # decoded at half size (2000x1500), reported in original pixels
+        assert mock_detect.call_args.args[0].shape == (1500, 2000, 3)
+        assert data["metadata"]["image_dimensions"] == [4000, 3000]
+        loc = data["faces"][0]["location"]
+        assert loc == {"top": 200, "right": 1200, "bottom": 1200, "left": 200}
+
+
+def test_detect_faces_passes_model_to_detector():
+    b64_img = create_dummy_image_b64()
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
+
+        response = client.post(
+            "/api/ml/detect-faces", json={"image_base64": b64_img, "model": "tiled"}
+        )
+        assert response.json()["success"] is True
+        assert mock_detect.call_args.args[1] == "tiled"
+
+
+def test_gallery_register_and_batch_match():
+    gallery_id = "subject-gallery-test"
+    response = client.put(
+        f"/api/ml/galleries/{gallery_id}",
+        json={
+            "candidate_embeddings": [
+                {"student_id": "student1", "embeddings": [[1.0, 0.0, 0.0]]},
+                {"student_id": "student2", "embeddings": [[0.0, 1.0, 0.0]]},
+            ]
+        },
+    )
+    data = response.json()
+    assert data["success"] is True
+    assert data["gallery"]["num_students"] == 2
+    version = data["gallery"]["version"]
+
+    response = client.post(
+        f"/api/ml/galleries/{gallery_id}/embeddings",
+        json={"student_id": "student3", "embeddings": [[0.0, 0.0, 1.0]]},
+    )
+    data = response.json()
+    assert data["gallery"]["num_students"] == 3
+    assert data["gallery"]["version"] > version
+
+    response = client.post(
+        "/api/ml/batch-match",
+        json={
+            "detected_faces": [{"embedding": [0.0, 0.1, 0.9]}],
+            "gallery_id": gallery_id,
+        },
+    )
+    data = response.json()
+    assert data["success"] is True
+    assert data["gallery_version"] == version + 1
+    assert data["matches"][0]["student_id"] == "student3"
+
+    response = client.delete(f"/api/ml/galleries/{gallery_id}")
+    assert response.json()["success"] is True
+
+
+def test_index_build_insert_and_search():
+    index_id = "students-index-test"
+    response = client.put(
+        f"/api/ml/indexes/{index_id}",
+        json={
+            "candidate_embeddings": [
+                {"student_id": "student1", "embeddings": [[1.0, 0.0, 0.0]]},
+                {"student_id": "student2", "embeddings": [[0.0, 1.0, 0.0]]},
+            ],
+            "nlist": 2,
+        },
+    )
+    data = response.json()
+    assert data["success"] is True
+    assert data["index"]["trained"] is True
+    assert data["index"]["nlist"] == 2
+
+    response = client.post(
+        f"/api/ml/indexes/{index_id}/embeddings",
+        json={
+            "candidate_embeddings": [
+                {"student_id": "student3", "embeddings": [[0.0, 0.0, 1.0]]},
+                # Awaiting re-enrolment: left out instead of failing the page
+                {
+                    "student_id": "student4",
+                    "embeddings": [[0.5, 0.5, 0.0]],
+                    "embedding_version": "pca128-old",
+                },
+            ]
+        },
+    )
+    data = response.json()
+    assert data["success"] is True
+    assert data["index"]["num_students"] == 3
+    assert data["skipped"] == ["student4"]
+
+    response = client.post(
+        f"/api/ml/indexes/{index_id}/search",
+        json={
+            "embeddings": [[0.0, 0.1, 0.9], [-1.0, -1.0, -1.0]],
+            "k": 2,
+            "nprobe": 2,
+        },
+    )
+    data = response.json()
+    assert data["success"] is True
+    assert data["results"][0]["student_id"] == "student3"
+    assert data["results"][0]["status"] == "present"
+    assert len(data["results"][0]["matches"]) == 2
+    assert data["results"][1]["status"] == "unknown"
+    assert data["results"][1]["student_id"] is None
+
+    response = client.delete(f"/api/ml/indexes/{index_id}")
+    assert response.json()["success"] is True
+
+
+def test_index_unknown_id():
+    response = client.post(
+        "/api/ml/indexes/missing/search", json={"embeddings": [[1.0, 0.0]]}
+    )
+    assert response.json()["error_code"] == "INDEX_NOT_FOUND"
+
+    response = client.post("/api/ml/indexes/missing/train", json={})
+    assert response.json()["error_code"] == "INDEX_NOT_FOUND"
+
+
+def test_batch_match_unknown_gallery():
+    response = client.post(
+        "/api/ml/batch-match",
+        json={"detected_faces": [{"embedding": [1.0]}], "gallery_id": "missing"},
+    )
+    data = response.json()
+    assert data["success"] is False
+    assert data["error_code"] == "GALLERY_NOT_FOUND"
+
+
+def test_detect_faces_binary_embedding_encoding():
+    b64_img = create_dummy_image_b64()
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
+
+        json_data = client.post(
+            "/api/ml/detect-faces", json={"image_base64": b64_img}
+        ).json()
+        f16_data = client.post(
+            "/api/ml/detect-faces",
+            json={"image_base64": b64_img},
+            headers={"X-Embedding-Encoding": "f16"},
+        ).json()
+
+    encoded = f16_data["faces"][0]["embedding"]
+    assert encoded.startswith("f16:")
+    decoded = np.frombuffer(base64.b64decode(encoded[4:]), dtype="<f2")
+    expected = np.array(json_data["faces"][0]["embedding"])
+    assert decoded.shape == expected.shape
+    assert np.allclose(decoded, expected, atol=1e-3)
+
+
+def test_batch_match_accepts_binary_embeddings():
+    def f32(values):
+        raw = np.asarray(values, dtype="<f4").tobytes()
+        return "f32:" + base64.b64encode(raw).decode()
+
+    response = client.post(
+        "/api/ml/batch-match",
+        json={
+            "detected_faces": [{"embedding": f32([0.0, 1.0])}],
+            "candidate_embeddings": [
+                {"student_id": "student1", "embeddings": [f32([1.0, 0.0])]},
+                {"student_id": "student2", "embeddings": [[0.0, 1.0]]},
+            ],
+        },
+    )
+    data = response.json()
+    assert data["success"] is True
+    assert data["matches"][0]["student_id"] == "student2"
+
+
+def test_batch_match_assigns_each_student_once():
+    response = client.post(
+        "/api/ml/batch-match",
+        json={
+            "detected_faces": [
+                {"embedding": [1.0, 0.2]},
+                {"embedding": [1.0, 0.0]},
+            ],
+            "candidate_embeddings": [
+                {"student_id": "student1", "embeddings": [[1.0, 0.0]]},
+                {"student_id": "student2", "embeddings": [[0.6, 0.8]]},
+            ],
+            "runner_ups": 1,
+        },
+    )
+    matches = response.json()["matches"]
+    assert [m["student_id"] for m in matches] == ["student2", "student1"]
+    assert matches[0]["runner_ups"][0]["student_id"] == "student1"
+
+
+def test_batch_match_reports_the_real_distance_of_unassigned_faces():
+    response = client.post(
+        "/api/ml/batch-match",
+        json={
+            "detected_faces": [
+                {"embedding": [1.0, 0.0]},
+                {"embedding": [0.8, 0.6]},
+            ],
+            "candidate_embeddings": [
+                {"student_id": "student1", "embeddings": [[1.0, 0.0]]},
+            ],
+        },
+    )
+    matches = response.json()["matches"]
+    assert [m["student_id"] for m in matches] == ["student1", None]
+    assert matches[1]["status"] == "unknown"
+    # The distance to student1, not a sentinel
+    assert matches[1]["distance"] == pytest.approx(0.2)
+
+
+def test_invalid_binary_embedding_rejected():
+    response = client.post(
+        "/api/ml/match-faces",
+        json={"query_embedding": "f64:AAAA", "candidate_embeddings": []},
+    )
+    assert response.status_code == 422
+
+
+def test_detect_faces_raw_octet_stream():
+    image_bytes = base64.b64decode(create_dummy_image_b64())
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
+
+        response = client.post(
+            "/api/ml/detect-faces/raw",
+            content=image_bytes,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+    data = response.json()
+    assert data["success"] is True
+    assert data["count"] == 1
+    assert data["faces"][0]["location"]["right"] == 60
+
+
+def test_encode_face_raw_multipart():
+    image_bytes = base64.b64decode(create_dummy_image_b64())
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
+
+        response = client.post(
+            "/api/ml/encode-face/raw",
+            files={"file": ("face.jpg", image_bytes, "image/jpeg")},
+            params={"validate_single": "true"},
+        )
+    data = response.json()
+    assert data["success"] is True
+    assert len(data["embedding"]) == 96 * 96
+
+
+def test_encode_face_raw_empty_body():
+    response = client.post(
+        "/api/ml/encode-face/raw",
+        content=b"",
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    data = response.json()
+    assert data["success"] is False
+    assert data["error_code"] == "INVALID_IMAGE"
+
+
+def test_recognize_matches_in_one_call():
+    b64_img = create_dummy_image_b64()
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
+        detected = client.post(
+            "/api/ml/detect-faces", json={"image_base64": b64_img}
+        ).json()
+        embedding = detected["faces"][0]["embedding"]
+
+        response = client.post(
+            "/api/ml/recognize",
+            json={
+                "image_base64": b64_img,
+                "candidate_embeddings": [
+                    {"student_id": "student1", "embeddings": [embedding]}
+                ],
+            },
+        )
+    data = response.json()
+    assert data["success"] is True
+    assert data["count"] == 1
+    face = data["faces"][0]
+    assert face["student_id"] == "student1"
+    assert face["status"] == "present"
+    assert face["location"]["right"] == 60
+    assert face["embedding"] is None
+
+
+def test_recognize_raw_unknown_gallery():
+    image_bytes = base64.b64decode(create_dummy_image_b64())
+    response = client.post(
+        "/api/ml/recognize/raw",
+        params={"gallery_id": "missing"},
+        content=image_bytes,
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    data = response.json()
+    assert data["success"] is False
+    assert data["error_code"] == "GALLERY_NOT_FOUND"
+
+
+def test_match_faces_rejects_other_embedding_version():
+    payload = {
+        "query_embedding": [1.0, 0.0, 0.0],
+        "candidate_embeddings": [
+            {"student_id": "student1", "embeddings": [[1.0, 0.0, 0.0]]}
+        ],
+        "embedding_version": "pca256-v9",
+    }
+
+    data = client.post("/api/ml/match-faces", json=payload).json()
+
+    assert data["success"] is False
+    assert data["error_code"] == "EMBEDDING_VERSION_MISMATCH"
+
+
+def test_repeated_upload_is_served_from_result_cache():
+    b64_img = create_dummy_image_b64()
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
+
+        first = client.post("/api/ml/detect-faces", json={"image_base64": b64_img})
+        retry = client.post("/api/ml/detect-faces", json={"image_base64": b64_img})
+
+    assert mock_detect.call_count == 1
+    assert retry.json()["faces"] == first.json()["faces"]
+
+
+def test_idempotency_key_identifies_the_upload():
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
+
+        for _ in range(2):
+            response = client.post(
+                "/api/ml/encode-face",
+                json={"image_base64": create_dummy_image_b64()},
+                headers={"Idempotency-Key": "enrol-42"},
+            )
+            assert response.json()["success"] is True
+
+    assert mock_detect.call_count == 1
+
+
+def test_detect_faces_reports_stage_timings():
+    from prometheus_client import REGISTRY
+
+    labels = {"endpoint": "/api/ml/detect-faces", "stage": "detect"}
+    before = REGISTRY.get_sample_value("ml_stage_duration_seconds_count", labels) or 0
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50)], [0.9])
+        response = client.post(
+            "/api/ml/detect-faces", json={"image_base64": create_dummy_image_b64()}
+        )
+
+    stages = {
+        metric.split(";")[0] for metric in response.headers["Server-Timing"].split(", ")
+    }
+    assert {
+        "parse",
+        "base64_decode",
+        "image_decode",
+        "detect",
+        "crop",
+        "embed",
+        "serialize",
+        "total",
+    } <= stages
+    assert REGISTRY.get_sample_value("ml_stage_duration_seconds_count", labels) == (
+        before + 1
+    )
+
+
+def test_detection_confidence_and_errors_are_recorded():
+    from prometheus_client import REGISTRY
+
+    errors = {"error_type": "INVALID_IMAGE"}
+    before = REGISTRY.get_sample_value("ml_service_errors_total", errors) or 0
+    with patch.object(fr_module, "detect_faces_scored") as mock_detect:
+        mock_detect.return_value = ([(10, 10, 50, 50), (60, 10, 30, 30)], [0.9, 0.7])
+        client.post(
+            "/api/ml/detect-faces", json={"image_base64": create_dummy_image_b64()}
+        )
+    assert REGISTRY.get_sample_value("face_detection_confidence") == pytest.approx(
+        0.8
+    )
+
+    response = client.post("/api/ml/detect-faces", json={"image_base64": "x"})
+    assert response.json()["success"] is False
+    assert REGISTRY.get_sample_value("ml_service_errors_total", errors) == before + 1
+
+
+def _jpeg_bytes(width=160, height=120):
+    return base64.b64decode(create_dummy_image_b64(width, height))
+
+
+def test_stream_identifies_each_track_once():
+    import app.api.routes.stream as stream_module
+
+    client.put(
+        "/api/ml/galleries/stream-gallery",
+        json={
+            "candidate_embeddings": [
+                {"student_id": "student1", "embeddings": [[1.0, 0.0]]},
+                {"student_id": "student2", "embeddings": [[0.0, 1.0]]},
+            ]
+        },
+    )
+    embed = MagicMock()
+    embed.submit = AsyncMock(return_value=np.array([[0.9, 0.1]], dtype=np.float32))
+
+    with patch.object(
+        stream_module, "detect_faces", return_value=[(10, 10, 40, 40)]
+    ), patch.object(stream_module, "embedding_batcher", embed):
+        with client.websocket_connect(
+            "/api/ml/stream?gallery_id=stream-gallery"
+        ) as websocket:
+            events = []
+            for _ in range(4):
+                websocket.send_bytes(_jpeg_bytes())
+                while True:
+                    event = websocket.receive_json()
+                    events.append(event)
+                    if event["type"] == "frame":
+                        break
+
+    identified = [e for e in events if e["type"] == "identified"]
+    assert len(identified) == 1
+    assert identified[0]["student_id"] == "student1"
+    assert embed.submit.await_count == 1
+    assert events[-1]["tracks"][0]["student_id"] == "student1"
+
+    client.delete("/api/ml/galleries/stream-gallery")
+
+
+def test_stream_frames_are_admitted_like_image_requests():
+    from app.core.admission import AdmissionMiddleware
+
+    client.put(
+        "/api/ml/galleries/stream-gallery",
+        json={"candidate_embeddings": [{"student_id": "s1", "embeddings": [[1.0]]}]},
+    )
+    middleware = AdmissionMiddleware(app, capacity_mb=1, max_queue=0, max_wait_s=1)
+    controller = middleware.controllers["/api/ml/stream"]
+    gated = TestClient(middleware)
+    gated.headers = client.headers
+
+    with gated.websocket_connect("/api/ml/stream?gallery_id=stream-gallery") as ws:
+        # Another request holds the whole budget and nothing may queue
+        controller.in_flight, controller.running = controller.capacity, 1
+        ws.send_bytes(_jpeg_bytes())
+        event = ws.receive_json()
+        assert event["error_code"] == "SERVICE_OVERLOADED"
+        assert event["retry_after"] >= 1
+
+        controller.in_flight, controller.running = 0, 0
+        ws.send_bytes(_jpeg_bytes())
+        assert ws.receive_json()["type"] == "frame"
+    assert controller.in_flight == 0
+
+    client.delete("/api/ml/galleries/stream-gallery")
+
+
+def test_stream_rejects_unknown_gallery_and_missing_key():
+    with client.websocket_connect("/api/ml/stream?gallery_id=missing") as websocket:
+        event = websocket.receive_json()
+    assert event["error_code"] == "GALLERY_NOT_FOUND"
+
+    anonymous = TestClient(app)
+    with pytest.raises(WebSocketDisconnect):
+        with anonymous.websocket_connect("/api/ml/stream?gallery_id=missing"):
+            pass
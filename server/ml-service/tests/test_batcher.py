@@ -0,0 +1,88 @@
+import asyncio
+
+import numpy as np
+
+from app.ml.batcher import MicroBatcher, _embed_batch, _match_batch
+from app.ml.face_encoder import EMBEDDING_DIM, embed_crops
+from app.ml.face_matcher import GalleryMatrix
+
+
+def test_concurrent_submits_share_one_batch():
+    calls = []
+
+    def process(key, items):
+        calls.append((key, len(items)))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher("test", process, max_batch=8, max_wait_ms=20)
+
+    async def main():
+        return await asyncio.gather(
+            *(batcher.submit(np.array([i]), key="g") for i in range(3))
+        )
+
+    results = asyncio.run(main())
+    assert calls == [("g", 3)]
+    assert [r.tolist() for r in results] == [[0], [2], [4]]
+
+
+def test_full_batch_flushes_and_keys_are_separate():
+    calls = []
+
+    def process(key, items):
+        calls.append((key, len(items)))
+        return items
+
+    batcher = MicroBatcher("test", process, max_batch=2, max_wait_ms=1000)
+
+    async def main():
+        await asyncio.gather(
+            batcher.submit([1], key="a"),
+            batcher.submit([2], key="b"),
+            batcher.submit([3], key="a"),
+        )
+
+    asyncio.run(asyncio.wait_for(main(), timeout=5))
+    assert sorted(calls) == [("a", 2), ("b", 1)]
+
+
+def test_batch_errors_reach_every_caller():
+    def process(key, items):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher("test", process, max_batch=8, max_wait_ms=5)
+
+    async def main():
+        return await asyncio.gather(
+            batcher.submit([1]), batcher.submit([2]), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_embed_batch_matches_per_request_embedding():
+    rng = np.random.default_rng(0)
+    stacks = [rng.integers(0, 255, (n, 96, 96), dtype=np.uint8) for n in (1, 3, 2)]
+
+    results = _embed_batch(None, stacks)
+
+    assert [r.shape for r in results] == [(n, EMBEDDING_DIM) for n in (1, 3, 2)]
+    for stack, result in zip(stacks, results):
+        np.testing.assert_allclose(result, embed_crops(stack), rtol=1e-5)
+
+
+def test_match_batch_slices_results_per_request():
+    gallery = GalleryMatrix.from_candidates(
+        [("s1", [[1.0, 0.0]]), ("s2", [[0.0, 1.0]])]
+    )
+    queries = [
+        np.array([[1.0, 0.1]], dtype=np.float32),
+        np.array([[0.1, 1.0], [1.0, 0.0]], dtype=np.float32),
+    ]
+
+    results = _match_batch(gallery, queries)
+
+    assert [r.shape for r in results] == [(1, 2), (2, 2)]
+    assert gallery.assign_scores(results[0], 0.5).student_ids == ["s1"]
+    assert gallery.assign_scores(results[1], 0.5).student_ids == ["s2", "s1"]
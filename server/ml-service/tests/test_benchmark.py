@@ -0,0 +1,45 @@
+import numpy as np
+
+import benchmark
+
+
+def test_synthetic_classroom_is_seeded_and_boxes_fit():
+    first, boxes = benchmark.synthetic_classroom(640, 480, 10, np.random.default_rng(1))
+    again, _ = benchmark.synthetic_classroom(640, 480, 10, np.random.default_rng(1))
+
+    assert first == again
+    assert len(boxes) == 10
+    assert all(x >= 0 and y >= 0 and x + w <= 640 and y + h <= 480 for x, y, w, h in boxes)
+
+
+def test_quick_run_reports_every_stage_and_compares(monkeypatch):
+    monkeypatch.setitem(
+        benchmark.PRESETS,
+        "quick",
+        {
+            "resolutions": [(320, 240)],
+            "face_counts": [1, 3],
+            "gallery_sizes": [20],
+            "iterations": 3,
+        },
+    )
+    report = benchmark.run("quick")
+
+    measured = {(e["mode"], e["name"]) for e in report["results"] if "p95_ms" in e}
+    assert {
+        ("in-process", "decode"),
+        ("in-process", "crop"),
+        ("in-process", "embed"),
+        ("in-process", "match"),
+        ("asgi", "detect-faces"),
+        ("asgi", "match-faces"),
+        ("asgi", "batch-match"),
+    } <= measured
+    entry = report["results"][0]
+    assert entry["p50_ms"] <= entry["p95_ms"] <= entry["p99_ms"]
+    assert entry["peak_memory_mb"] >= 0
+
+    timed = [e for e in report["results"] if "p95_ms" in e]
+    slower = {"meta": report["meta"], "results": [dict(e, p95_ms=e["p95_ms"] * 2) for e in timed]}
+    assert benchmark.compare(report, report, threshold=0.2) == []
+    assert len(benchmark.compare(report, slower, threshold=0.2)) == len(timed)
@@ -1,5 +1,8 @@
+from unittest.mock import Mock, patch
+
 import numpy as np
-from app.ml.face_detector import detect_faces
+from app.ml import face_detector
+from app.ml.face_detector import detect_faces, non_max_suppression
 
 
 def test_detect_faces_empty_image():
@@ -20,3 +23,73 @@ def test_detect_faces_grayscale():
 
     faces = detect_faces(img)
     assert len(faces) == 0
+
+
+def test_detect_faces_returns_xywh_clipped_to_image():
+    def detection(x, y, w, h):
+        bbox = Mock(origin_x=x, origin_y=y, width=w, height=h)
+        return Mock(bounding_box=bbox, categories=[Mock(score=0.9)])
+
+    detector = Mock()
+    detector.detect.return_value = Mock(
+        detections=[detection(10, 20, 30, 40), detection(-5, 280, 50, 50)]
+    )
+    img = np.zeros((300, 300, 3), dtype=np.uint8)
+
+    with patch.object(face_detector, "get_detector", return_value=detector):
+        faces = detect_faces(img)
+
+    assert faces == [(10, 20, 30, 40), (0, 280, 45, 20)]
+
+
+def test_non_max_suppression_drops_overlaps_and_fragments():
+    boxes = np.array(
+        [
+            [100, 100, 50, 50, 0.9],  # face
+            [105, 102, 50, 50, 0.7],  # duplicate from an overlapping tile
+            [100, 100, 20, 50, 0.6],  # fragment cut at a tile edge
+            [300, 300, 40, 40, 0.8],  # another face
+        ],
+        dtype=np.float32,
+    )
+
+    assert non_max_suppression(boxes, 0.5).tolist() == [0, 3]
+
+
+def _bright_box_detector(patch):
+    """Stand-in detector: one 'face' around the bright pixels of a patch."""
+    ys, xs = np.nonzero(patch[..., 0] > 127)
+    if len(xs) == 0:
+        return np.zeros((0, 5), dtype=np.float32)
+    x, y = xs.min(), ys.min()
+    return np.array([[x, y, xs.max() - x + 1, ys.max() - y + 1, 0.9]], dtype=np.float32)
+
+
+def test_tiled_detection_remaps_and_merges_tile_boxes():
+    img = np.zeros((1200, 1600, 3), dtype=np.uint8)
+    img[700:740, 900:940] = 255  # small back-row face
+    seen = []
+
+    def fake_detect(patch):
+        seen.append(patch.shape[:2])
+        return _bright_box_detector(patch)
+
+    with patch.object(face_detector, "_detect_boxes", side_effect=fake_detect):
+        faces = detect_faces(img, model="tiled")
+
+    assert len(seen) > 1
+    assert max(max(shape) for shape in seen) <= face_detector.TILE_SIZE
+    assert len(faces) == 1
+    x, y, w, h = faces[0]
+    assert abs(x - 900) <= 2 and abs(y - 700) <= 2
+    assert abs(w - 40) <= 4 and abs(h - 40) <= 4
+
+
+def test_default_model_is_single_pass():
+    img = np.zeros((1200, 1600, 3), dtype=np.uint8)
+    with patch.object(
+        face_detector, "_detect_boxes", return_value=np.zeros((0, 5))
+    ) as mock_detect:
+        detect_faces(img)
+
+    assert mock_detect.call_count == 1
@@ -1,5 +1,13 @@
 import numpy as np
-from app.ml.face_encoder import get_face_embedding
+from app.ml.face_encoder import (
+    MAX_JITTERS,
+    crop_faces,
+    embed_crops,
+    embed_faces,
+    embed_jittered,
+    get_face_embedding,
+    jitter_crops,
+)
 
 
 def test_get_face_embedding_length():
@@ -28,3 +36,48 @@ def test_get_face_embedding_zeros():
     arr = np.array(emb)
     norm = np.linalg.norm(arr)
     assert abs(norm - 1.0) < 1e-5
+
+
+def test_embed_faces_matches_single_face_embedding():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    boxes = [(10, 20, 50, 60), (200, 100, 120, 120), (0, 0, 400, 300)]
+
+    embeddings = embed_faces(img, boxes)
+
+    assert embeddings.shape == (3, 96 * 96)
+    assert embeddings.dtype == np.float32
+    for (x, y, w, h), embedding in zip(boxes, embeddings):
+        single = get_face_embedding(img[y : y + h, x : x + w])
+        np.testing.assert_allclose(embedding, single, rtol=1e-5, atol=1e-7)
+
+
+def test_embed_faces_with_no_boxes():
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    assert embed_faces(img, []).shape == (0, 96 * 96)
+
+
+def test_jitter_crops_samples_every_crop_at_once():
+    rng = np.random.default_rng(1)
+    crops = rng.integers(0, 255, (3, 96, 96), dtype=np.uint8)
+
+    jittered = jitter_crops(crops, 4).reshape(3, 4, 96, 96)
+
+    np.testing.assert_array_equal(jittered[:, 0], crops)
+    np.testing.assert_array_equal(jittered[:, 1], crops[:, :, ::-1])
+    np.testing.assert_array_equal(jittered[:, 2, :, 2:], crops[:, :, :-2])
+    assert jitter_crops(crops, 100).shape == (3 * MAX_JITTERS, 96, 96)
+
+
+def test_jittered_embeddings_are_averaged_and_renormalised():
+    rng = np.random.default_rng(2)
+    img = rng.integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    crops = crop_faces(img, [(10, 20, 50, 60), (200, 100, 120, 120)])
+
+    embeddings = embed_jittered(crops, 5)
+    expected = embed_crops(jitter_crops(crops, 5)).reshape(2, 5, -1).mean(axis=1)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+
+    np.testing.assert_allclose(embeddings, expected, rtol=1e-5, atol=1e-7)
+    np.testing.assert_allclose(embed_jittered(crops, 1), embed_crops(crops))
+    assert np.array(get_face_embedding(img, num_jitters=5)).shape == (96 * 96,)
@@ -1,4 +1,7 @@
-from app.ml.face_matcher import cosine_similarity
+import numpy as np
+import pytest
+
+from app.ml.face_matcher import GalleryMatrix, assign_unique, cosine_similarity
 
 
 def test_cosine_similarity_identical():
@@ -23,3 +26,91 @@ def test_cosine_similarity_zeros():
     a = [0, 0, 0]
     b = [1, 2, 3]
     assert cosine_similarity(a, b) == 0.0
+
+
+def test_gallery_matrix_matches_pairwise_cosine():
+    rng = np.random.default_rng(0)
+    candidates = [
+        ("s1", rng.normal(size=(3, 64)).tolist()),
+        ("s2", rng.normal(size=(1, 64)).tolist()),
+        ("s3", rng.normal(size=(2, 64)).tolist()),
+    ]
+    queries = rng.normal(size=(4, 64)).tolist()
+
+    scores = GalleryMatrix.from_candidates(candidates).score(queries)
+
+    assert scores.shape == (4, 3)
+    for qi, query in enumerate(queries):
+        for si, (_, embeddings) in enumerate(candidates):
+            expected = max(cosine_similarity(query, emb) for emb in embeddings)
+            assert abs(scores[qi, si] - expected) < 1e-5
+
+
+def test_gallery_matrix_best_matches_skips_empty_students():
+    gallery = GalleryMatrix.from_candidates(
+        [("empty", []), ("s1", [[1.0, 0.0]]), ("s2", [[0.0, 1.0]])]
+    )
+    ids, scores = gallery.best_matches([[0.1, 0.9], [0.9, 0.1]])
+
+    assert gallery.student_ids == ["s1", "s2"]
+    assert ids == ["s2", "s1"]
+    assert np.all(scores > 0.9)
+
+
+def test_gallery_matrix_empty_gallery():
+    ids, scores = GalleryMatrix.from_candidates([]).best_matches([[1.0, 0.0]])
+    assert ids == [None]
+    assert scores[0] == -1.0
+
+
+def test_assign_unique_gives_each_student_to_one_face():
+    scores = np.array(
+        [
+            [0.90, 0.85, 0.10],  # best: s0, also close to s1
+            [0.95, 0.20, 0.10],  # best: s0
+            [0.30, 0.20, 0.40],  # below threshold everywhere
+        ]
+    )
+
+    assigned = assign_unique(scores, threshold=0.5)
+
+    # Independent argmax would give s0 twice; the unknown face takes nobody
+    assert assigned.tolist() == [1, 0, -1]
+
+
+def test_face_losing_its_student_is_unknown():
+    gallery = GalleryMatrix.from_candidates(
+        [("s1", [[1.0, 0.0]]), ("s2", [[0.0, 1.0]])]
+    )
+
+    ids, scores, runner_ups = gallery.assign(
+        [[0.9, 0.1], [1.0, 0.0]], 0.5, runner_ups=1
+    )
+
+    assert ids == [None, "s1"]
+    # Its real closest similarity, to s1, which belongs to the other face
+    assert scores[0] == pytest.approx(0.9 / np.hypot(0.9, 0.1)) and scores[1] > 0.99
+    assert runner_ups[0][0][0] == "s1"
+
+
+def test_gallery_matrix_assign_returns_runner_ups():
+    gallery = GalleryMatrix.from_candidates(
+        [
+            ("s1", [[1.0, 0.0, 0.0]]),
+            ("s2", [[0.8, 0.6, 0.0]]),
+            ("s3", [[0.0, 0.0, 1.0]]),
+        ]
+    )
+
+    ids, scores, runner_ups = gallery.assign(
+        [[1.0, 0.0, 0.0], [0.99, 0.1, 0.0], [0.0, 1.0, 0.0]], 0.5, runner_ups=2
+    )
+
+    assert ids == ["s1", "s2", None]
+    assert scores[1] < scores[0]
+    # Below the threshold, but the real similarity to the closest student
+    assert scores[2] == pytest.approx(0.6)
+    assert [sid for sid, _ in runner_ups[1]] == ["s1", "s3"]
+    # Unassigned faces still report their closest students
+    assert runner_ups[2][0][0] == "s2"
+    assert gallery.assign([], 0.5).student_ids == []
@@ -0,0 +1,104 @@
+import base64
+import io
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import app.api.routes.face_recognition as fr_module
+from app.core.config import settings
+from app.main import app
+from app.ml.face_quality import QualityThresholds, score_crops
+
+client = TestClient(app)
+client.headers = {"X-API-KEY": settings.API_KEY}
+
+THRESHOLDS = QualityThresholds(
+    min_sharpness=20.0,
+    min_brightness=40.0,
+    max_brightness=220.0,
+    min_size=24,
+    min_confidence=0.7,
+)
+
+
+def _texture(rng, offset=0):
+    pixels = rng.integers(60, 190, size=(96, 96)) + offset
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def test_each_check_flags_its_own_crops():
+    rng = np.random.default_rng(0)
+    sharp = _texture(rng)
+    crops = np.stack(
+        [
+            sharp,
+            cv2.GaussianBlur(sharp, (15, 15), 5),
+            _texture(rng, offset=-120),
+            _texture(rng, offset=120),
+            sharp,
+            sharp,
+        ]
+    )
+    boxes = [(0, 0, 80, 80)] * 4 + [(0, 0, 80, 16), (0, 0, 80, 80)]
+    confidences = [0.9] * 5 + [0.65]
+
+    quality = score_crops(crops, boxes, confidences, THRESHOLDS)
+
+    flagged = {
+        name: np.flatnonzero(mask).tolist() for name, mask in quality.failures.items()
+    }
+    assert flagged == {
+        "blurry": [1],
+        "dark": [2],
+        "overexposed": [3],
+        "small": [4],
+        "low_confidence": [5],
+    }
+    assert quality.acceptable.tolist() == [True] + [False] * 5
+    assert quality.size.tolist() == [80, 80, 80, 80, 16, 80]
+
+
+def _photo_b64():
+    pixels = np.random.default_rng(1).integers(0, 255, (100, 100, 3), dtype=np.uint8)
+    pixels[60:, 60:] = 128  # a flat, featureless patch
+    buffered = io.BytesIO()
+    Image.fromarray(pixels).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def test_low_quality_faces_are_skipped_or_flagged():
+    detections = ([(5, 5, 50, 50), (62, 62, 36, 36)], [0.95, 0.9])
+    payload = {"image_base64": _photo_b64(), "min_face_area_ratio": 0.01}
+
+    with patch.object(fr_module, "detect_faces_scored", return_value=detections):
+        data = client.post("/api/ml/detect-faces", json=payload).json()
+
+        assert data["count"] == 1
+        assert data["faces"][0]["quality"]["acceptable"] is True
+        assert data["faces"][0]["quality"]["confidence"] == pytest.approx(0.95)
+        [skipped] = data["low_quality_faces"]
+        assert skipped["location"]["left"] == 62
+        assert skipped["quality"]["issues"] == ["blurry"]
+
+        with patch.object(settings, "ML_FACE_QUALITY", "flag"):
+            payload["min_face_area_ratio"] = 0.02  # not a cached result
+            data = client.post("/api/ml/detect-faces", json=payload).json()
+
+        assert data["count"] == 2 and data["low_quality_faces"] == []
+        assert data["faces"][1]["quality"]["acceptable"] is False
+
+    with patch.object(
+        fr_module, "detect_faces_scored", return_value=([(62, 62, 36, 36)], [0.9])
+    ):
+        data = client.post(
+            "/api/ml/encode-face",
+            json={"image_base64": _photo_b64(), "min_face_area_ratio": 0.01},
+        ).json()
+
+    assert data["success"] is False
+    assert data["error_code"] == "FACE_LOW_QUALITY"
+    assert data["metadata"]["quality"]["issues"] == ["blurry"]
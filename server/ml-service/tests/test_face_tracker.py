@@ -0,0 +1,65 @@
+import numpy as np
+
+from app.ml.face_tracker import (
+    MAX_IDENTIFY_ATTEMPTS,
+    RETRY_INTERVAL_FRAMES,
+    FaceTracker,
+    iou_matrix,
+)
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5]], dtype=np.float32)
+
+    np.testing.assert_allclose(iou_matrix(a, b), [[1.0, 50 / 150, 0.0]])
+
+
+def test_moving_face_keeps_its_track():
+    tracker = FaceTracker()
+    first, _ = tracker.update([(100, 100, 50, 50), (300, 100, 50, 50)])
+    second, _ = tracker.update([(305, 102, 50, 50), (104, 101, 50, 50)])
+
+    assert [t.track_id for t in second] == [first[1].track_id, first[0].track_id]
+    assert all(t.hits == 2 for t in second)
+
+
+def test_unseen_track_is_lost_after_max_misses():
+    tracker = FaceTracker(max_misses=2)
+    tracker.update([(100, 100, 50, 50)])
+
+    lost = []
+    for _ in range(3):
+        _, lost = tracker.update([])
+
+    assert [t.track_id for t in lost] == [1]
+    assert tracker.tracks == []
+
+
+def test_track_is_identified_once():
+    tracker = FaceTracker(min_hits=2)
+    box = (100, 100, 50, 50)
+
+    visible, _ = tracker.update([box])
+    assert tracker.due_for_identification(visible) == []  # not confirmed yet
+
+    visible, _ = tracker.update([box])
+    assert tracker.due_for_identification(visible) == [0]
+    tracker.record_attempt(visible[0], "student1", 0.9)
+
+    for _ in range(20):
+        visible, _ = tracker.update([box])
+        assert tracker.due_for_identification(visible) == []
+
+
+def test_unidentified_track_is_retried_a_bounded_number_of_times():
+    tracker = FaceTracker(min_hits=1)
+    attempts = 0
+    for _ in range(RETRY_INTERVAL_FRAMES * (MAX_IDENTIFY_ATTEMPTS + 2)):
+        visible, _ = tracker.update([(100, 100, 50, 50)])
+        for i in tracker.due_for_identification(visible):
+            tracker.record_attempt(visible[i], None, 0.1)
+            attempts += 1
+
+    assert attempts == MAX_IDENTIFY_ATTEMPTS
+    assert visible[0].exhausted
@@ -0,0 +1,62 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils.image_utils import decode_image, to_original_box
+
+
+def _encode(array, fmt):
+    buf = io.BytesIO()
+    Image.fromarray(array).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def test_large_jpeg_is_decoded_reduced():
+    img = np.zeros((3000, 4000, 3), dtype=np.uint8)
+    img[:, :, 0] = 200  # red in RGB
+
+    decoded = decode_image(_encode(img, "JPEG"), max_dimension=1000)
+
+    assert decoded.original_size == (4000, 3000)
+    assert decoded.pixels.shape == (750, 1000, 3)
+    assert decoded.scale == 0.25
+    r, g, b = decoded.pixels[375, 500]
+    assert r > 150 and g < 50 and b < 50
+
+
+def test_reduction_never_goes_below_max_dimension():
+    img = np.zeros((1200, 1600, 3), dtype=np.uint8)
+
+    decoded = decode_image(_encode(img, "JPEG"), max_dimension=1000)
+
+    assert decoded.pixels.shape == (1200, 1600, 3)
+    assert decoded.scale == 1.0
+
+
+def test_zero_max_dimension_decodes_full_size():
+    img = np.zeros((3000, 4000, 3), dtype=np.uint8)
+
+    decoded = decode_image(_encode(img, "JPEG"), max_dimension=0)
+
+    assert decoded.pixels.shape == (3000, 4000, 3)
+
+
+def test_non_jpeg_and_grayscale_decode_to_rgb():
+    img = np.full((40, 60), 128, dtype=np.uint8)
+
+    for fmt in ("PNG", "GIF"):
+        decoded = decode_image(_encode(img, fmt))
+        assert decoded.pixels.shape == (40, 60, 3)
+        assert decoded.original_size == (60, 40)
+
+
+def test_invalid_image_raises():
+    with pytest.raises(Exception):
+        decode_image(b"not an image")
+
+
+def test_to_original_box_scales_back():
+    assert to_original_box((10, 20, 30, 40), 0.25) == (40, 80, 120, 160)
+    assert to_original_box((10, 20, 30, 40), 1.0) == (10, 20, 30, 40)
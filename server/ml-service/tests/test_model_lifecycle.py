@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.worker_pool import WorkerPool
+from app.main import app
+from app.ml import face_detector, model_lifecycle
+from app.ml.model_lifecycle import (
+    STATUS_FAILED,
+    STATUS_READY,
+    STATUS_STARTING,
+    ModelState,
+    warm_up,
+)
+
+
+@pytest.fixture
+def state(monkeypatch):
+    state = ModelState()
+    monkeypatch.setattr(model_lifecycle, "model_state", state)
+    return state
+
+
+@pytest.fixture
+def model_file(tmp_path, monkeypatch):
+    path = tmp_path / "blaze_face_short_range.tflite"
+    path.write_bytes(b"\0" * 16)
+    monkeypatch.setattr(face_detector, "model_path", str(path))
+    return path
+
+
+@pytest.mark.parametrize("mode", ["thread", "inline"])
+def test_warm_up_runs_the_pipeline_in_every_worker(
+    monkeypatch, state, model_file, mode
+):
+    pool = WorkerPool(mode=mode, workers=2)
+    monkeypatch.setattr(model_lifecycle, "worker_pool", pool)
+    threads = set()
+    warm_up_worker = model_lifecycle.warm_up_worker
+
+    def record_thread(*args):
+        threads.add(threading.get_ident())
+        return warm_up_worker(*args)
+
+    monkeypatch.setattr(model_lifecycle, "warm_up_worker", record_thread)
+
+    asyncio.run(warm_up())
+    pool.shutdown()
+
+    assert state.status == STATUS_READY
+    assert state.load_seconds > 0
+    assert len(threads) == (2 if mode == "thread" else 1)
+
+
+def test_warm_up_creates_a_detector_in_every_tile_thread(
+    monkeypatch, state, model_file
+):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "ML_DETECT_TILE_WORKERS", 3)
+    monkeypatch.setattr(face_detector, "_tile_executor", None)
+    monkeypatch.setattr(model_lifecycle, "_tile_workers_warm", False)
+    pool = WorkerPool(mode="thread", workers=2)
+    monkeypatch.setattr(model_lifecycle, "worker_pool", pool)
+    threads = set()
+    get_detector = face_detector.get_detector
+
+    def record_thread():
+        threads.add(threading.current_thread().name)
+        return get_detector()
+
+    monkeypatch.setattr(face_detector, "get_detector", record_thread)
+
+    asyncio.run(warm_up())
+    pool.shutdown()
+    face_detector._tile_executor.shutdown()
+
+    assert state.status == STATUS_READY
+    assert len({name for name in threads if name.startswith("ml-tile")}) == 3
+
+
+def test_missing_model_file_fails_readiness(monkeypatch, state, tmp_path):
+    monkeypatch.setattr(face_detector, "model_path", str(tmp_path / "missing"))
+
+    asyncio.run(warm_up())
+
+    assert state.status == STATUS_FAILED
+    assert "Model file not found" in state.error
+
+
+def test_ready_endpoint_gates_on_warm_up(monkeypatch):
+    import app.api.routes.health as health_module
+
+    state = ModelState()
+    monkeypatch.setattr(health_module, "model_state", state)
+    client = TestClient(app)
+
+    assert state.status == STATUS_STARTING
+    assert client.get("/ready").status_code == 503
+    assert client.get("/health").status_code == 200
+
+    state.status = STATUS_READY
+    state.load_seconds = 0.5
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["model_load_seconds"] == 0.5
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from app.ml import projection
+from app.ml.projection import (
+    RAW_EMBEDDING_DIM,
+    RAW_EMBEDDING_VERSION,
+    EmbeddingVersionError,
+    Projection,
+    conform_embeddings,
+    fit_pca,
+)
+
+
+def _raw_embeddings(n=300, rank=40, seed=0):
+    """Unit raw vectors that live near a ``rank``-dim subspace."""
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((rank, RAW_EMBEDDING_DIM)).astype(np.float32)
+    x = rng.standard_normal((n, rank)).astype(np.float32) @ basis
+    x += 0.01 * rng.standard_normal(x.shape).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def fitted():
+    return fit_pca(_raw_embeddings(), dims=64, version="pca64-test")
+
+
+@pytest.fixture
+def enabled(monkeypatch, fitted):
+    monkeypatch.setattr(projection, "_projection", fitted)
+    monkeypatch.setattr(projection, "_projection_loaded", True)
+    return fitted
+
+
+def test_fit_pca_outputs_unit_vectors_of_requested_dims(fitted):
+    projected = fitted.apply(_raw_embeddings(n=10, seed=1))
+
+    assert fitted.dims == 64
+    assert projected.shape == (10, 64)
+    np.testing.assert_allclose(np.linalg.norm(projected, axis=1), 1.0, rtol=1e-5)
+
+
+def test_projection_preserves_nearest_neighbours(fitted):
+    raw = _raw_embeddings()
+    projected = fitted.apply(raw)
+
+    raw_nn = np.argsort(-(raw[:20] @ raw.T), axis=1)[:, 1]
+    projected_nn = np.argsort(-(projected[:20] @ projected.T), axis=1)[:, 1]
+
+    assert (raw_nn == projected_nn).mean() >= 0.9
+
+
+def test_projection_save_load_roundtrip(tmp_path, fitted):
+    path = tmp_path / "projection.npz"
+    fitted.save(str(path))
+    loaded = Projection.load(str(path))
+
+    assert loaded.version == "pca64-test"
+    np.testing.assert_array_equal(loaded.components, fitted.components)
+
+
+def test_raw_embeddings_pass_through_without_projection():
+    embeddings = [[0.1] * 8]
+
+    assert projection.current_embedding_version() == RAW_EMBEDDING_VERSION
+    assert conform_embeddings(embeddings, None) is embeddings
+
+
+def test_raw_embeddings_are_projected_when_enabled(enabled):
+    raw = _raw_embeddings(n=3, seed=2)
+
+    by_version = conform_embeddings(raw.tolist(), RAW_EMBEDDING_VERSION)
+    by_width = conform_embeddings(raw.tolist(), None)
+
+    assert projection.current_embedding_dim() == 64
+    np.testing.assert_allclose(by_version, enabled.apply(raw), atol=1e-5)
+    np.testing.assert_allclose(by_width, by_version)
+
+
+def test_current_version_passes_through(enabled):
+    embeddings = [[0.1] * 64]
+    assert conform_embeddings(embeddings, "pca64-test") is embeddings
+
+
+def test_mismatched_version_is_rejected(enabled):
+    with pytest.raises(EmbeddingVersionError):
+        conform_embeddings([[0.1] * 64], "pca128-old")
+
+
+def test_fit_projection_reads_packed_mongo_embeddings():
+    import struct
+    from unittest.mock import MagicMock, patch
+
+    import fit_projection
+
+    raw = _raw_embeddings(n=3)
+    packed = [
+        struct.pack("<2sBBI", b"FE", 1, 1, RAW_EMBEDDING_DIM)
+        + row.astype("<f2").tobytes()
+        for row in raw[:2]
+    ]
+    students = [
+        {"face_embeddings": packed},
+        {"face_embeddings": [raw[2].tolist(), [0.5] * 256]},
+    ]
+    client = MagicMock()
+    client.__getitem__.return_value.students.find.return_value = students
+
+    with patch("pymongo.MongoClient", return_value=client):
+        rows = fit_projection.load_from_mongo("mongodb://test", "db", limit=0)
+
+    assert rows.shape == (3, RAW_EMBEDDING_DIM)
+    np.testing.assert_allclose(rows, raw, atol=1e-3)
+    query = client.__getitem__.return_value.students.find.call_args.args[0]
+    assert query["embedding_version"] == {"$in": [RAW_EMBEDDING_VERSION, None]}
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from app.ml.face_matcher import GalleryMatrix
+from app.ml.quantized_gallery import QuantizedGalleryStore, quantize_rows
+
+
+def _students(rng, count, dim=64):
+    return [(f"s{i}", rng.normal(size=(2, dim)).tolist()) for i in range(count)]
+
+
+@pytest.mark.parametrize("quantization", ["int8", "float16"])
+def test_quantized_matches_agree_with_float32(tmp_path, quantization):
+    rng = np.random.default_rng(0)
+    students = _students(rng, 40)
+    queries = [np.asarray(e[0]) + rng.normal(scale=0.3, size=64) for _, e in students]
+
+    store = QuantizedGalleryStore(str(tmp_path), quantization, rescore_k=4)
+    gallery = store.register("math", students)
+    assert isinstance(gallery.matrix.matrix, np.memmap)
+    assert gallery.num_students == 40 and gallery.num_embeddings == 80
+
+    quantized = gallery.matrix.score(queries)
+    exact = GalleryMatrix.from_candidates(students).score(queries)
+    assert np.abs(quantized - exact).max() < 0.02
+    # The top students are re-scored from float rows
+    best = exact.argmax(axis=1)
+    rows = np.arange(len(queries))
+    np.testing.assert_allclose(quantized[rows, best], exact[rows, best], atol=1e-3)
+    assert gallery.matrix.best_matches(queries)[0] == [sid for sid, _ in students]
+
+
+def test_int8_codes_take_a_quarter_of_float32():
+    rows = np.random.default_rng(1).normal(size=(3, 128)).astype(np.float32)
+    codes, scales = quantize_rows(rows, "int8")
+    assert codes.dtype == np.int8 and codes.nbytes * 4 == rows.nbytes
+    np.testing.assert_allclose(codes * scales[:, None], rows, atol=scales.max())
+
+
+@pytest.mark.parametrize("quantization, row_bytes", [("int8", 388), ("float16", 260)])
+def test_gallery_files_per_row(tmp_path, quantization, row_bytes):
+    rows = np.random.default_rng(2).normal(size=(10, 128)).tolist()
+    QuantizedGalleryStore(str(tmp_path), quantization).register("math", [("s1", rows)])
+
+    files = [p for p in tmp_path.iterdir() if p.suffix not in (".json", ".lock")]
+    # int8 keeps a float16 copy for re-scoring: 3/4 of float32, not 1/4
+    assert sum(p.stat().st_size for p in files) == 10 * row_bytes
+
+
+def test_appends_are_seen_by_other_workers_and_compacted(tmp_path):
+    worker_a = QuantizedGalleryStore(str(tmp_path), compact_ratio=0.5)
+    worker_b = QuantizedGalleryStore(str(tmp_path), compact_ratio=0.5)
+
+    worker_a.register("math", [("s1", [[1.0, 0.0]]), ("s2", [[0.0, 1.0]])])
+    segment = {p.name for p in tmp_path.iterdir() if p.suffix == ".codes"}
+    gallery = worker_b.add_embeddings("math", "s3", [[1.0, 1.0]])
+    assert gallery.version == 2 and gallery.num_students == 3
+    # Appended in place: same files, one more row
+    assert {p.name for p in tmp_path.iterdir() if p.suffix == ".codes"} == segment
+    assert worker_a.get("math").matrix.best_matches([[0.6, 0.8]])[0] == ["s3"]
+
+    # Replacing s1 leaves its old row dead until compaction
+    gallery = worker_a.add_embeddings("math", "s1", [[-1.0, 0.0]], replace=True)
+    assert gallery.matrix.matrix.shape[0] == 4 and gallery.num_embeddings == 3
+    assert worker_b.get("math").matrix.best_matches([[-1.0, 0.1]])[0] == ["s1"]
+
+    assert worker_b.remove_student("math", "missing").version == 3
+    gallery = worker_b.remove_student("math", "s2")
+    assert gallery.version == 4
+    assert gallery.matrix.matrix.shape[0] == 2
+    assert {p.name for p in tmp_path.iterdir() if p.suffix == ".codes"} != segment
+
+    with pytest.raises(ValueError):
+        worker_a.add_embeddings("math", "s4", [[1.0, 0.0, 0.0]])
+
+    assert worker_a.evict("math") and worker_b.get("math") is None
+    assert worker_a.add_embeddings("math", "s1", [[1.0, 0.0]]) is None
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".lock"]
+
+
+def test_galleries_survive_a_restart(tmp_path):
+    QuantizedGalleryStore(str(tmp_path)).register("math", [("s1", [[1.0, 0.0]])])
+
+    restarted = QuantizedGalleryStore(str(tmp_path))
+    assert len(restarted) == 1
+    assert restarted.get("math").matrix.best_matches([[0.9, 0.1]])[0] == ["s1"]
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from app.core.result_cache import ResultCache, image_key
+
+
+def test_image_key_prefers_idempotency_key():
+    assert image_key(b"abc") == image_key(b"abc")
+    assert image_key(b"abc") != image_key(b"abd")
+    assert image_key(b"abc", "req-1") == image_key(b"xyz", "req-1")
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = ResultCache(max_entries=2, ttl_seconds=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)  # "b" is now least recently used
+    cache.put("c", 3)
+
+    assert cache.get("b") == (False, None)
+    assert len(cache) == 2
+
+    monkeypatch.setattr("app.core.result_cache.time.monotonic", lambda: 1e12)
+    assert cache.get("a") == (False, None)
+
+
+def test_concurrent_duplicates_compute_once():
+    cache = ResultCache(max_entries=4, ttl_seconds=10)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        first = await asyncio.gather(
+            *(cache.get_or_compute("detect", "img", compute) for _ in range(3))
+        )
+        again = await cache.get_or_compute("detect", "img", compute)
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert first == ["result"] * 3 and again == "result"
+    assert len(calls) == 1
+
+
+def test_errors_and_rejected_results_are_not_cached():
+    cache = ResultCache(max_entries=4, ttl_seconds=10)
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def transient():
+        return "retry me"
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("detect", "img", fail)
+        await cache.get_or_compute(
+            "detect", "img", transient, cacheable=lambda result: False
+        )
+
+    asyncio.run(main())
+    assert len(cache) == 0
+
+
+def test_disabled_cache_always_computes():
+    cache = ResultCache(max_entries=0)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return 1
+
+    async def main():
+        for _ in range(2):
+            await cache.get_or_compute("encode", "img", compute)
+
+    asyncio.run(main())
+    assert len(calls) == 2
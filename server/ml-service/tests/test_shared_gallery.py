@@ -0,0 +1,54 @@
+import multiprocessing
+
+import numpy as np
+
+from app.ml.shared_gallery import SharedGalleryStore
+
+
+def _best_match(directory, query):
+    store = SharedGalleryStore(directory)
+    ids, _ = store.get("math").matrix.best_matches([query])
+    return ids[0]
+
+
+def test_workers_see_each_others_updates(tmp_path):
+    worker_a = SharedGalleryStore(str(tmp_path))
+    worker_b = SharedGalleryStore(str(tmp_path))
+
+    worker_a.register("math", [("s1", [[1.0, 0.0]]), ("s2", [[0.0, 1.0]])])
+    gallery = worker_b.get("math")
+    assert gallery.version == 1 and gallery.num_students == 2
+    # Mapped from the shared file, not copied into the worker
+    assert isinstance(gallery.matrix.matrix, np.memmap)
+    # Unchanged galleries are not remapped, so batching keys stay stable
+    assert worker_b.get("math").matrix is gallery.matrix
+
+    worker_b.add_embeddings("math", "s3", [[1.0, 1.0]])
+    assert worker_a.get("math").version == 2
+    assert worker_a.get("math").num_students == 3
+
+    assert worker_a.remove_student("math", "s1").version == 3
+    assert worker_b.remove_student("math", "missing").version == 3
+    ids, _ = worker_b.get("math").matrix.best_matches([[0.9, 0.1]])
+    assert ids == ["s3"]
+
+    assert len(worker_a) == 1
+    assert worker_b.evict("math")
+    assert worker_a.get("math") is None
+    assert not worker_a.evict("math")
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".lock"]
+
+
+def test_unknown_gallery_updates_return_none(tmp_path):
+    store = SharedGalleryStore(str(tmp_path))
+    assert store.add_embeddings("missing", "s1", [[1.0]]) is None
+    assert store.remove_student("missing", "s1") is None
+    assert len(store) == 0
+
+
+def test_gallery_is_visible_from_another_process(tmp_path):
+    SharedGalleryStore(str(tmp_path)).register(
+        "math", [("s1", [[1.0, 0.0]]), ("s2", [[0.0, 1.0]])]
+    )
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        assert pool.apply(_best_match, (str(tmp_path), [0.1, 0.9])) == "s2"
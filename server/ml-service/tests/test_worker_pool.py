@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+from app.core.metrics import ML_WORKER_BUSY, ML_WORKER_QUEUE_DEPTH
+from app.core.worker_pool import WorkerPool
+
+
+def _thread_name():
+    return threading.current_thread().name
+
+
+def test_thread_pool_runs_off_event_loop():
+    pool = WorkerPool(mode="thread", workers=2)
+    try:
+        name = asyncio.run(pool.run(_thread_name))
+    finally:
+        pool.shutdown()
+    assert name.startswith("ml-worker")
+
+
+def test_inline_pool_runs_on_caller():
+    pool = WorkerPool(mode="inline")
+    assert asyncio.run(pool.run(_thread_name)) == threading.current_thread().name
+
+
+def test_process_pool_runs_task():
+    pool = WorkerPool(mode="process", workers=1)
+    try:
+        assert asyncio.run(pool.run(pow, 2, 10)) == 1024
+    finally:
+        pool.shutdown()
+
+
+def test_pool_bounds_concurrency_and_resets_gauges():
+    pool = WorkerPool(mode="thread", workers=1)
+    active = []
+    peak = []
+
+    def task():
+        active.append(1)
+        peak.append(len(active))
+        threading.Event().wait(0.01)
+        active.pop()
+
+    async def main():
+        await asyncio.gather(*(pool.run(task) for _ in range(4)))
+
+    try:
+        asyncio.run(main())
+    finally:
+        pool.shutdown()
+
+    assert max(peak) == 1
+    assert ML_WORKER_BUSY._value.get() == 0
+    assert ML_WORKER_QUEUE_DEPTH._value.get() == 0